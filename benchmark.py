@@ -0,0 +1,226 @@
+import sys, time, json, random, resource, argparse
+from multiprocessing import Pool
+from classes import Variable, FuncCall, Assignment
+from mcdc_gen import MCDCgenerator
+from engines import ENGINES
+from tactics import TACTICS, CONFIGURATIONS
+from int_types import INT_ENCODINGS
+
+"""
+Benchmarks MCDCgenerator on synthetic decisions. Every case is generated
+from a seed, so the same case always gives the same decision, and solved
+in its own worker process so the growth of its peak RSS in kilobytes is
+that of the case alone.
+Results are compared against a JSON baseline and the run fails when a
+case got slower than the threshold allows. Cases run with another
+integer encoding than 'int' are named <case>@<encoding>, and cases run with
+a pair pool of N workers <case>/pairs<N>, so the encodings and the pair
+pool can be compared side by side with the serial search.
+"""
+
+BASELINE_FILE = 'benchmark_baseline.json'
+DEFAULT_THRESHOLD = 0.25
+# Wall time differences below this many seconds are noise
+MIN_TIME = 0.05
+
+CASE_DEFAULTS = {'conditions':8, 'depth':2, 'andRatio':0.5, 'numericRatio':0.0,
+                 'numericTypes':['int', 'real'], 'funcCalls':0, 'assignments':0, 'cubes':0, 'seed':0}
+
+CASES = [
+    dict(CASE_DEFAULTS, name='bool-flat-8', depth=1),
+    dict(CASE_DEFAULTS, name='bool-nested-16', conditions=16, depth=3),
+    dict(CASE_DEFAULTS, name='bool-and-heavy-12', conditions=12, andRatio=0.9),
+    dict(CASE_DEFAULTS, name='mixed-10', conditions=10, numericRatio=0.5),
+    dict(CASE_DEFAULTS, name='numeric-8', numericRatio=1.0),
+    dict(CASE_DEFAULTS, name='numeric-deep-12', conditions=12, depth=4, numericRatio=1.0),
+    dict(CASE_DEFAULTS, name='calls-8', numericRatio=0.75, funcCalls=2, assignments=2),
+    dict(CASE_DEFAULTS, name='int-12', conditions=12, depth=3, numericRatio=1.0, numericTypes=['int']),
+    dict(CASE_DEFAULTS, name='int-calls-10', conditions=10, numericRatio=1.0, numericTypes=['int'],
+         funcCalls=3, assignments=3),
+    dict(CASE_DEFAULTS, name='cubes-8', depth=1, andRatio=0.0, numericRatio=1.0, numericTypes=['int'], cubes=8),
+]
+
+COMPARISONS = ['<', '<=', '>', '>=', '==', '!=']
+
+def splitLeaves(leaves, parts):
+    size = (len(leaves) + parts - 1) // parts
+    return [leaves[i:i+size] for i in range(0, len(leaves), size)]
+
+# Joins leaves into a tree of And/Or nodes which is depth levels deep
+def buildTree(rng, leaves, depth, andRatio):
+    op = 'And' if rng.random() < andRatio else 'Or'
+    if depth <= 1 or len(leaves) <= 2:
+        children = leaves
+    else:
+        branching = max(2, int(round(len(leaves) ** (1.0 / depth))))
+        children = [buildTree(rng, group, depth-1, andRatio) for group in splitLeaves(leaves, branching)]
+    if len(children) == 1:
+        return children[0]
+    return "{}({})".format(op, ", ".join(children))
+
+"""
+Generates a decision from a case. Returns the variables, the expression
+and the funcCalls. Condition i is either the Boolean variable c<i> or a
+relational atom over the variable c<i> of one of the numeric types. Numeric atoms are
+rewritten to go through funcCalls and assignments of their variable,
+one each, as long as there are numeric atoms left. The first cubes numeric
+atoms compare the cube of their term, which makes their pair queries
+expensive.
+"""
+def generateDecision(case):
+    rng = random.Random(case['seed'])
+    n = case['conditions']
+    numeric = int(round(n * case['numericRatio']))
+    if case['funcCalls'] + case['assignments'] > numeric:
+        raise ValueError("{}: more funcCalls and assignments than numeric atoms".format(case['name']))
+    if case['cubes'] > numeric:
+        raise ValueError("{}: more cubes than numeric atoms".format(case['name']))
+
+    variables = []
+    funcCalls = []
+    leaves = []
+    indirect = ['call'] * case['funcCalls'] + ['assign'] * case['assignments']
+    for i in range(n):
+        name = 'c{}'.format(i)
+        if i >= numeric:
+            variables.append(Variable('bool', name))
+            leaves.append("v['{}']".format(name))
+            continue
+
+        varType = rng.choice(case['numericTypes'])
+        variables.append(Variable(varType, name))
+        bound = rng.randint(-10, 10)
+        ref = "v['{}']".format(name)
+        if i < len(indirect) and indirect[i] == 'call':
+            callName = 'f{}'.format(i)
+            funcCalls.append(FuncCall(varType, callName, [ref + " + 1", ref + " * 2"]))
+            ref = "v['{}']".format(callName)
+        elif i < len(indirect):
+            assignName = 'a{}'.format(i)
+            variables.append(Assignment(varType, assignName, ref + " - 3"))
+            ref = "v['{}']".format(assignName)
+        if i < case['cubes']:
+            ref = "{0} * {0} * {0}".format(ref)
+        leaves.append("{} {} {}".format(ref, rng.choice(COMPARISONS), bound))
+
+    rng.shuffle(leaves)
+    return variables, buildTree(rng, leaves, case['depth'], case['andRatio']), funcCalls
+
+# Runs one case in a worker process. A forked worker starts out with the
+# peak RSS of the parent, so the growth over it is reported.
+def _runCase(job):
+    case, options = job
+    startRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    variables, expression, funcCalls = generateDecision(case)
+    start = time.time()
+    generator = MCDCgenerator(variables, [expression], funcCalls, {}, **options)
+    vectors = generator.findVectors()
+    elapsed = time.time() - start
+    return {'time':elapsed, 'checks':generator.stats.totals()['checks'], 'vectors':len(vectors),
+            'rssGrowth':resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - startRSS}
+
+"""Runs a case repeat times and keeps the fastest wall time"""
+def runCase(case, options, repeat=1):
+    res = None
+    for i in range(repeat):
+        pool = Pool(1, maxtasksperchild=1)
+        try:
+            run = pool.apply(_runCase, [(case, options)])
+        finally:
+            pool.close()
+            pool.join()
+        if res is None:
+            res = run
+        else:
+            res['time'] = min(res['time'], run['time'])
+            res['rssGrowth'] = max(res['rssGrowth'], run['rssGrowth'])
+    res['case'] = {k:v for k, v in case.items() if k != 'name'}
+    res['case']['options'] = options
+    return res
+
+"""
+Compares results against a baseline. Returns a message for every case
+whose wall time or check() count grew by more than threshold.
+"""
+def compare(results, baseline, threshold, minTime=MIN_TIME):
+    regressions = []
+    for name, res in sorted(results.items()):
+        old = baseline.get(name)
+        if old is None or old['case'] != res['case']:
+            continue
+        if res['time'] > old['time'] * (1 + threshold) and res['time'] - old['time'] > minTime:
+            regressions.append("{}: {:.3f}s, baseline {:.3f}s".format(name, res['time'], old['time']))
+        if res['checks'] > old['checks'] * (1 + threshold):
+            regressions.append("{}: {} checks, baseline {}".format(name, res['checks'], old['checks']))
+    return regressions
+
+def printResults(results, baseline):
+    print("{:<20} {:>9} {:>9} {:>8} {:>10} {:>9}".format('case', 'time(s)', 'baseline', 'checks', 'rssGrowth', 'vectors'))
+    for name, res in sorted(results.items()):
+        old = baseline.get(name)
+        print("{:<20} {:>9.3f} {:>9} {:>8} {:>10} {:>9}".format(
+            name, res['time'], '-' if old is None else "{:.3f}".format(old['time']),
+            res['checks'], res['rssGrowth'], res['vectors']))
+
+def loadBaseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except IOError:
+        return None
+
+def saveResults(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark MCDCgenerator on synthetic decisions.')
+    parser.add_argument('--baseline', default=BASELINE_FILE,
+                    help='JSON file with the baseline results, written when it does not exist (default: %(default)s)')
+    parser.add_argument('--update', action='store_true',
+                    help='overwrite the baseline with the results of this run')
+    parser.add_argument('--output', default=None,
+                    help='also write the results of this run to OUTPUT')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                    help='fail when a case is slower or makes more check() calls than the baseline by this fraction (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                    help='run every case REPEAT times and keep the fastest time (default: %(default)s)')
+    parser.add_argument('--case', nargs='+', default=None,
+                    help='only run the cases with these names')
+    parser.add_argument('--engine', choices=ENGINES, default='pushpop',
+                    help='solving engine to benchmark (default: %(default)s)')
+    parser.add_argument('--no-truth-table', dest='truthTable', action='store_false',
+                    help='solve Boolean decisions with the engine instead of their truth table')
+    parser.add_argument('--tactic', choices=TACTICS + sorted(CONFIGURATIONS), default='default',
+                    help='solver configuration to benchmark (default: %(default)s)')
+    parser.add_argument('--int-encoding', dest='intEncodings', nargs='+', choices=INT_ENCODINGS, default=['int'],
+                    help='run every case with each of these encodings of int variables (default: int)')
+    parser.add_argument('--pair-workers', dest='pairWorkers', nargs='+', type=int, default=[1],
+                    help='run every case with pair pools of each of these sizes, 1 searches serially (default: 1)')
+    args = parser.parse_args()
+
+    cases = [c for c in CASES if args.case is None or c['name'] in args.case]
+    results = {}
+    for encoding in args.intEncodings:
+        for workers in args.pairWorkers:
+            options = {'_engine':args.engine, '_truthTable':args.truthTable, '_tactic':args.tactic,
+                       '_intEncoding':encoding, '_pairWorkers':workers}
+            for case in cases:
+                name = case['name'] if encoding == 'int' else '{}@{}'.format(case['name'], encoding)
+                if workers > 1:
+                    name = '{}/pairs{}'.format(name, workers)
+                results[name] = runCase(case, options, args.repeat)
+
+    baseline = loadBaseline(args.baseline)
+    printResults(results, baseline or {})
+    if args.output is not None:
+        saveResults(args.output, results)
+    if baseline is None or args.update:
+        saveResults(args.baseline, dict(baseline or {}, **results))
+        print("wrote baseline {}".format(args.baseline))
+        sys.exit(0)
+
+    regressions = compare(results, baseline, args.threshold)
+    for r in regressions:
+        print("REGRESSION " + r)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,34 @@
+from utils import collectConstants
+
+"""
+Indexes funcCall and assignment constraints by the variable they define,
+given as (name, constraint) pairs, so the cone of influence of an
+expression is found in one pass over the constraints it reaches.
+"""
+class ConstraintIndex:
+    def __init__(self, definitions):
+        self.constraints = [c for _, c in definitions]
+        self.names = [collectConstants(c) for c in self.constraints]
+        self.defined = {}
+        for i, (name, _) in enumerate(definitions):
+            self.defined.setdefault(name, []).append(i)
+
+    """
+    Returns the constraints defining the variables of expr and, in turn,
+    the variables those constraints use, in their original order, and the
+    names of all variables involved
+    """
+    def dependentConstraints(self, expr):
+        names = collectConstants(expr)
+        todo = list(names)
+        reached = set()
+        while todo:
+            for i in self.defined.get(todo.pop(), []):
+                if i in reached:
+                    continue
+                reached.add(i)
+                for name in self.names[i]:
+                    if name not in names:
+                        names.add(name)
+                        todo.append(name)
+        return [self.constraints[i] for i in sorted(reached)], names
@@ -0,0 +1,236 @@
+import os, sys, json, socket, signal, logging, argparse, threading, Queue
+import SocketServer
+from multiprocessing import Process, Pipe
+
+"""
+Solver daemon. Keeps worker processes which have imported Z3 and solved a
+warm-up decision, and serves jobs over a Unix domain socket so a client
+does not pay for starting Python and Z3 on every call.
+
+A job is one line of JSON, {"args": [...], "stats": false}, where args
+are the command line arguments of solverz3. The reply is one line of JSON
+per test case, as solverz3 --ndjson writes them, followed by
+{"done": true, "count": ..., "stats": ...} or {"error": ...}. The client
+is solverz3 --connect SOCKET, which does not import Z3 itself.
+
+At most workers jobs are solved at a time. Up to queue more wait for a
+worker, further jobs are refused with an error so the client can back
+off. A worker is replaced after maxJobs jobs, since the Z3 context and
+the parsed expressions it keeps grow with every job.
+"""
+
+SOCKET_FILE = '/tmp/solverz3.sock'
+DEFAULT_QUEUE = 64
+DEFAULT_MAX_JOBS = 100
+
+# Yields the reply lines of a job
+def runJob(job):
+    from solverz3 import createParser, createOptions, parseInputs, results
+    from mcdc_gen import MCDCgenerator
+    try:
+        args = createParser().parse_args([str(a) for a in job['args']])
+    except SystemExit:
+        raise ValueError("invalid arguments {}".format(job['args']))
+    variables, funcCalls, dataTypes = parseInputs(args.var, args.const, args.assign, args.funcCallDef,
+                                                  args.funcCallExpr, args.typeDecl)
+    generator = MCDCgenerator(variables, args.expr, funcCalls, dataTypes, args.parallel, **createOptions(args))
+    count = 0
+    for res in results(generator):
+        count += 1
+        yield res
+    done = {'done':True, 'count':count}
+    if job.get('stats'):
+        done['stats'] = generator.stats.toDict()
+    yield done
+
+# Runs in a worker process: solves the jobs received on conn and sends
+# back every reply line, then None
+def _work(conn, maxJobs):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.getLogger().setLevel(logging.WARNING)
+    # Imports Z3 and creates its context before the first job
+    for _ in runJob({'args':['--var', 'int,x', 'bool,b', '-e', "And(v['x'] > 0, v['b'])"]}):
+        pass
+    conn.send('ready')
+    for i in range(maxJobs):
+        job = conn.recv()
+        if job is None:
+            return
+        try:
+            for res in runJob(job):
+                conn.send(res)
+        except Exception as e:
+            conn.send({'error':"{}: {}".format(type(e).__name__, e)})
+        conn.send(None)
+
+class Worker:
+    def __init__(self, maxJobs):
+        self.conn, child = Pipe()
+        self.process = Process(target=_work, args=(child, maxJobs))
+        self.process.start()
+        self.conn.recv()
+        self.jobs = maxJobs
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+
+class WorkerPool:
+    def __init__(self, workers, maxJobs):
+        self.maxJobs = maxJobs
+        self.idle = Queue.Queue()
+        self.workers = []
+        for i in range(workers):
+            self.idle.put(self.start())
+
+    def start(self):
+        worker = Worker(self.maxJobs)
+        self.workers.append(worker)
+        return worker
+
+    # Waits for an idle worker
+    def acquire(self):
+        return self.idle.get()
+
+    # Returns a worker, replacing it once it has done its jobs or when it
+    # was left in the middle of a job
+    def release(self, worker, broken=False):
+        worker.jobs -= 1
+        if broken or worker.jobs <= 0:
+            worker.stop()
+            self.workers.remove(worker)
+            worker = self.start()
+        self.idle.put(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+
+class JobHandler(SocketServer.StreamRequestHandler):
+    def reply(self, res):
+        self.wfile.write(json.dumps(res, separators=(',', ':')) + '\n')
+        self.wfile.flush()
+
+    def handle(self):
+        try:
+            job = json.loads(self.rfile.readline())
+        except ValueError as e:
+            self.reply({'error':"invalid job: {}".format(e)})
+            return
+        if not self.server.pending.acquire(False):
+            self.reply({'error':'queue full'})
+            return
+        try:
+            worker = self.server.pool.acquire()
+            broken = True
+            try:
+                worker.conn.send(job)
+                while True:
+                    res = worker.conn.recv()
+                    if res is None:
+                        break
+                    self.reply(res)
+                broken = False
+            finally:
+                self.server.pool.release(worker, broken)
+        finally:
+            self.server.pending.release()
+
+class SolverServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, workers, queue=DEFAULT_QUEUE, maxJobs=DEFAULT_MAX_JOBS):
+        if os.path.exists(path):
+            os.remove(path)
+        SocketServer.UnixStreamServer.__init__(self, path, JobHandler)
+        self.path = path
+        self.pool = WorkerPool(workers, maxJobs)
+        # Jobs being solved or waiting for a worker
+        self.pending = threading.BoundedSemaphore(workers + queue)
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        self.pool.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+"""Sends job to the daemon listening on path and yields its reply lines"""
+def request(path, job):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.connect(path)
+    f = s.makefile('rw')
+    try:
+        f.write(json.dumps(job) + '\n')
+        f.flush()
+        for line in f:
+            yield json.loads(line)
+    finally:
+        f.close()
+        s.close()
+
+# Writes data as JSON to path, or as a line to stdout for '-'
+def writeJSON(data, path):
+    if path == '-':
+        print json.dumps(data, separators=(',', ':'), sort_keys=True)
+    else:
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+
+"""
+Runs solverz3 --connect SOCKET with the other arguments argv: sends them
+to the daemon and writes its reply as solverz3 would. The coverage is
+part of the stats of the job, which are asked for with either option.
+Returns the exit status.
+"""
+def client(argv):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--connect')
+    parser.add_argument('--ndjson', action='store_true')
+    parser.add_argument('--stats', nargs='?', const='-', default=None)
+    parser.add_argument('--coverage', nargs='?', const='-', default=None)
+    own, args = parser.parse_known_args(argv)
+    vectors = []
+    stats = None
+    job = {'args':args, 'stats':own.stats is not None or own.coverage is not None}
+    for res in request(own.connect, job):
+        if 'error' in res:
+            sys.stderr.write("ERROR: {}\n".format(res['error']))
+            return 1
+        if 'done' in res:
+            stats = res.get('stats')
+        elif own.ndjson:
+            sys.stdout.write(json.dumps(res, separators=(',', ':')) + '\n')
+            sys.stdout.flush()
+        else:
+            vectors.append(res['vector'])
+    if not own.ndjson:
+        print json.dumps(vectors, separators=(',', ':'))
+    if own.stats is not None:
+        writeJSON(stats, own.stats)
+    if own.coverage is not None:
+        writeJSON(stats['coverage'], own.coverage)
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve solverz3 jobs from warm worker processes.')
+    parser.add_argument('--socket', default=SOCKET_FILE,
+                    help='Unix domain socket to listen on (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', dest='workers', type=int, default=2,
+                    help='number of worker processes, which is the number of jobs solved at a time (default: %(default)s)')
+    parser.add_argument('--queue', type=int, default=DEFAULT_QUEUE,
+                    help='number of jobs which may wait for a worker before jobs are refused (default: %(default)s)')
+    parser.add_argument('--max-jobs', dest='maxJobs', type=int, default=DEFAULT_MAX_JOBS,
+                    help='replace a worker process after it solved MAXJOBS jobs (default: %(default)s)')
+    args = parser.parse_args()
+
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+    server = SolverServer(args.socket, max(1, args.workers), max(0, args.queue), max(1, args.maxJobs))
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logging.info("listening on {} with {} workers".format(args.socket, args.workers))
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
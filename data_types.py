@@ -0,0 +1,123 @@
+import re
+from classes import Variable
+
+"""
+Structs declared with --typeDecl and fixed-size arrays are not modelled
+with the Datatype and Array theories of Z3. Every variable of such a type
+is flattened into a scalar variable for each of its fields, named the way
+C accesses the field: p.x for the member x of the struct p, a[2] for the
+element 2 of the array a and p.pts[0].x for the member x of the element 0
+of the array member pts. Decisions only read fields by constant indices,
+so they stay in the theories of the scalars.
+
+An array type is written as the type of its elements followed by the
+size, int[4] or Point[2], and int[2][3] is 2 arrays of 3 ints as in C.
+
+The shape of every flattened variable maps the vectors back: a struct
+becomes a dict of its members, an array a list of its elements with None
+for the elements a vector leaves open.
+"""
+
+ARRAY_TYPE = re.compile(r'^(.*?)\[(\d+)\]((?:\[\d+\])*)$')
+
+"""Returns the element type and size of an array type, or None for other types"""
+def arrayType(typeName):
+    m = ARRAY_TYPE.match(typeName.strip())
+    if m is None:
+        return None
+    return m.group(1).strip() + m.group(3), int(m.group(2))
+
+def isComposite(typeName, dataTypes):
+    return typeName in dataTypes or arrayType(typeName) is not None
+
+"""
+Returns the shape of typeName: None for a scalar, a dict of the shape of
+every member for a struct and a list of the shapes of the elements for an
+array. Raises TypeError for a struct which contains itself.
+"""
+def shapeOf(typeName, dataTypes, seen=()):
+    array = arrayType(typeName)
+    if array is not None:
+        element, size = array
+        return [shapeOf(element, dataTypes, seen) for i in range(size)]
+    if typeName not in dataTypes:
+        return None
+    if typeName in seen:
+        raise TypeError("recursive type {}".format(typeName))
+    return {m.name:shapeOf(m.typeName, dataTypes, seen + (typeName,)) for m in dataTypes[typeName].members}
+
+"""Returns the type of every scalar field of a variable name of typeName"""
+def scalarFields(name, typeName, dataTypes):
+    array = arrayType(typeName)
+    if array is not None:
+        element, size = array
+        return [f for i in range(size) for f in scalarFields("{}[{}]".format(name, i), element, dataTypes)]
+    if typeName in dataTypes:
+        return [f for m in dataTypes[typeName].members
+                for f in scalarFields("{}.{}".format(name, m.name), m.typeName, dataTypes)]
+    return [(name, typeName)]
+
+"""
+Replaces the variables of struct and array types by their scalar fields.
+Returns the variables and the shape of every replaced variable by name.
+Constants and assignments stay as they are.
+"""
+def scalarize(variables, dataTypes):
+    res = []
+    shapes = {}
+    for var in variables:
+        if var.isConst() or var.isAssignment() or not isComposite(var.varType, dataTypes):
+            res.append(var)
+            continue
+        shapes[var.name] = shapeOf(var.varType, dataTypes)
+        res += [Variable(t, n) for n, t in scalarFields(var.name, var.varType, dataTypes)]
+    return res, shapes
+
+def _nest(name, shape, values):
+    if shape is None:
+        return values.get(name)
+    if isinstance(shape, list):
+        res = [_nest("{}[{}]".format(name, i), s, values) for i, s in enumerate(shape)]
+        return res if any(x is not None for x in res) else None
+    res = {}
+    for m, s in shape.items():
+        value = _nest("{}.{}".format(name, m), s, values)
+        if value is not None:
+            res[m] = value
+    return res or None
+
+def _fieldNames(name, shape):
+    if shape is None:
+        return [name]
+    if isinstance(shape, list):
+        return [f for i, s in enumerate(shape) for f in _fieldNames("{}[{}]".format(name, i), s)]
+    return [f for m, s in shape.items() for f in _fieldNames("{}.{}".format(name, m), s)]
+
+"""Takes a vector over scalar fields and nests the fields of every variable in shapes"""
+def nestValues(values, shapes):
+    if not shapes:
+        return values
+    fields = set(f for name, shape in shapes.items() for f in _fieldNames(name, shape))
+    res = {k:v for k, v in values.items() if k not in fields}
+    for name, shape in shapes.items():
+        value = _nest(name, shape, values)
+        if value is not None:
+            res[name] = value
+    return res
+
+def _flatten(name, value, res):
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _flatten("{}.{}".format(name, k), v, res)
+    elif isinstance(value, list):
+        for i, v in enumerate(value):
+            _flatten("{}[{}]".format(name, i), v, res)
+    elif value is not None:
+        res[name] = value
+
+"""Takes a vector nestValues has nested and returns it over scalar fields"""
+def flattenValues(values):
+    res = {}
+    for k, v in values.items():
+        _flatten(k, v, res)
+    return res
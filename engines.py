@@ -0,0 +1,156 @@
+from z3 import *
+from flip_eval import UNDECIDED
+
+"""
+Solving engines used by MCDCgenerator.findSolutions. An engine owns the
+solver state while a decision is searched: it produces candidate models,
+answers the independence pair queries and blocks accepted solutions.
+Only the funcCall and assignment constraints a decision depends on are
+asserted while it is searched. Engines which flip answer part of the pair
+queries by evaluation, checkPair only asks the solver the queries which
+known leaves UNDECIDED.
+"""
+
+ENGINES = ['pushpop', 'assume', 'tree', 'pair']
+
+"""
+Asserts every query in its own push/pop scope. Blocking clauses get a
+scope each and are popped again once the decision is done. With a pair
+pool the assertions are serialized for the workers once per decision,
+and every blocking clause once when it is added.
+"""
+class PushPopEngine:
+    flips = True
+
+    def __init__(self, generator, solver):
+        self.generator = generator
+        self.solver = solver
+        self.decisions = 0
+
+    def begin(self, expr):
+        self.expr = expr
+        self.blocked = 0
+        # Tells the pair workers the decision their jobs belong to
+        self.decisions += 1
+        self.base = None
+        self.blockedText = []
+        self.solver.push()
+        self.solver.add(self.generator.dependencies(expr))
+        self.solver.push()
+        self.solver.add(expr)
+        self.generator.logger.info(self.solver)
+
+    def firstModel(self):
+        res = self.check()
+        # Pop first context so we have no constraints
+        self.solver.pop()
+        if self.generator.pairPool is not None:
+            assertions = list(self.solver.assertions())
+            self.declarations = self.generator.declarationsToString(assertions + [self.expr])
+            self.base = "".join(self.generator.constraintToString(a) for a in assertions)
+        return res
+
+    def nextModel(self):
+        return self.check()
+
+    def check(self):
+        if self.solver.check()==sat:
+            return self.generator.modelToDict(self.solver)
+        return None
+
+    # Returns the pair results of all keys at once, with the sides known
+    # decides taken from it, or None if they should be checked one by one
+    # with checkPair
+    def checkPairs(self, keys, assigns, known):
+        if self.generator.pairPool is None:
+            return None
+        return self.generator.checkPairsParallel(self.solver, self.decisions, self.declarations, self.base,
+                                                 self.blockedText, keys, assigns, self.expr, known)
+
+    def checkPair(self, key, assigns, known=(UNDECIDED, UNDECIDED)):
+        pairConstraint = self.generator.createPairConstraint(key, assigns, self.expr)
+        return [self.generator.checkConstraint(self.solver, c) if k is UNDECIDED else k
+                for c, k in zip(pairConstraint, known)]
+
+    def block(self, assigns):
+        self.blocked += 1
+        self.solver.push()
+        constraint = self.generator.blockAssigns(assigns)
+        if self.base is not None:
+            self.blockedText.append(self.generator.constraintToString(constraint))
+
+    def end(self):
+        self.generator.logger.info("will pop %s times", self.blocked)
+        for i in range(self.blocked):
+            self.solver.pop()
+        self.solver.pop()
+        self.solver.add(Not(self.expr))
+
+"""
+Asserts the base constraints once and expresses every query as a set of
+assumptions over tracked literals, so the solver keeps what it learned
+between queries. Each literal implies one constraint and is created the
+first time the constraint is used. Blocking clauses are guarded by a
+literal which is only assumed while its decision is searched, and so
+are the funcCall and assignment constraints of the decision.
+"""
+class AssumptionEngine:
+    # The models of the solver follow its last pair queries, with fewer
+    # queries it keeps returning models which prove nothing
+    flips = False
+
+    def __init__(self, generator, solver):
+        self.generator = generator
+        self.solver = solver
+        self.literals = {}
+
+    # Returns the tracked literal implying constraint
+    def literal(self, constraint):
+        key = constraint.get_id()
+        if key not in self.literals:
+            lit = FreshBool('track', constraint.ctx)
+            self.solver.add(Implies(lit, constraint))
+            # The constraint is kept alive so its id is not reused
+            self.literals[key] = (lit, constraint)
+        return self.literals[key][0]
+
+    def begin(self, expr):
+        self.expr = expr
+        self.active = FreshBool('decision', expr.ctx)
+        for c in self.generator.dependencies(expr):
+            self.solver.add(Implies(self.active, c))
+
+    def firstModel(self):
+        return self.check([self.literal(self.expr)])
+
+    def nextModel(self):
+        return self.check([])
+
+    def check(self, assumptions):
+        if self.solver.check(self.active, *assumptions)==sat:
+            return self.generator.modelToDict(self.solver)
+        return None
+
+    def checkPairs(self, keys, assigns, known):
+        return None
+
+    def checkPair(self, key, assigns):
+        v = self.generator.variables
+        same = [self.literal(v[k] == assigns[k]) for k in assigns.keys() if k != key]
+        if key in assigns:
+            changed = self.literal(v[key] == assigns[key])
+            flipped = self.literal(Not(v[key] == assigns[key]))
+            same1, same2 = same + [changed], same + [flipped]
+        else:
+            same1, same2 = same, same
+        return [self.check(same1 + [self.literal(self.expr)]),
+                self.check(same2 + [self.literal(Not(self.expr))])]
+
+    def block(self, assigns):
+        v = self.generator.variables
+        constraint = [v[k] == assigns[k] for k in assigns.keys()]
+        self.solver.add(Or(Not(self.active), Not(And(constraint))))
+
+    # Retires the blocking clauses of the decision
+    def end(self):
+        self.solver.add(Not(self.active))
@@ -1,4 +1,5 @@
 from z3 import *
+import utils
 
 CONNECTIVE_OPS = [Z3_OP_NOT,Z3_OP_AND,Z3_OP_OR,Z3_OP_IMPLIES,Z3_OP_IFF,Z3_OP_ITE]
 REL_OPS = [Z3_OP_EQ,Z3_OP_LE,Z3_OP_LT,Z3_OP_GE,Z3_OP_GT]
@@ -17,7 +18,7 @@ def createVar(var):
   raise NotImplementedError(varType)
 
 def createExpression(v, expr):
-  return eval(expr)
+  return utils.createExpression(v, expr)
 
 # creates a constraint which allow only key variable to change
 def createCounterConstraint(key, variables, model):
@@ -45,36 +46,39 @@ def block_model(s):
   m = s.model()
   s.add(Or([ f() != m[f] for f in m.decls() if f.arity() == 0]))  
 
-def isOperand(self):
-  node = self.value
-  t = node.kind()
-  return is_bool(node) and (is_var(node) or (is_app(node) and t not in OPERATORS))
-
-def isOperator(self):
-  return not self.isOperand()
-
 class Node: 
   def __init__(self, value): 
     self.value = value 
     self.left = None
     self.right = None
+    self.children = []
 
   def __str__(self):
     if self.value.decl() is not None:
       return str(self.value.decl())
     return str(self.value)
 
+  # Operands are the conditions of a decision: Boolean atoms which are not connectives
+  def isOperand(self):
+    node = self.value
+    if not is_bool(node) or not is_app(node):
+      return False
+    t = node.decl().kind()
+    if t in [Z3_OP_EQ, Z3_OP_DISTINCT]:
+      return not is_bool(node.arg(0))
+    return t not in CONNECTIVE_OPS + [Z3_OP_XOR, Z3_OP_TRUE, Z3_OP_FALSE]
+
+  def isOperator(self):
+    return not self.isOperand()
+
   def insert(self, node):    
-    if self.left is None:
-      self.left = Node(node)
-      for child in self.left.value.children():
-        self.left.insert(child)
-    elif self.right is None:
-      self.right = Node(node)
-      for child in self.right.value.children():
-        self.right.insert(child)
-    else:
-      self.left.insert(node)
+    child = Node(node)
+    if child.isOperator():
+      for c in node.children():
+        child.insert(c)
+    self.children.append(child)
+    self.left = self.children[0]
+    self.right = self.children[-1] if len(self.children) > 1 else None
 
   def printTree(self, level=0, indent=0):
     if level==0:
@@ -87,8 +91,8 @@ class Node:
       #line = "{}|{}".format(space,  str(self))
       indent += len(str(self))
       
-    if self.right:
-      self.right.printTree(level+1, indent)
+    for child in reversed(self.children[1:]):
+      child.printTree(level+1, indent)
     print line
     if self.left:
       self.left.printTree(level+1, indent)
@@ -96,17 +100,15 @@ class Node:
 # Returns root of constructed tree
 def constructTree(variables, expr): 
     root = Node(expr)
-    print "constructing tree from ", expr
-
-    for child in expr.children():
-      root.insert(child)
 
-    s = Solver()
-    
+    if root.isOperator():
+      for child in expr.children():
+        root.insert(child)
 
     return root
 
-variables = {x[1]:createVar(x) for x in [['bool','A'], ['bool','B'], ['bool','C']]}
-expr = createExpression(variables, "And(Or(v['A'],v['B']), v['C'])")
-r = constructTree(variables, expr)
-r.printTree()
+if __name__ == "__main__":
+  variables = {x[1]:createVar(x) for x in [['bool','A'], ['bool','B'], ['bool','C']]}
+  expr = createExpression(variables, "And(Or(v['A'],v['B']), v['C'])")
+  r = constructTree(variables, expr)
+  r.printTree()
@@ -0,0 +1,331 @@
+import re, operator
+from z3 import *
+import z3math
+from int_types import binary, isBitVec, promote, assign, arithmetic, isIntOperation, isUnsignedCommon
+
+"""
+Parser for the expression language used on the command line: z3py style
+expressions over v['name'] such as "And(v['x']==3, v['y']>v['x'])" with
+the z3math functions, and plain C style boolean expressions such as
+"x == 3 && (y > x || !b)". Fields of structs and arrays are read as in
+C, p.x or a[2], or as v['p']['x'] and v['a'][2], and name the scalar
+variables data_types flattens them into.
+
+Strings are parsed once into syntax nodes which are interned, so equal
+subterms of different expressions are the same node. Nodes are turned
+into z3 terms by an ExpressionBuilder, which remembers the term of every
+node it has built for its variables. The nodes and terms belong to the
+builder, a generator keeps one for its run. Numbers stay Python numbers and
+operators are applied with the Python operators, so the terms are the
+same as the ones eval would build. Operators on bit-vectors follow C, as
+int_types describes.
+"""
+
+class ParseError(ValueError):
+    pass
+
+TOKENS = re.compile(r'''
+    \s*(?:
+      (?P<num>\d+\.\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?|\d+(?:[eE][-+]?\d+)?)
+    | (?P<str>'[^']*'|"[^"]*")
+    | (?P<name>[A-Za-z_][A-Za-z_0-9]*)
+    | (?P<op>\*\*|==|!=|<=|>=|&&|\|\||[-+*/%<>!?:(),\[\].])
+    )''', re.VERBOSE)
+
+FUNCTIONS = {
+    'And': And, 'Or': Or, 'Not': Not, 'Implies': Implies, 'If': If, 'Xor': Xor,
+    'Distinct': Distinct, 'Sum': Sum, 'Product': Product,
+    'sin': z3math.sin, 'cos': z3math.cos, 'tan': z3math.tan, 'abs': z3math.abs,
+    'fabs': z3math.fabs, 'exp': z3math.exp, 'pow': z3math.pow, 'sqrt': z3math.sqrt,
+    'min': z3math.min, 'max': z3math.max,
+}
+# Functions which are told whether their bit-vector arguments are unsigned
+INT_FUNCTIONS = ['abs', 'min', 'max']
+CONSTANTS = {'M_PI': z3math.M_PI, 'True': True, 'False': False, 'true': True, 'false': False}
+
+# Division means what it means to eval in the running Python version
+BINARY = {'+': operator.add, '-': operator.sub, '*': operator.mul,
+          '/': getattr(operator, 'div', operator.truediv),
+          '%': operator.mod, '**': operator.pow, '==': operator.eq, '!=': operator.ne,
+          '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+COMPARISONS = ['==', '!=', '<', '<=', '>', '>=']
+
+"""
+Interned syntax nodes of the expressions parsed into it. A node is an int
+indexing nodes, which holds tuples (kind, value, children). Equal tuples
+always get the same node. Every ExpressionBuilder has a table of its own,
+so the nodes go away with it.
+"""
+class SyntaxTable:
+    def __init__(self):
+        self.nodes = []
+        self.interned = {}
+        self.parsed = {}
+
+    def node(self, kind, value, children=()):
+        key = (kind, value, tuple(children))
+        res = self.interned.get(key)
+        if res is None:
+            res = len(self.nodes)
+            self.nodes.append(key)
+            self.interned[key] = res
+        return res
+
+    """Parses text into an interned syntax node, memoized per string"""
+    def parse(self, text):
+        res = self.parsed.get(text)
+        if res is None:
+            res = Parser(text, self).parse()
+            self.parsed[text] = res
+        return res
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = TOKENS.match(text, pos)
+        if m is None or m.end() == pos:
+            raise ParseError("unexpected character at {} in {}".format(pos, text))
+        kind = m.lastgroup
+        tokens.append((kind, m.group(kind)))
+        pos = m.end()
+    tokens.append(('end', None))
+    return tokens
+
+class Parser:
+    def __init__(self, text, table):
+        self.text = text
+        self.table = table
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos]
+
+    def accept(self, *values):
+        kind, value = self.tokens[self.pos]
+        if kind in ['op', 'name'] and value in values:
+            self.pos += 1
+            return value
+        return None
+
+    def expect(self, value):
+        if self.accept(value) is None:
+            raise ParseError("expected '{}' at token {} in {}".format(value, self.pos, self.text))
+
+    def parse(self):
+        res = self.ternary()
+        if self.peek()[0] != 'end':
+            raise ParseError("unexpected '{}' in {}".format(self.peek()[1], self.text))
+        return res
+
+    def ternary(self):
+        cond = self.disjunction()
+        if self.accept('?'):
+            a = self.ternary()
+            self.expect(':')
+            b = self.ternary()
+            return self.table.node('call', 'If', [cond, a, b])
+        return cond
+
+    def disjunction(self):
+        args = [self.conjunction()]
+        while self.accept('||', 'or'):
+            args.append(self.conjunction())
+        return args[0] if len(args) == 1 else self.table.node('call', 'Or', args)
+
+    def conjunction(self):
+        args = [self.negation()]
+        while self.accept('&&', 'and'):
+            args.append(self.negation())
+        return args[0] if len(args) == 1 else self.table.node('call', 'And', args)
+
+    # not binds looser than comparisons, as in Python, and ! as tightly as
+    # the other unary operators, as in C
+    def negation(self):
+        if self.accept('not'):
+            return self.table.node('call', 'Not', [self.negation()])
+        return self.comparison()
+
+    # Chained comparisons mean the same as in Python: a < b < c is a < b and b < c
+    def comparison(self):
+        left = self.additive()
+        res = []
+        while True:
+            op = self.accept(*COMPARISONS)
+            if op is None:
+                break
+            right = self.additive()
+            res.append(self.table.node('binary', op, [left, right]))
+            left = right
+        if not res:
+            return left
+        return res[0] if len(res) == 1 else self.table.node('call', 'And', res)
+
+    def additive(self):
+        res = self.term()
+        while True:
+            op = self.accept('+', '-')
+            if op is None:
+                return res
+            res = self.table.node('binary', op, [res, self.term()])
+
+    def term(self):
+        res = self.unary()
+        while True:
+            op = self.accept('*', '/', '%')
+            if op is None:
+                return res
+            res = self.table.node('binary', op, [res, self.unary()])
+
+    def unary(self):
+        if self.accept('!'):
+            return self.table.node('call', 'Not', [self.unary()])
+        op = self.accept('-', '+')
+        if op is not None:
+            return self.table.node('unary', op, [self.unary()])
+        return self.power()
+
+    def power(self):
+        res = self.primary()
+        if self.accept('**'):
+            return self.table.node('binary', '**', [res, self.unary()])
+        return res
+
+    def arguments(self, close):
+        args = []
+        if self.accept(close):
+            return args
+        while True:
+            args.append(self.ternary())
+            if self.accept(close):
+                return args
+            self.expect(',')
+
+    # Returns the name of the field of the variable name that the members
+    # and constant indices which follow select
+    def fields(self, name):
+        while True:
+            if self.accept('.'):
+                kind, member = self.peek()
+                if kind != 'name':
+                    raise ParseError("expected a member name after {}. in {}".format(name, self.text))
+                self.pos += 1
+                name = "{}.{}".format(name, member)
+            elif self.accept('['):
+                kind, index = self.peek()
+                if kind == 'str':
+                    index = index[1:-1]
+                    name = "{}.{}".format(name, index)
+                elif kind == 'num' and index.isdigit():
+                    name = "{}[{}]".format(name, int(index))
+                else:
+                    raise ParseError("expected a constant index after {}[ in {}".format(name, self.text))
+                self.pos += 1
+                self.expect(']')
+            else:
+                return name
+
+    def primary(self):
+        kind, value = self.peek()
+        self.pos += 1
+        if kind == 'num':
+            if any(c in value for c in '.eE'):
+                return self.table.node('float', float(value))
+            return self.table.node('int', int(value))
+        if kind == 'op' and value == '(':
+            res = self.ternary()
+            self.expect(')')
+            return res
+        if kind == 'op' and value == '[':
+            return self.table.node('list', None, self.arguments(']'))
+        if kind == 'name':
+            if value == 'v' and self.accept('['):
+                kind, name = self.peek()
+                if kind != 'str':
+                    raise ParseError("expected a variable name after v[ in {}".format(self.text))
+                self.pos += 1
+                self.expect(']')
+                return self.table.node('var', self.fields(name[1:-1]))
+            if self.accept('('):
+                if value not in FUNCTIONS:
+                    raise ParseError("unknown function {} in {}".format(value, self.text))
+                return self.table.node('call', value, self.arguments(')'))
+            if value in CONSTANTS:
+                return self.table.node('const', value)
+            return self.table.node('var', self.fields(value))
+        raise ParseError("unexpected '{}' in {}".format(value, self.text))
+
+"""
+Builds z3 terms from syntax nodes over the variables in v. The math
+functions are those of math, a z3math.MathModel, when one is given.
+unsigned holds the names of the unsigned bit-vector variables. Whether a
+term is unsigned is kept by node, as equal terms may differ in it. It is
+the type C gives the operator or function, see int_types. Constants are
+created in the Z3 context ctx of the variables.
+"""
+class ExpressionBuilder:
+    def __init__(self, v, math=None, unsigned=(), ctx=None):
+        self.v = v
+        self.ctx = ctx
+        self.math = math
+        self.functions = FUNCTIONS if math is None else dict(FUNCTIONS, **math.functions())
+        self.unsignedVars = frozenset(unsigned)
+        self.syntax = SyntaxTable()
+        self.terms = {}
+        self.unsigned = {}
+
+    def build(self, n):
+        if n in self.terms:
+            return self.terms[n]
+        kind, value, children = self.syntax.nodes[n]
+        args = [self.build(c) for c in children]
+        flags = tuple(self.unsigned[c] for c in children)
+        unsigned = False
+        if kind in ['int', 'float']:
+            res = value
+        elif kind == 'const':
+            res = CONSTANTS[value]
+            if is_expr(res) and self.ctx is not None:
+                res = res.translate(self.ctx)
+        elif kind == 'var':
+            if value not in self.v:
+                raise ParseError("unknown variable {}".format(value))
+            res = self.v[value]
+            unsigned = value in self.unsignedVars
+        elif kind == 'list':
+            res = args
+        elif kind == 'unary':
+            res = args[0]
+            if isBitVec(res):
+                res, unsigned = promote(res, flags[0])
+            res = -res if value == '-' else res
+        elif kind == 'binary':
+            res = binary(value, args[0], args[1], BINARY[value], flags)
+            if isIntOperation(args[0], args[1]):
+                unsigned = isUnsignedCommon(args[0], args[1], flags)
+        elif value in INT_FUNCTIONS:
+            res = self.functions[value](*args, unsigned=flags)
+            if value == 'abs' and isBitVec(args[0]):
+                unsigned = promote(args[0], flags[0])[1]
+            elif value != 'abs' and isIntOperation(*args):
+                unsigned = isUnsignedCommon(args[0], args[1], flags)
+        elif value == 'If' and len(args) == 3 and isIntOperation(args[1], args[2]):
+            # Both branches of a conditional get their common type
+            a, b, unsigned = arithmetic(args[1], args[2], flags[1:])
+            res = self.functions[value](args[0], a, b)
+        else:
+            res = self.functions[value](*args)
+        self.terms[n] = res
+        self.unsigned[n] = unsigned and isBitVec(res)
+        return res
+
+    # Builds text, converted to the type of the bit-vector target when it is
+    # the value assigned to target
+    def createExpression(self, text, target=None):
+        n = self.syntax.parse(text)
+        res = self.build(n)
+        if target is not None:
+            res = assign(target, res, self.unsigned[n])
+        return res
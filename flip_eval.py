@@ -0,0 +1,223 @@
+from z3 import *
+from fractions import Fraction
+from utils import collectConstants
+from solution_store import nativeValue, z3Value
+
+"""
+Answers the independence pair queries of a candidate vector by evaluation
+where the solver is not needed. The first query of a condition asks for
+the vector itself with the decision true, which evaluating the decision
+under the vector answers. The second asks for a vector with another value
+for the condition and the decision false: Booleans are flipped, numbers
+are moved to the boundaries of the numerals of their sort in the decision
+and next to their own value. A query is left to the solver when the
+decision does not evaluate to a constant or no flipped value falsifies it.
+
+Vectors are dicts of the plain Python values of nativeValue, so no Z3
+values are created while flipping. Decisions over Booleans, integers and
+reals are compiled to Python functions over three valued logic, where None
+is the value of an expression which depends on a variable the vector
+leaves open. Any other decision is evaluated with substitute and simplify.
+"""
+
+# Marks a pair query evaluation could not answer
+UNDECIDED = 'undecided'
+
+# Flipped values tried for a number, at most
+MAX_FLIPS = 8
+
+INT_STEPS = [-1, 0, 1]
+REAL_STEPS = [Fraction(-1), Fraction(-1, 2), Fraction(0), Fraction(1, 2), Fraction(1)]
+
+def _and(*args):
+    if False in args:
+        return False
+    return None if None in args else True
+
+def _or(*args):
+    if True in args:
+        return True
+    return None if None in args else False
+
+def _not(a):
+    return None if a is None else not a
+
+def _implies(a, b):
+    return _or(_not(a), b)
+
+def _ite(c, a, b):
+    if c is None:
+        return a if a is not None and a == b else None
+    return a if c else b
+
+# Applies f unless an argument is open or f is undefined for the arguments
+def _strict(f):
+    def apply(*args):
+        if None in args:
+            return None
+        try:
+            return f(*args)
+        except ZeroDivisionError:
+            # Z3 leaves division by zero unspecified
+            return None
+    return apply
+
+# Integer division and modulo of Z3, which keep the remainder positive
+def _idiv(a, b):
+    return (a - a % abs(b)) // b
+
+def _distinct(*args):
+    return len(set(args)) == len(args)
+
+def _toInt(a):
+    return a.numerator // a.denominator if isinstance(a, Fraction) else a
+
+OPS = {
+    Z3_OP_AND: _and,
+    Z3_OP_OR: _or,
+    Z3_OP_NOT: _not,
+    Z3_OP_IMPLIES: _implies,
+    Z3_OP_ITE: _ite,
+    Z3_OP_EQ: _strict(lambda a, b: a == b),
+    Z3_OP_IFF: _strict(lambda a, b: a == b),
+    Z3_OP_XOR: _strict(lambda a, b: a != b),
+    Z3_OP_DISTINCT: _strict(_distinct),
+    Z3_OP_LT: _strict(lambda a, b: a < b),
+    Z3_OP_LE: _strict(lambda a, b: a <= b),
+    Z3_OP_GT: _strict(lambda a, b: a > b),
+    Z3_OP_GE: _strict(lambda a, b: a >= b),
+    Z3_OP_ADD: _strict(lambda *args: sum(args)),
+    Z3_OP_SUB: _strict(lambda a, *args: a - sum(args)),
+    Z3_OP_MUL: _strict(lambda *args: reduce(lambda x, y: x * y, args)),
+    Z3_OP_UMINUS: _strict(lambda a: -a),
+    Z3_OP_DIV: _strict(lambda a, b: Fraction(a) / b),
+    Z3_OP_IDIV: _strict(_idiv),
+    Z3_OP_MOD: _strict(lambda a, b: a % abs(b)),
+    Z3_OP_TO_REAL: _strict(Fraction),
+    Z3_OP_TO_INT: _strict(_toInt),
+}
+
+"""
+Compiles expr to a function of a dict with the Python value of every
+assigned variable. Raises NotImplementedError for expressions outside
+Booleans, integers and reals.
+"""
+def compileExpr(expr):
+    cache = {}
+    def build(e):
+        key = e.get_id()
+        if key not in cache:
+            cache[key] = compileTerm(e)
+        return cache[key]
+
+    def compileTerm(e):
+        if is_true(e) or is_false(e):
+            value = is_true(e)
+            return lambda values: value
+        if is_int_value(e) or is_rational_value(e):
+            value = nativeValue(e)
+            return lambda values: value
+        if not (is_bool(e) or is_int(e) or is_real(e)) or not is_app(e):
+            raise NotImplementedError(e)
+        if is_const(e) and e.decl().kind() == Z3_OP_UNINTERPRETED:
+            name = e.decl().name()
+            return lambda values: values.get(name)
+        kind = e.decl().kind()
+        if kind not in OPS:
+            raise NotImplementedError(e)
+        op = OPS[kind]
+        args = [build(c) for c in e.children()]
+        return lambda values: op(*[a(values) for a in args])
+
+    return build(expr)
+
+"""
+Evaluates a decision under a vector of plain values: True, False, or None
+when the outcome depends on a variable the vector leaves open
+"""
+class Evaluator:
+    def __init__(self, variables, expr):
+        self.variables = variables
+        self.expr = expr
+        self.names = collectConstants(expr)
+        try:
+            self.compiled = compileExpr(expr)
+        except NotImplementedError:
+            self.compiled = None
+        self.numerals = {}
+        self.collectNumerals()
+
+    def __call__(self, values):
+        if self.compiled is not None:
+            return self.compiled(values)
+        value = simplify(substitute(self.expr, [(self.variables[k], z3Value(self.variables[k], v))
+                                                for k, v in values.items() if k in self.names]))
+        if is_true(value):
+            return True
+        if is_false(value):
+            return False
+        return None
+
+    # Groups the numerals of the decision by their sort
+    def collectNumerals(self):
+        seen = set()
+        todo = [self.expr]
+        while todo:
+            e = todo.pop()
+            if e.get_id() in seen:
+                continue
+            seen.add(e.get_id())
+            if is_int_value(e) or is_rational_value(e) or is_bv_value(e):
+                self.numerals.setdefault(e.sort().sexpr(), []).append(nativeValue(e))
+            elif is_app(e):
+                todo.extend(e.children())
+
+    """
+    Returns the values to try for var instead of value: the other Boolean,
+    or the numbers around the numerals of the decision and around value,
+    the nearest first
+    """
+    def flippedValues(self, var, value):
+        if is_bool(var):
+            return [not value]
+        numerals = self.numerals.get(var.sort().sexpr(), [])
+        if is_bv(var):
+            size = 2 ** var.size()
+            candidates = set((c + step) % size for c in numerals + [value] for step in INT_STEPS)
+            candidates.discard(value)
+            distance = lambda v: min((v - value) % size, (value - v) % size)
+            return sorted(candidates, key=lambda v: (distance(v), v))[:MAX_FLIPS]
+        if not (is_int(var) or is_real(var)) or is_expr(value):
+            return []
+        steps = REAL_STEPS if is_real(var) else INT_STEPS
+        candidates = set(c + step for c in numerals + [value] for step in steps)
+        candidates.discard(value)
+        return sorted(candidates, key=lambda v: (abs(v - value), v))[:MAX_FLIPS]
+
+"""
+Answers the two pair queries of key for the vector values as
+createPairConstraint states them, or UNDECIDED. Variables the vector
+leaves open stay open, so only vectors whose outcome they do not affect
+are evaluated. Vectors for which rejected returns True are not handed
+out, the solver is asked instead.
+"""
+def flipPair(evaluate, key, values, rejected):
+    outcome = evaluate(values)
+    if outcome is None:
+        return [UNDECIDED, UNDECIDED]
+    res = [None, UNDECIDED]
+    if outcome:
+        res[0] = dict(values) if not rejected(values) else UNDECIDED
+    # The outcome does not depend on a variable the vector leaves open
+    if key not in values:
+        res[1] = None if outcome else dict(values) if not rejected(values) else UNDECIDED
+        return res
+    for value in evaluate.flippedValues(evaluate.variables[key], values[key]):
+        sol = dict(values)
+        sol[key] = value
+        if evaluate(sol) is False and not rejected(sol):
+            res[1] = sol
+            break
+    if res[1] is UNDECIDED and outcome and key not in evaluate.names:
+        res[1] = None
+    return res
@@ -0,0 +1,142 @@
+from z3 import *
+
+"""
+Fixed width integer types of C, encoded as bit-vectors. Variables of the
+types below become BitVec variables, and 'int' becomes one of them when a
+run selects it as its integer encoding. Bit-vectors do not know whether
+they are signed and equal terms are shared, an unsigned 5 is the same term
+as a signed one. So the callers say which operands are unsigned: an
+ExpressionBuilder knows the unsigned variables and tracks which of the
+terms it builds are unsigned. Operators on bit-vectors follow C: operands
+narrower than int are promoted to int, then both are converted to their
+common type by the usual arithmetic conversions, which decides whether the
+operator is unsigned. Integer literals are int, long long or unsigned long
+long, whichever first holds them. Division truncates.
+"""
+
+# Width and signedness of every type
+INT_TYPES = {
+    'int8': (8, True), 'int16': (16, True), 'int32': (32, True), 'int64': (64, True),
+    'uint8': (8, False), 'uint16': (16, False), 'uint32': (32, False), 'uint64': (64, False),
+}
+
+INT_ENCODINGS = ['int'] + sorted(INT_TYPES)
+
+def isIntType(t):
+    return t in INT_TYPES
+
+def isUnsignedType(t):
+    return isIntType(t) and not INT_TYPES[t][1]
+
+def isBitVec(e):
+    return is_expr(e) and is_bv(e)
+
+def createBitVecSort(t, ctx=None):
+    return BitVecSort(INT_TYPES[t][0], ctx)
+
+def createBitVec(t, name, ctx=None):
+    return BitVec(name, INT_TYPES[t][0], ctx)
+
+def createBitVecVal(t, val, ctx=None):
+    return BitVecVal(val, INT_TYPES[t][0], ctx)
+
+"""Converts a bit-vector value to a Python int, signed unless it is unsigned"""
+def bitVecToPython(val, unsigned=False):
+    if unsigned:
+        return val.as_long()
+    return val.as_signed_long()
+
+def extend(e, size, unsigned=False):
+    n = size - e.size()
+    if n == 0:
+        return e
+    return ZeroExt(n, e) if unsigned else SignExt(n, e)
+
+# Width of int, the type narrower operands are promoted to
+INT_WIDTH = 32
+
+def isIntLiteral(e):
+    return isinstance(e, (int, long)) and not isinstance(e, bool)
+
+# Returns the width and signedness of a bit-vector or integer literal operand
+def operandType(e, unsigned=False):
+    if isBitVec(e):
+        return e.size(), unsigned
+    for width, signed in [(INT_WIDTH, True), (64, True), (64, False)]:
+        if -2**(width - 1) * signed <= e < 2**(width - signed):
+            return width, not signed
+    raise ValueError("integer literal {} does not fit in 64 bits".format(e))
+
+# The integer promotion: every value of a narrower type fits in int
+def promotedType(width, unsigned):
+    if width < INT_WIDTH:
+        return INT_WIDTH, False
+    return width, unsigned
+
+# The usual arithmetic conversions of two promoted types. A signed type
+# wider than the unsigned one holds all its values, otherwise the unsigned
+# type is used.
+def commonType(a, b):
+    if a[1] == b[1]:
+        return max(a[0], b[0]), a[1]
+    (signed, _), (unsigned, _) = (a, b) if b[1] else (b, a)
+    return (signed, False) if signed > unsigned else (unsigned, True)
+
+# Converts e to width bits, an integer literal in the context ctx
+def convert(e, width, unsigned=False, ctx=None):
+    if not isBitVec(e):
+        return BitVecVal(e, width, ctx)
+    if e.size() > width:
+        return Extract(width - 1, 0, e)
+    return extend(e, width, unsigned)
+
+# Promotes a bit-vector or integer literal, returns it and whether its type
+# is unsigned
+def promote(e, unsigned=False):
+    width, unsigned = promotedType(*operandType(e, unsigned))
+    return convert(e, width, unsigned), unsigned
+
+"""
+Converts a and b, bit-vectors or integer literals and at least one of them
+a bit-vector, to their common type. unsigned says which operands are
+unsigned. Returns both and whether the common type is unsigned.
+"""
+def arithmetic(a, b, unsigned=(False, False)):
+    width, common = commonType(*[promotedType(*operandType(e, u)) for e, u in zip([a, b], unsigned)])
+    ctx = (a if isBitVec(a) else b).ctx
+    return convert(a, width, unsigned[0], ctx), convert(b, width, unsigned[1], ctx), common
+
+# Whether the common type of a and b, see arithmetic, is unsigned
+def isUnsignedCommon(a, b, unsigned=(False, False)):
+    return commonType(*[promotedType(*operandType(e, u)) for e, u in zip([a, b], unsigned)])[1]
+
+# Whether both operands are bit-vectors or integer literals, at least one a
+# bit-vector, so C semantics apply
+def isIntOperation(a, b):
+    return (isBitVec(a) or isBitVec(b)) and all(isBitVec(e) or isIntLiteral(e) for e in [a, b])
+
+SIGNED_OPS = {'/': lambda a, b: a / b, '%': SRem}
+UNSIGNED_OPS = {'<': ULT, '<=': ULE, '>': UGT, '>=': UGE, '/': UDiv, '%': URem}
+
+"""
+Applies the binary operator op of the expression language, which default
+implements with the Python operator. When the operands are bit-vectors or
+integer literals it gets C semantics instead, unsigned says which operands
+are unsigned.
+"""
+def binary(op, a, b, default, unsigned=(False, False)):
+    if not isIntOperation(a, b):
+        return default(a, b)
+    a, b, common = arithmetic(a, b, unsigned)
+    if common and op in UNSIGNED_OPS:
+        return UNSIGNED_OPS[op](a, b)
+    if op in SIGNED_OPS:
+        return SIGNED_OPS[op](a, b)
+    return default(a, b)
+
+# Converts value to the type of the bit-vector target as a C assignment
+# does, the narrower type takes the low bits
+def assign(target, value, unsigned=False):
+    if not isBitVec(target) or not (isBitVec(value) or isIntLiteral(value)):
+        return value
+    return convert(value, target.size(), unsigned, target.ctx)
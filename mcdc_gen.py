@@ -1,24 +1,204 @@
 from z3 import *
-import sys, logging
-from copy import deepcopy
+import sys, time, logging
+from multiprocessing import Pool, cpu_count
 from utils import createVar, createExpression, createFunctionCall, \
-    createAssignment, pPrintDict, showLog, z3TypeToPython
+    createAssignment, pPrintDict, showLog, z3TypeToPython, isUnsignedVar, \
+    serializeZ3Val, deserializeZ3Val, pairProofs, pythonToZ3, collectConstants, \
+    collectDeclarations
+from engines import ENGINES, PushPopEngine, AssumptionEngine
+from truth_table import isTruthTableDecision, truthTableProofs, truthTablePairs, findConditions
+from tree_mcdc import TreeEngine
+from min_cover import CoverEngine, minimalCover
+from pair_search import PairEngine
+from solution_cache import SolutionCache, DEFAULT_CACHE_SIZE, fingerprint
+from constraint_index import ConstraintIndex
+from stats import SolverStats, InstrumentedSolver, newCounters, z3Statistics
+from solution_store import SolutionStore, nativeValue, z3Value
+from int_types import INT_ENCODINGS
+from tactics import TACTICS, CONFIGURATIONS, PORTFOLIOS, classifyLogic, chooseConfiguration, fits
+from solver_pool import LIFECYCLES, SolverPool, z3Memory
+from flip_eval import UNDECIDED, Evaluator, flipPair
+from z3math import MATH_MODES, DEFAULT_SEGMENTS, MathModel
+from data_types import scalarize, flattenValues
+from expr_parser import ExpressionBuilder
+
+# Part of every cache fingerprint, bump when the vectors found change
+GENERATOR_VERSION = 14
+
+# Models in a row which prove no condition before a decision is given up
+MAX_IDLE_MODELS = 16
+
+# Times a decision using relaxed math functions is solved again with the
+# vectors of a model floating point math contradicts as refinement points
+MAX_REFINEMENTS = 4
+
+# Solves a single decision in a fresh worker process and Z3 context.
+# Z3 values cannot be pickled so they are sent back as strings, together
+# with the conditions each vector shows and the stats record of the
+# decision. The run deadline is passed as a time.time() value so it does
+# not restart in every worker. A decision using relaxed math functions is
+# solved again while floating point math contradicts its vectors, with
+# their arguments as refinement points. After MAX_REFINEMENTS rounds, or
+# once the points repeat, it is solved a last time with the arguments kept
+# at the sampled points, and the vectors still contradicted are dropped.
+def _solveDecision(job):
+    variables, expression, funcCalls, dataTypes, options, deadlineAt = job
+    refinements = {}
+    rounds = 0
+    sampled = False
+    while True:
+        # A forked worker inherits the terms of the parent's main context,
+        # which change the models Z3 picks. Every model of the decision is
+        # found in a context of its own, so it is the same in any worker and
+        # in the parent.
+        generator = MCDCgenerator(variables, [expression], funcCalls, dataTypes, _mathRefinements=refinements,
+                                  _mathSampled=sampled, _ctx=Context(), **options)
+        generator.deadlineAt = deadlineAt
+        res = list(generator.iterSolutions())
+        points = generator.counterexamples(res)
+        if not points or sampled or deadlineAt is not None and time.time() >= deadlineAt:
+            break
+        added = False
+        for name, values in points.items():
+            for point in values:
+                if point not in refinements.get(name, []):
+                    refinements.setdefault(name, []).append(point)
+                    added = True
+        sampled = rounds == MAX_REFINEMENTS or not added
+        rounds += 1
+    res = generator.verifyRelaxed(res)
+    record = generator.stats.decisions[0]
+    if rounds:
+        record['refinements'] = rounds
+    vectors = [{k:serializeZ3Val(v) for k, v in sol.items()} for sol, _, _ in res]
+    return vectors, [proof for _, _, proof in res], record
+
+# Pair queries a model needs before they are sent to the pair pool. Fewer
+# are checked one by one, as the round trip to the workers costs more than
+# it saves.
+MIN_POOL_QUERIES = 8
+
+# The decision a pair worker checked last, its Z3 context, a solver with
+# the assertions of the decision and how many of them are blocking clauses
+_pairContext = None
+
+# Returns the context and the solver of a decision in a pair worker. They
+# are created once per worker and decision, and as blocking clauses are only
+# ever appended, just the ones added since the last job are parsed. Every
+# text is parsed after the declarations of the decision.
+def _pairSolver(decision, declarations, base, blocked):
+    global _pairContext
+    if _pairContext is None or _pairContext[0] != decision:
+        ctx = Context()
+        s = Solver(ctx=ctx)
+        s.add(parse_smt2_string(declarations + base, ctx=ctx))
+        _pairContext = [decision, ctx, s, 0]
+    _, ctx, s, parsed = _pairContext
+    for clause in blocked[parsed:]:
+        s.add(parse_smt2_string(declarations + clause, ctx=ctx))
+    _pairContext[3] = len(blocked)
+    return ctx, s
+
+# Checks the pair constraints of one condition against the base assertions
+# and the blocking clauses of the decision
+def _checkPairs(job):
+    decision, declarations, base, blocked, constraints, timeout = job
+    ctx, s = _pairSolver(decision, declarations, base, blocked)
+    if timeout is not None:
+        s.set('timeout', max(1, timeout))
+    res = []
+    for constraint in constraints:
+        s.push()
+        s.add(parse_smt2_string(declarations + constraint, ctx=ctx))
+        start = time.time()
+        result = s.check()
+        elapsed = time.time() - start
+        if result==sat:
+            model = s.model()
+            res.append(({x.name():serializeZ3Val(model[x]) for x in model if x.arity()==0}, str(result), elapsed))
+        else:
+            res.append((None, str(result), elapsed))
+        s.pop()
+    return res
 
 class MCDCgenerator:
-    def __init__(self, _variables, _expressions, _funcCalls, _dataTypes, _parallel=False):
-        self.solver = Solver()
+    def __init__(self, _variables, _expressions, _funcCalls, _dataTypes, _parallel=False, _workers=1,
+                 _pairWorkers=1, _engine='pushpop', _truthTable=True, _cacheDir=None,
+                 _cacheSize=DEFAULT_CACHE_SIZE, _minimize=False, _checkTimeout=None,
+                 _decisionBudget=None, _deadline=None, _tactic='default', _intEncoding='int',
+                 _solverLifecycle='reset', _memoryLimit=None, _previous=None, _flip=True, _prune=True,
+                 _gaps=False, _mathMode='exact', _mathSegments=DEFAULT_SEGMENTS, _mathRefinements=None,
+                 _mathSampled=False, _ctx=None):
+        assert _engine in ENGINES
+        assert _tactic in TACTICS or _tactic in CONFIGURATIONS
+        assert _intEncoding in INT_ENCODINGS
+        assert _mathMode in MATH_MODES
+        self.intEncoding = _intEncoding
+        # The Z3 context of every term and solver of the run, None for the
+        # main context
+        self.ctx = _ctx
+        self.math = MathModel(_mathMode, _mathSegments, _mathRefinements, _mathSampled, _ctx)
+        # A run which does not refine solves the decisions using relaxed math
+        # functions one by one with _solveDecision, which does
+        self.refining = _mathRefinements is not None
+        self.stats = SolverStats()
+        self.solver = InstrumentedSolver(Solver(ctx=_ctx), self.stats)
+        self.inputs = (_variables, _expressions, _funcCalls, _dataTypes)
+        _variables, self.shapes = self.convertDataTypes(_variables, _dataTypes)
+        self.scalarInputs = (_variables, _funcCalls)
         _constants = [var for var in _variables if var.isConst()]
         _assignments = [var for var in _variables if var.isAssignment()]
         self.variables = self.convertVariables(_variables, _constants, _assignments, _funcCalls)
+        # Names of the unsigned bit-vector variables
+        self.unsigned = set(var.name for var in _variables if isUnsignedVar(var, self.intEncoding))
+        self.unsigned.update(f.callName for f in _funcCalls if isUnsignedVar(f, self.intEncoding))
+        # Shares the subterms of the decisions, funcCalls and assignments
+        self.builder = ExpressionBuilder(self.variables, self.math, self.unsigned, _ctx)
         self.funcCalls = self.convertFunctionCalls(_funcCalls)
         self.assignments = self.convertAssignments(_assignments)
         self.expressions = self.convertExpressions(_expressions)
+        # The results of relaxed math functions are defined like funcCall results
+        for res, _, _ in self.math.applications:
+            self.variables[res.decl().name()] = res
+        self.constraints = ConstraintIndex(zip([f.callName for f in _funcCalls], self.funcCalls) +
+                                           zip([a.name for a in _assignments], self.assignments) +
+                                           self.math.definitions)
         self.skipVar = self.createSkipFilter(_constants + _assignments, _funcCalls)
+        self.skipVar.update((name, name) for name, _ in self.math.definitions)
         logging.basicConfig(stream=sys.stderr, level=logging.WARNING)
         self.logger = logging.getLogger()
         set_param('parallel.enable', _parallel)
+        self.parallel = _parallel
+        self.workers = max(1, _workers)
+        self.pairWorkers = max(1, _pairWorkers)
+        self.pairPool = None
+        self.engine = _engine
+        self.truthTable = _truthTable
+        self.minimize = _minimize
+        self.tactic = _tactic
+        self.flip = _flip
+        self.prune = _prune
+        self.solvers = SolverPool(_solverLifecycle, _ctx)
+        # Megabytes Z3 may use before the solvers are dropped
+        self.memoryLimit = _memoryLimit
+        # Milliseconds per check, seconds per decision and for the whole run
+        self.solver.timeout = _checkTimeout
+        self.decisionBudget = _decisionBudget
+        self.deadline = _deadline
+        self.deadlineAt = None
+        self.store = None
+        self.cache = SolutionCache(_cacheDir, _cacheSize) if _cacheDir is not None else None
         self.N = len(_variables)-len(_constants)-len(_assignments)+1
         self.maxSolutions = 2*self.N
+        # Test cases of a previous run for every decision position, as
+        # z3TypeToPython values and converted
+        self.previousInputs = _previous or []
+        # The Z3 value of every previous value, a test suite repeats the
+        # same few values many times
+        self.previousValues = {}
+        self.previous = [[self.previousSolution(vector) for vector in vectors] for vectors in self.previousInputs]
+        # Only the vectors the previous ones lack are accepted
+        self.gaps = _gaps
 
     def __str__(self):
         res = "variables: {}\nexpressions: {}\nassignments: {}\nfuncCalls {}\nskipVar: {}\nN: {}".format(
@@ -37,29 +217,34 @@ class MCDCgenerator:
         return res
     
     def convertVariables(self, _variables, _constants, _assignments, _funcCalls):
-        res = {var.name:createVar(var) for var in _constants}
-        res.update({var.name:createVar(var) for var in _assignments})
-        res.update({var.name:createVar(var) for var in _variables})
-        res.update({f.callName:createVar(f) for f in _funcCalls})
+        res = {var.name:createVar(var, self.intEncoding, self.ctx) for var in _constants}
+        res.update({var.name:createVar(var, self.intEncoding, self.ctx) for var in _assignments})
+        res.update({var.name:createVar(var, self.intEncoding, self.ctx) for var in _variables})
+        res.update({f.callName:createVar(f, self.intEncoding, self.ctx) for f in _funcCalls})
         return res
 
     def convertExpressions(self, _expr):
-        return [createExpression(self.variables, e) for e in _expr]
+        return [createExpression(self.variables, e, builder=self.builder) for e in _expr]
 
     def convertAssignments(self, _assignments):
-        return [createAssignment(self.variables, a) for a in _assignments]
+        return [createAssignment(self.variables, a, builder=self.builder) for a in _assignments]
     
     def convertFunctionCalls(self, _functionCalls):
-        return [createFunctionCall(self.variables, fc) for fc in _functionCalls]
+        return [createFunctionCall(self.variables, fc, builder=self.builder) for fc in _functionCalls]
 
-    def convertDataTypes(self, _dataTypes):
-        dts = {x:Datatype(x) for x in _dataTypes.keys()}
-        res = {x:createDataType(x, dts, _dataTypes) for x in dts.keys()}
-        return res
+    # Struct and array variables are solved over their scalar fields
+    def convertDataTypes(self, _variables, _dataTypes):
+        return scalarize(_variables, _dataTypes or {})
                 
     def modelToDict(self, solver):
+        self.stats.count('models')
         model = solver.model()
-        return {x.name():model[x] for x in model if x.name() not in self.skipVar}
+        res = {}
+        for x in model.decls():
+            name = x.name()
+            if name in self.variables and name not in self.skipVar:
+                res[name] = model.get_interp(x)
+        return res
         
     # returns a constraint pair for finding independence pairs
     def createPairConstraint(self, key, assigns, expr):
@@ -77,85 +262,825 @@ class MCDCgenerator:
         constraint[1].append(Not(expr))
         return constraint
 
+    # Checks constraint in a new scope, returns the model as a dict or None
+    def checkConstraint(self, s, constraint):
+        s.push()
+        s.add(constraint)
+        res = self.modelToDict(s) if s.check()==sat else None
+        s.pop()
+        return res
+
+    # Checks the pair constraints of every key in a pool of worker processes.
+    # Each worker gets the declarations and the assertions base of the
+    # decision, serialized once, and the blocking clauses blocked added since
+    # as its context. Only the sides known leaves UNDECIDED are sent, the
+    # others are taken from known. Returns None when there are fewer than
+    # MIN_POOL_QUERIES such sides, which are then checked one by one.
+    def checkPairsParallel(self, s, decision, declarations, base, blocked, keys, assigns, expr, known):
+        pending = {key:known.get(key, [UNDECIDED, UNDECIDED]) for key in keys}
+        if sum(pair.count(UNDECIDED) for pair in pending.values()) < MIN_POOL_QUERIES:
+            return None
+        timeout = s.nextTimeout()
+        jobs = []
+        for key in keys:
+            pairConstraint = self.createPairConstraint(key, assigns, expr)
+            constraints = [self.constraintToString(c) for c, k in zip(pairConstraint, pending[key]) if k is UNDECIDED]
+            jobs.append((decision, declarations, base, blocked, constraints, timeout))
+        results = self.pairPool.map(_checkPairs, jobs, chunksize=1)
+
+        res = {}
+        for key, checked in zip(keys, results):
+            self.stats.condition = key
+            self.stats.count('evaluated', 2 - pending[key].count(UNDECIDED))
+            for sol, result, elapsed in checked:
+                self.stats.check(result, elapsed)
+                if sol is not None:
+                    self.stats.count('models')
+            checked = iter([None if sol is None else
+                            {k:deserializeZ3Val(self.variables[k], v) for k, v in sol.items() if k not in self.skipVar}
+                            for sol, _, _ in checked])
+            res[key] = [next(checked) if k is UNDECIDED else k for k in pending[key]]
+        self.stats.condition = None
+        return res
+
+    # Serializes the declarations of the symbols of exprs for the pair workers
+    def declarationsToString(self, exprs):
+        return "".join(d.sexpr() + "\n" for _, d in sorted(collectDeclarations(exprs).items()))
+
+    # Serializes constraint, a term or a list of terms, without declarations
+    def constraintToString(self, constraint):
+        if isinstance(constraint, list):
+            constraint = And(constraint)
+        return "(assert {})".format(constraint.sexpr())
+
     def blockAssigns(self, assigns):
         constraint = []
         for k, v in assigns.iteritems():
             constraint.append(self.variables[k]==assigns[k])
         self.solver.add(Not(And(constraint)))
+        return Not(And(constraint))
+
+    # Solves every decision given by index on its own, in a separate worker
+    # process when there are workers. Each process only handles one decision
+    # so results do not depend on scheduling. With cone a decision only gets
+    # the variables, funcCalls and assignments in its cone of influence, so
+    # its result does not depend on the rest of the run. Yields the results
+    # of _solveDecision in order as they become available.
+    def solveDecisions(self, indices, cone=False):
+        _variables, _expressions, _funcCalls, _dataTypes = self.inputs
+        options = {'_parallel':self.parallel, '_engine':self.engine, '_truthTable':self.truthTable,
+                   '_minimize':self.minimize, '_checkTimeout':self.solver.timeout,
+                   '_decisionBudget':self.decisionBudget, '_tactic':self.tactic,
+                   '_intEncoding':self.intEncoding, '_solverLifecycle':self.solvers.lifecycle,
+                   '_memoryLimit':self.memoryLimit, '_flip':self.flip, '_prune':self.prune,
+                   '_gaps':self.gaps, '_mathMode':self.math.mode, '_mathSegments':self.math.segments}
+        jobs = [(_variables, _expressions[i], _funcCalls, _dataTypes,
+                 dict(options, _previous=[self.previousVectors(i, self.previousInputs)]), self.deadlineAt)
+                for i in indices]
+        if cone:
+            jobs = [self.coneInputs(i) + job[4:] for i, job in zip(indices, jobs)]
+        if self.tactic == 'portfolio':
+            for i, job in zip(indices, jobs):
+                yield self.raceDecision(self.expressions[i], job)
+            return
+        if self.workers == 1 or len(jobs) < 2:
+            for job in jobs:
+                yield _solveDecision(job)
+            return
+
+        pool = Pool(min(self.workers, len(jobs)), maxtasksperchild=1)
+        try:
+            for res in pool.imap(_solveDecision, jobs, chunksize=1):
+                yield res
+        finally:
+            # Also stops the remaining decisions when the caller stops early
+            pool.terminate()
+            pool.join()
+
+    # Solves a decision with every configuration of the portfolio of its
+    # logic, each in a process of its own. Keeps the first result which
+    # decided every condition, or the first result when none did.
+    def raceDecision(self, expr, job):
+        variables, expression, funcCalls, dataTypes, options, deadlineAt = job
+        if self.truthTable and isTruthTableDecision(expr, self.skipVar):
+            return _solveDecision((variables, expression, funcCalls, dataTypes,
+                                   dict(options, _tactic='default'), deadlineAt))
+        configurations = PORTFOLIOS[classifyLogic([expr] + self.dependencies(expr))]
+        jobs = [(variables, expression, funcCalls, dataTypes, dict(options, _tactic=c), deadlineAt)
+                for c in configurations]
+        pool = Pool(len(jobs), maxtasksperchild=1)
+        res = None
+        try:
+            for vectors, proofs, record in pool.imap_unordered(_solveDecision, jobs):
+                complete = 'unknown' not in record['status'].values()
+                if res is None or complete:
+                    res = (vectors, proofs, record)
+                if complete:
+                    break
+        finally:
+            pool.terminate()
+            pool.join()
+        res[2]['portfolio'] = configurations
+        return res
+
+    def deserializeSolutions(self, vectors):
+        return [{str(k):deserializeZ3Val(self.variables[k], v) for k, v in sol.items()} for sol in vectors]
+
+    # Results are merged in decision order
+    def iterSolutionsParallel(self):
+        for i, (vectors, proofs, record) in enumerate(self.solveDecisions(range(len(self.expressions)))):
+            vectors = self.deserializeSolutions(vectors)
+            added = self.mergeSolutions(vectors)
+            self.stats.addDecision(record, i, len(added))
+            for j in added:
+                yield vectors[j], i, proofs[j]
+
+    # Returns the variables, the decision, the funcCalls and the data types of
+    # a job which solves decision index over its cone of influence only
+    def coneInputs(self, index):
+        _variables, _funcCalls = self.scalarInputs
+        _, names = self.constraints.dependentConstraints(self.expressions[index])
+        return ([var for var in _variables if var.name in names], self.inputs[1][index],
+                [f for f in _funcCalls if f.callName in names], {})
+
+    # Decisions are keyed by their cone of influence, as the cached ones are
+    # solved over it, so unrelated variables do not change the key
+    def fingerprint(self, expr):
+        options = {'version':GENERATOR_VERSION, 'engine':self.engine, 'truthTable':self.truthTable,
+                   'minimize':self.minimize, 'tactic':self.tactic, 'intEncoding':self.intEncoding, 'flip':self.flip,
+                   'prune':self.prune, 'gaps':self.gaps,
+                   'math':[self.math.mode, self.math.segments]}
+        return fingerprint(expr, self.variables, self.constraints, options, self.skipVar)
+
+    # Adds the conditions outside the cone of a decision solved over its
+    # cone, which no pair can show, to a copy of its record
+    def completeRecord(self, record):
+        record = dict(record, status=dict(record['status']))
+        outside = [k for k in self.variables if k not in self.skipVar and k not in record['status']]
+        for c in outside:
+            record['status'][c] = 'masked' if self.prune else 'unproven'
+        if self.prune:
+            record['masked'] = dict(record.get('masked', {}), **{c:[] for c in outside})
+        return record
+
+    # Returns the funcCall and assignment constraints expr depends on
+    def dependencies(self, expr):
+        res, _ = self.constraints.dependentConstraints(expr)
+        self.logger.debug("%s of %s funcCall and assignment constraints in the cone of %s",
+                          len(res), len(self.constraints.constraints), expr)
+        return res
+
+    # Looks up every decision in the cache and solves the missing ones on
+    # their own, as iterSolutionsParallel does
+    def iterSolutionsCached(self):
+        keys = [self.fingerprint(expr) for expr in self.expressions]
+        results = [self.cache.get(key) for key in keys]
+        missing = [i for i, res in enumerate(results) if res is None]
+        self.logger.info("cache: {} hits, {} misses".format(len(keys)-len(missing), len(missing)))
+
+        solved = self.solveDecisions(missing, cone=True)
+        for i, res in enumerate(results):
+            if res is None:
+                vectors, proofs, record = next(solved)
+                res = {'vectors':vectors, 'proofs':proofs, 'status':record['status']}
+                # Partial results and results built on a previous run are not kept
+                if 'unknown' not in record['status'].values() and not record.get('reuse', {}).get('reused'):
+                    self.cache.put(keys[i], res)
+            else:
+                record = dict(newCounters(), method='cache', time=0.0, conditions={},
+                              accepted=len(res['vectors']), status=res['status'])
+            record = self.completeRecord(record)
+            vectors = self.deserializeSolutions(res['vectors'])
+            added = self.mergeSolutions(vectors)
+            self.stats.addDecision(record, i, len(added))
+            for j in added:
+                yield vectors[j], i, res['proofs'][j]
+
+    # Stores the vectors which are not stored yet, returns their positions in vectors
+    def mergeSolutions(self, vectors):
+        added = [j for j, sol in enumerate(vectors) if self.store.add(sol)]
+        self.stats.count('accepted', len(added))
+        self.stats.count('duplicates', len(vectors) - len(added))
+        return added
+
+    # Merges the vectors of a decision solved in one go and yields the new ones
+    def emitSolutions(self, index, vectors, proofs):
+        for j in self.mergeSolutions(vectors):
+            yield vectors[j], index, proofs[j]
 
     def findSolutions(self):
-        s = self.solver
+        return [self.store.toZ3(row) for row in self.findVectors()]
+
+    """
+    Returns the SolutionStore holding every accepted vector as a row, which
+    is converted with toZ3 or toPython only when it is needed
+    """
+    def findVectors(self):
+        for _ in self.iterSolutions():
+            pass
+        return self.store
+
+    """
+    Yields every accepted vector as soon as it is found, together with the
+    index of its decision and the conditions it shows
+    """
+    def iterSolutions(self):
+        start = time.time()
+        self.store = SolutionStore(self.variables, sorted(k for k in self.variables if k not in self.skipVar),
+                                   self.shapes, self.unsigned)
+        if self.deadlineAt is None and self.deadline is not None:
+            self.deadlineAt = start + self.deadline
+        try:
+            for res in self.dispatchSolutions():
+                yield res
+        finally:
+            self.stats.time = time.time() - start
+            self.stats.z3 = z3Statistics(self.solver)
+
+    """
+    Recomputes the vectors res, a list of (vector, index, conditions shown)
+    of one decision using relaxed math functions, with floating point math.
+    A condition a vector shows is confirmed when another vector, which
+    differs from it in that condition only, has the other outcome. Returns
+    the outcome, the argument values of the applications and the confirmed
+    conditions of every vector, or None for decisions which also depend on
+    funcCalls or assignments, their results are not part of the vectors.
+    """
+    def checkRelaxed(self, res):
+        if not res:
+            return None
+        expr = self.expressions[res[0][1]]
+        results = set(r.decl().name() for r, _, _ in self.math.applications)
+        _, names = self.constraints.dependentConstraints(expr)
+        if not names & results or any(n in self.skipVar and n not in results for n in names):
+            return None
+        outcomes = []
+        arguments = []
+        for sol, _, _ in res:
+            # Variables a vector leaves out take the value of model completion
+            values = [(self.variables[k], sol[k] if k in sol else
+                       pythonToZ3(self.variables[k], '' if is_string(self.variables[k]) else 0))
+                      for k in names if k not in results]
+            arguments.append(self.math.arguments(values, names)[0])
+            outcomes.append(self.math.evaluate(expr, values, names))
+        differ = lambda a, b: [k for k in a if k in b and not a[k].eq(b[k])]
+        confirmed = []
+        for (sol, _, proof), outcome in zip(res, outcomes):
+            confirmed.append(set(c for c in proof for (other, _, _), otherOutcome in zip(res, outcomes)
+                                 if None not in [outcome, otherOutcome] and outcome != otherOutcome
+                                 and differ(sol, other) == [c]))
+        return zip(outcomes, arguments, confirmed)
+
+    # Returns the argument values of the applications of all vectors in res
+    # as refinement points by result name when floating point math
+    # contradicts any of them. The partner of a contradicted vector may be
+    # the one the relaxation got wrong.
+    def counterexamples(self, res):
+        checked = self.checkRelaxed(res) or []
+        if all(outcome is not None and not set(proof) - confirmed
+               for (_, _, proof), (outcome, _, confirmed) in zip(res, checked)):
+            return {}
+        points = {}
+        for _, arguments, _ in checked:
+            for name, point in arguments.items():
+                points.setdefault(name, []).append(point)
+        return points
+
+    """
+    Drops the vectors in res floating point math contradicts, see
+    checkRelaxed, and the conditions the others show without confirmation.
+    A proven condition no vector confirms becomes unknown. Returns the
+    vectors kept.
+    """
+    def verifyRelaxed(self, res):
+        checked = self.checkRelaxed(res)
+        if checked is None:
+            return res
+        kept = []
+        for (sol, index, proof), (outcome, _, confirmed) in zip(res, checked):
+            if outcome is None or proof and not confirmed:
+                continue
+            kept.append((sol, index, [c for c in proof if c in confirmed]))
+        record = self.stats.decisions[0]
+        shown = set(c for _, _, proof in kept for c in proof)
+        unverified = sorted(c for c, status in record['status'].items() if status == 'proven' and c not in shown)
+        record['unverified'] = unverified
+        for c in unverified:
+            record['status'][c] = 'unknown'
+        if unverified or len(kept) < len(res):
+            self.logger.warning("Floating point math does not confirm the pairs of {} in decision {}, dropped {} "
+                                "vectors".format(unverified, record['index'], len(res) - len(kept)))
+        return kept
+
+    def dispatchSolutions(self):
+        if self.cache is not None:
+            return self.iterSolutionsCached()
+        if self.workers > 1 and len(self.expressions) > 1 or self.tactic == 'portfolio' or \
+                self.math.applications and not self.refining:
+            return self.iterSolutionsParallel()
+
+        if self.minimize:
+            return self.searchSolutions(CoverEngine)
+        if self.engine == 'assume':
+            return self.searchSolutions(AssumptionEngine)
+        if self.engine == 'tree':
+            return self.searchSolutions(TreeEngine)
+        if self.engine == 'pair':
+            return self.searchSolutions(PairEngine)
+        return self.searchWithPairPool()
+
+    # Workers beyond the number of CPUs only take turns, so the pair queries
+    # are checked one by one without a second CPU
+    def searchWithPairPool(self):
+        workers = min(self.pairWorkers, cpu_count())
+        if workers > 1:
+            self.pairPool = Pool(workers)
+        try:
+            for res in self.searchSolutions(PushPopEngine):
+                yield res
+        finally:
+            if self.pairPool is not None:
+                self.pairPool.close()
+                self.pairPool.join()
+                self.pairPool = None
+
+    # Picks a minimal cover from all independence pairs of the truth table
+    def minimalTruthTableSolutions(self, expr):
+        table, pairs = truthTablePairs(expr, self.skipVar)
+        rows, bound, optimal = minimalCover(pairs)
+        self.reportCover({'size':len(rows), 'lowerBound':bound, 'optimal':optimal,
+                          'candidates':len(set(r for c in pairs.values() for pair in c for r in pair))})
+        return [table.rowToDict(r) for r in rows], [name for name in table.names if not pairs[name]], \
+            pairProofs(pairs, rows)
+
+    # Starts the stats record of a decision and its budget
+    def beginDecision(self, index, method):
+        self.stats.beginDecision(index, method)
+        deadline = self.deadlineAt
+        if self.decisionBudget is not None:
+            budget = time.time() + self.decisionBudget
+            deadline = budget if deadline is None else min(deadline, budget)
+        self.solver.deadline = deadline
+
+    """
+    Marks every condition of the current decision proven, unproven or
+    unknown. A condition is unknown when it was not shown and a check it
+    depends on gave up or the budget ran out, so it may still have a pair.
+    """
+    def setStatus(self, conditions, proven, masked=()):
+        record = self.stats.decision
+        counted = record['conditions']
+        timedOut = self.solver.expired()
+        shared = record['unknown'] - sum(c['unknown'] for c in counted.values())
+        status = {}
+        for c in conditions:
+            if c in proven:
+                status[c] = 'proven'
+            elif c in masked:
+                status[c] = 'masked'
+            elif timedOut or shared > 0 or counted.get(c, {}).get('unknown', 0) > 0:
+                status[c] = 'unknown'
+            else:
+                status[c] = 'unproven'
+        record['status'] = status
+        record['timedOut'] = timedOut
+        unknown = sorted(c for c in conditions if status[c] == 'unknown')
+        if unknown:
+            self.logger.warning("Gave up on {} in decision {}".format(unknown, record['index']))
+
+    """
+    Returns the constraints of a pair of the condition key of expr under
+    its funcCall and assignment constraints dependencies, and the copies
+    the second vector of the pair is stated over. A pair are two vectors
+    which differ only in the condition and have different outcomes, so the
+    second vector has fresh copies of the condition and of the funcCall and
+    assignment variables, which depend on it, while every other variable is
+    shared. The decision is split into its conjuncts for the unsat core.
+    """
+    def pairConstraints(self, expr, dependencies, key):
+        v = self.variables
+        copied = [key] + sorted(k for k in self.skipVar if k in v and is_const(v[k])
+                                and v[k].decl().kind() == Z3_OP_UNINTERPRETED)
+        copies = [(v[k], FreshConst(v[k].sort(), k)) for k in copied]
+        flipped = lambda c: substitute(c, *copies)
+        conjuncts = expr.children() if is_and(expr) else [expr]
+        constraints = conjuncts + [v[key] != copies[0][1], Not(flipped(expr))] + dependencies + \
+            [flipped(c) for c in dependencies]
+        return constraints, copies
+
+    """
+    Checks whether any pair can show the condition key of expr, as
+    pairConstraints states it. Returns None when a pair may exist, else the
+    constraints of the unsat core which rule every pair out. The check has
+    a solver of its own, the blocked vectors must not rule out pairs.
+    """
+    def maskedCondition(self, expr, dependencies, key):
+        tracked, _ = self.pairConstraints(expr, dependencies, key)
+        literals = [FreshBool('track', c.ctx) for c in tracked]
+        s = InstrumentedSolver(Solver(ctx=self.ctx), self.stats)
+        s.timeout, s.deadline = self.solver.timeout, self.solver.deadline
+        for lit, c in zip(literals, tracked):
+            s.add(Implies(lit, c))
+        if s.check(*literals) != unsat:
+            return None
+        core = set(str(lit) for lit in s.unsat_core())
+        return [str(c) for lit, c in zip(literals, tracked) if str(lit) in core]
+
+    # Moves the conditions among keys which no pair can show from unproven
+    # to masked, together with their unsat core
+    def pruneMasked(self, expr, dependencies, keys, unproven, masked):
+        for key in keys:
+            self.stats.condition = key
+            core = self.maskedCondition(expr, dependencies, key)
+            if core is not None:
+                self.logger.info("No independence pair for {} in decision {}, ruled out by {}".format(
+                    key, self.stats.decision['index'], core))
+                masked[key] = core
+                del unproven[key]
+        self.stats.condition = None
+
+    # Returns the conditions sol forms a pair for with one of the accepted
+    # vectors: a vector with the other outcome and a different value for the
+    # condition, which agrees on every other variable both assign. Variables
+    # missing from a model do not affect its outcome.
+    def completedPairs(self, sol, outcome, accepted, conditions):
+        res = []
+        for other, otherOutcome in accepted:
+            if otherOutcome == outcome:
+                continue
+            differ = [k for k in sol if k in other and not sol[k].eq(other[k])]
+            if len(differ) == 1 and differ[0] in conditions and differ[0] not in res:
+                res.append(differ[0])
+        return sorted(res)
+
+    """
+    Classifies the logic of a decision, picks its solver configuration and
+    takes the solver of that configuration from the pool. A configuration
+    which does not decide the logic falls back to default. Returns whether
+    the decision starts on another or an emptied solver, so the engine has
+    to be created again.
+    """
+    def selectSolver(self, expr):
+        logic = classifyLogic([expr] + self.dependencies(expr))
+        configuration = chooseConfiguration(self.tactic, logic)
+        if not fits(configuration, logic):
+            self.logger.warning("{} does not decide {} in decision {}, solving with default".format(
+                configuration, logic, self.stats.decision['index']))
+            configuration = 'default'
+        self.stats.decision['logic'] = logic
+        self.stats.decision['configuration'] = configuration
+        self.logger.info("Decision {} is {}, solving with {}".format(self.stats.decision['index'], logic, configuration))
+        solver = self.solvers.get(configuration)
+        changed = solver is not self.solver.solver or self.solvers.lifecycle != 'shared'
+        self.solver.solver = solver
+        return changed
+
+    # Ends the record of a decision, with the statistics of the solver when
+    # it was searched with one. Once Z3 uses more than memoryLimit megabytes
+    # the pool is dropped and the next decision starts on a new solver,
+    # whatever the lifecycle.
+    def endDecision(self, searched=True):
+        memory = z3Memory()
+        self.stats.decision['memory'] = memory
+        if self.memoryLimit is not None and memory > self.memoryLimit:
+            self.logger.info("Z3 uses {:.1f} MB, dropping the solvers".format(memory))
+            self.stats.decision['memoryReset'] = True
+            self.solvers.clear()
+        self.stats.endDecision(self.solver if searched else None)
+
+    # Converts a test case of the previous run, None when a value does not
+    # fit its variable any more. Variables which are gone are left out.
+    def previousSolution(self, vector):
+        try:
+            return {str(k):self.previousValue(k, v) for k, v in flattenValues(vector).items()
+                    if k in self.variables and k not in self.skipVar}
+        except (ValueError, TypeError, Z3Exception):
+            return None
+
+    # Returns the Z3 value of v for the variable k
+    def previousValue(self, k, v):
+        key = (k, type(v), v if isinstance(v, (int, long, float, bool, basestring)) else repr(v))
+        if key not in self.previousValues:
+            self.previousValues[key] = pythonToZ3(self.variables[k], v)
+        return self.previousValues[key]
+
+    # Returns the previous vectors to try for decision index, those of the
+    # decision at the same position first
+    def previousVectors(self, index, vectors):
+        own = vectors[index] if index < len(vectors) else []
+        return own + [v for i, other in enumerate(vectors) if i != index for v in other]
+
+    """
+    Re-evaluates the vectors of the previous run against expr with the
+    Evaluator instead of the solver. Vectors which leave the outcome open
+    are dropped. Returns the vectors which form an independence pair that
+    still holds, as (solution, outcome, conditions shown), and the
+    conditions these pairs cover. A pair are two vectors with different
+    outcomes which differ in one condition of expr only, the variables expr
+    does not use may differ as well and a variable missing from a vector
+    does not affect its outcome. Vectors which assign every condition are
+    grouped by their values for all conditions but one, so the pairs of a
+    large test suite are found without comparing every two vectors.
+    """
+    def reusePairs(self, index, expr):
+        vectors = [sol for sol in self.previousVectors(index, self.previous) if sol is not None]
+        if not vectors:
+            return [], set()
+        names = sorted(n for n in collectConstants(expr) if n in self.variables and n not in self.skipVar)
+        evaluate = Evaluator(self.variables, expr)
+        candidates = []
+        values = []
+        plain = {}
+        def toNative(v):
+            if v.get_id() not in plain:
+                plain[v.get_id()] = nativeValue(v)
+            return plain[v.get_id()]
+        for sol in vectors:
+            native = {k:toNative(v) for k, v in sol.items() if k in names}
+            outcome = evaluate(native)
+            if outcome is not None:
+                candidates.append((sol, outcome))
+                values.append(native)
+
+        def isPair(i, j, name):
+            a, b = values[i], values[j]
+            return candidates[i][1] != candidates[j][1] and name in b and a[name] != b[name] and \
+                all(a[k] == b[k] for k in names if k != name and k in a and k in b)
+
+        pairs = {}
+        groups = {}
+        partial = []
+        compared = []
+        for i, native in enumerate(values):
+            # Irrational values are not compared
+            if any(is_expr(x) for x in native.values()):
+                continue
+            complete = len(native) == len(names)
+            for name in names:
+                if name in pairs or name not in native:
+                    continue
+                signature = (name,) + tuple(native.get(k) for k in names if k != name)
+                others = groups.get(signature, []) + partial if complete else compared
+                for j in others:
+                    if isPair(i, j, name):
+                        pairs[name] = [(j, i)]
+                        break
+                if complete:
+                    groups.setdefault(signature, []).append(i)
+            if not complete:
+                partial.append(i)
+            compared.append(i)
+            if len(pairs) == len(names):
+                break
+        selected = sorted(set(x for c in pairs.values() for pair in c for x in pair))
+        proofs = pairProofs(pairs, selected)
+        self.stats.decision['reuse'] = {'previous':len(vectors), 'valid':len(candidates), 'reused':len(selected),
+                                        'conditions':sorted(pairs)}
+        self.logger.info("Decision {}: reused {} of {} previous vectors, covering {}".format(
+            index, len(selected), len(vectors), sorted(pairs)))
+        return [candidates[x] + (proof,) for x, proof in zip(selected, proofs)], set(pairs)
+
+    # Accepts the reused vectors of the previous run, which in gaps mode are
+    # only used to build pairs on and not returned again
+    def emitReused(self, index, reused):
+        if self.gaps:
+            return
+        for sol, outcome, proof in reused:
+            if self.store.add(sol):
+                self.stats.count('accepted')
+                yield sol, index, proof
+
+    # Answers the pair queries of keys for assigns by evaluation where it
+    # can. Vectors this decision found already, the rows in found, are left
+    # to the solver, which does not return the vectors it blocked.
+    def flipPairs(self, evaluate, keys, assigns, found):
+        values = {k:nativeValue(v) for k, v in assigns.items()}
+        # Irrational values are left to the solver
+        if any(is_expr(v) for v in values.values()):
+            return {}
+        toZ3 = lambda sol: {k:assigns[k] if values.get(k) == v else z3Value(self.variables[k], v)
+                            for k, v in sol.items()}
+        known = {}
+        for key in keys:
+            pair = flipPair(evaluate, key, values, lambda sol: self.store.valuesRow(sol) in found)
+            known[key] = [toZ3(s) if isinstance(s, dict) else s for s in pair]
+        return known
+
+    def reportCover(self, report):
+        self.stats.decision['cover'] = report
+        self.logger.info("Minimal cover: {} vectors, lower bound {}, {} for the candidate pairs".format(
+            report['size'], report['lowerBound'], 'minimal' if report['optimal'] else 'not proven minimal'))
+
+    # Yields the vectors of every decision like iterSolutions. The engine
+    # is created again for every decision which gets a solver of its own.
+    def searchSolutions(self, engineClass):
+        engine = engineClass(self, self.solver)
         # When a variable has been proven to independently
         # affect the decision outcome we set values to false:
         # if decision true: key[0]=False else: key[1]=False
-        solutions = []
-
-        s.add(self.funcCalls)
-        s.add(self.assignments)
-
-        for expr in self.expressions:
-            foundSolutions = 0
-            unproven = {key:[True, True] for key in deepcopy(self.variables.keys()) if key not in self.skipVar}
-            first = True
-            s.push()
-            s.add(expr)
-            self.logger.info(s)
-
-            while s.check()==sat:
-                try_solution = self.modelToDict(s)
-                # Pop first context so we have no constraints
-                if first:
-                  s.pop()
-                  first = False
+        solutions = self.store
+
+        for index, expr in enumerate(self.expressions):
+            # Pure Boolean decisions are solved from their truth table
+            if self.truthTable and isTruthTableDecision(expr, self.skipVar):
+                self.beginDecision(index, 'truthTable')
+                if self.minimize:
+                    vectors, masked, proofs = self.minimalTruthTableSolutions(expr)
+                else:
+                    vectors, masked, proofs = truthTableProofs(expr, self.skipVar)
+                if masked:
+                    self.logger.info("No independence pairs for {}".format(masked))
+                for res in self.emitSolutions(index, vectors, proofs):
+                    yield res
+                conditions = findConditions(expr, self.skipVar).keys()
+                self.setStatus(conditions, [c for c in conditions if c not in masked])
+                self.endDecision(searched=False)
+                continue
+
+            self.beginDecision(index, 'cover' if self.minimize else self.engine)
+            if self.selectSolver(expr):
+                engine = engineClass(self, self.solver)
+
+            conditions = [key for key in self.variables.keys() if key not in self.skipVar]
+            reused, covered = self.reusePairs(index, expr)
+            # The solver is not needed when the previous vectors still cover
+            # every condition of the decision
+            if reused and all(c in covered for c in collectConstants(expr) if c in conditions):
+                for res in self.emitReused(index, reused):
+                    yield res
+                masked = {}
+                if self.prune:
+                    masked = {c:[] for c in conditions if c not in collectConstants(expr)}
+                self.stats.decision['masked'] = masked
+                self.setStatus(conditions, covered, masked)
+                self.endDecision()
+                continue
+            # The tree and cover engines search the whole decision again
+            if reused and (self.minimize or self.engine == 'tree'):
+                self.stats.decision['reuse'].update(reused=0, conditions=[])
+
+            if self.minimize:
+                vectors, unproven, report = engine.solve(expr)
+                if unproven:
+                    self.logger.info("Could not show independence of {}".format(unproven))
+                self.reportCover(report)
+                for res in self.emitSolutions(index, vectors, engine.proofs):
+                    yield res
+                self.setStatus(engine.names, [c for c in engine.names if c not in unproven])
+                self.endDecision()
+                continue
+
+            if self.engine == 'tree':
+                vectors, unproven = engine.solve(expr)
+                if unproven:
+                    self.logger.info("Could not show independence of {}".format(unproven))
+                for res in self.emitSolutions(index, vectors, engine.proofs):
+                    yield res
+                # Conditions outside the decision's cone have no pair
+                masked = {c:[] for c in conditions if c not in engine.names} if self.prune else {}
+                self.stats.decision['masked'] = masked
+                self.setStatus(conditions, [c for c in engine.names if c not in unproven], masked)
+                self.endDecision()
+                continue
 
+            # The pair engine keeps the reused vectors and builds its pairs
+            # on them
+            if self.engine == 'pair':
+                for res in self.emitReused(index, reused):
+                    yield res
+                vectors, unproven, masked = engine.solve(expr, [(sol, outcome) for sol, outcome, _ in reused],
+                                                         covered)
+                if unproven:
+                    self.logger.info("Could not show independence of {}".format(unproven))
+                for res in self.emitSolutions(index, vectors, engine.proofs):
+                    yield res
+                # Conditions outside the decision's cone have no pair
+                masked.update((c, []) for c in conditions if c not in engine.names)
+                self.stats.decision['masked'] = masked
+                self.setStatus(conditions, [c for c in engine.names if c not in unproven and c not in masked],
+                               masked)
+                self.endDecision()
+                continue
+
+            # Only the conditions the previous vectors do not cover any more
+            # are checked
+            unproven = {key:[True, True] for key in conditions if key not in covered}
+            # Conditions no pair can show are not searched for. Those the
+            # decision does not mention are dropped right away, the others
+            # are checked once a model proves nothing.
+            masked = {}
+            tried = set()
+            if self.prune:
+                dependencies = self.dependencies(expr)
+                cone = collectConstants(And([expr] + dependencies))
+                masked = {key:[] for key in unproven if key not in cone}
+                for key in masked:
+                    del unproven[key]
+            # Vectors found for this decision and their outcome, whether the
+            # store accepted them or an earlier decision had them already,
+            # their rows and the conditions with a pair among them
+            accepted = []
+            found = set()
+            shown = set(covered)
+            # Pair queries are evaluated unless the funcCalls or assignments
+            # the decision depends on constrain the partner
+            flips = self.flip and engine.flips and not self.dependencies(expr)
+            evaluate = Evaluator(self.variables, expr) if flips else None
+            idle = 0
+            engine.begin(expr)
+            try_solution = engine.firstModel()
+            for sol, outcome, proof in reused:
+                accepted.append((sol, outcome))
+                found.add(solutions.row(sol))
+                engine.block(sol)
+            for res in self.emitReused(index, reused):
+                yield res
+
+            # Until every condition is shown or has a vector for both outcomes
+            while try_solution is not None and any(any(unproven[i]) for i in unproven if i not in shown):
                 solution1 = None
                 solution2 = None
-                
-                for i in unproven.keys():
-                    s.push()
-                    pairConstraint = self.createPairConstraint(i, try_solution, expr)
-                    s.add(pairConstraint[0])
-                    if s.check()==sat:
-                        new_sol = self.modelToDict(s)
-                        if new_sol != solution1 and unproven[i][0]:
-                            self.logger.debug("Found solution proving {}=>True: {}".format(i, new_sol))
-                            unproven[i][0] = False
-                            solution1 = deepcopy(new_sol)
-                    s.pop()
-                    s.push()
-                    s.add(pairConstraint[1])
-                    if s.check()==sat:
-                        new_sol = self.modelToDict(s)
-                        if new_sol != solution2 and unproven[i][1]:
-                            self.logger.debug("Found solution proving {}=>False: {}".format(i, new_sol))
-                            unproven[i][1] = False
-                            solution2 = deepcopy(new_sol)
-                    s.pop()
-
-                    if solution1 != None and solution1 not in solutions:
-                        foundSolutions += 1
-                        solutions.append(solution1)
-                        s.push()
-                        self.blockAssigns(solution1)
-                        self.logger.debug("Added solution1: {}".format(pPrintDict(solution1)))
-
-                    if solution2 != None and solution2 not in solutions:
-                        foundSolutions += 1
-                        solutions.append(solution2)
-                        s.push()
-                        self.blockAssigns(solution2)
-                        self.logger.debug("Added solution2: {}".format(pPrintDict(solution2)))
+                progressed = False
+                # Conditions which are shown or have a vector for both
+                # outcomes are not asked again
+                searched = [i for i in unproven.keys() if any(unproven[i]) and i not in shown]
+
+                known = self.flipPairs(evaluate, searched, try_solution, found) if evaluate else {}
+                # With a pair pool all pair queries for this model which
+                # evaluation left open are solved up front and merged below
+                # in the same order as without it
+                pairs = engine.checkPairs([i for i in searched if UNDECIDED in known.get(i, [UNDECIDED])],
+                                          try_solution, known)
+
+                for i in searched:
+                    self.stats.condition = i
+                    flipped = known.get(i, [UNDECIDED, UNDECIDED])
+                    if UNDECIDED not in flipped:
+                        new_sol1, new_sol2 = flipped
+                        self.stats.count('evaluated', 2)
+                    elif pairs is not None:
+                        new_sol1, new_sol2 = pairs[i]
+                    elif i in known:
+                        new_sol1, new_sol2 = engine.checkPair(i, try_solution, flipped)
+                        self.stats.count('evaluated', 2 - flipped.count(UNDECIDED))
+                    else:
+                        new_sol1, new_sol2 = engine.checkPair(i, try_solution)
+
+                    if new_sol1 is not None and new_sol1 != solution1 and unproven[i][0]:
+                        self.logger.debug("Found solution proving {}=>True: {}".format(i, new_sol1))
+                        unproven[i][0] = False
+                        progressed = True
+                        solution1 = dict(new_sol1)
+                        if solution1 in solutions:
+                            self.stats.count('duplicates')
+                    if new_sol2 is not None and new_sol2 != solution2 and unproven[i][1]:
+                        self.logger.debug("Found solution proving {}=>False: {}".format(i, new_sol2))
+                        unproven[i][1] = False
+                        progressed = True
+                        solution2 = dict(new_sol2)
+                        if solution2 in solutions:
+                            self.stats.count('duplicates')
+
+                    # A vector an earlier decision stored already is not
+                    # emitted again but still completes the pairs of this one
+                    for sol, outcome in [(solution1, True), (solution2, False)]:
+                        if sol is None or solutions.row(sol) in found:
+                            continue
+                        found.add(solutions.row(sol))
+                        completed = self.completedPairs(sol, outcome, accepted, unproven)
+                        shown.update(completed)
+                        accepted.append((sol, outcome))
+                        engine.block(sol)
+                        if solutions.add(sol):
+                            self.stats.count('accepted')
+                            self.logger.debug("Added solution: {}".format(pPrintDict(sol)))
+                            yield sol, index, completed
+                self.stats.condition = None
 
                 if len(solutions) >= self.N:
                     if solution1 is None and solution2 is None:
                         break
-            self.logger.debug("Current solutions: {}".format([pPrintDict(x) for x in solutions]))
-
-            if (s.num_scopes() >= foundSolutions):
-                self.logger.info("will pop %s times", foundSolutions)
-                for i in range(foundSolutions):
-                    s.pop()
-                s.add(Not(expr))
-        return solutions
-    
-    
+                # A model which proves nothing may be a sign of conditions
+                # which cannot be shown at all
+                if self.prune and not progressed:
+                    keys = [i for i in unproven.keys() if i not in shown and i not in tried]
+                    tried.update(keys)
+                    self.pruneMasked(expr, dependencies, keys, unproven, masked)
+                # Nothing is blocked for a model which proves nothing, so the
+                # solver may keep returning such models
+                idle = 0 if progressed else idle + 1
+                if idle >= MAX_IDLE_MODELS:
+                    break
+                previous = try_solution
+                try_solution = engine.nextModel()
+                if not progressed and try_solution == previous:
+                    break
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Current solutions: {}".format([pPrintDict(solutions.toPython(x)) for x in solutions]))
+            engine.end()
+            if self.prune:
+                keys = [i for i in unproven.keys() if i not in shown and i not in tried]
+                self.pruneMasked(expr, dependencies, keys, unproven, masked)
+            self.stats.decision['masked'] = masked
+            self.setStatus(conditions, shown, masked)
+            self.endDecision()
@@ -0,0 +1,252 @@
+from z3 import *
+from collections import deque
+from utils import solutionKey, pairProofs
+
+"""
+Picks the smallest set of vectors showing every condition. Candidate
+independence pairs are collected for each condition first, then a covering
+set of vectors is chosen so that every condition has both vectors of one
+of its pairs in the set. The set is chosen greedily and, when it is larger
+than the N+1 lower bound, improved by Z3's Optimize within a time limit.
+
+Pairs are unique cause pairs: both vectors agree on every other condition.
+Pairs of different conditions then never form a cycle, so showing N
+conditions needs at least N+1 vectors.
+"""
+
+# Vectors explored per decision when collecting candidate pairs
+MAX_COVER_VECTORS = 64
+# Time limit of the exact search in milliseconds
+COVER_TIMEOUT = 5000
+# Larger candidate sets are only covered greedily
+MAX_EXACT_VECTORS = 1024
+
+def lowerBound(pairs):
+    shown = len([c for c in pairs if pairs[c]])
+    return shown + 1 if shown else 0
+
+"""
+Covers the conditions of pairs, a dict of condition to candidate pairs of
+vectors. Conditions whose pair is already selected are covered for free,
+otherwise the pair adding the fewest vectors is taken, preferring vectors
+which are part of pairs of more uncovered conditions.
+"""
+def greedyCover(pairs):
+    selected = []
+    chosen = set()
+    uncovered = set(c for c in pairs if pairs[c])
+    while uncovered:
+        useful = {}
+        for c in uncovered:
+            for a, b in pairs[c]:
+                useful[a] = useful.get(a, 0) + 1
+                useful[b] = useful.get(b, 0) + 1
+        best = None
+        for c in sorted(uncovered):
+            for pair in pairs[c]:
+                new = [x for x in pair if x not in chosen]
+                score = (len(new), -sum(useful[x] for x in new))
+                if best is None or score < best[0]:
+                    best = (score, c, new)
+        _, c, new = best
+        for x in new:
+            chosen.add(x)
+            selected.append(x)
+        uncovered = set(c for c in uncovered if not any(a in chosen and b in chosen for a, b in pairs[c]))
+    return selected
+
+"""
+Returns a cover with fewer than limit vectors, None if there is none, or
+False if Optimize gave up within timeout milliseconds
+"""
+def exactCover(pairs, limit, timeout=COVER_TIMEOUT):
+    vertices = sorted(set(x for c in pairs for pair in pairs[c] for x in pair))
+    ctx = Context()
+    chosen = {x:Bool('v{}'.format(i), ctx) for i, x in enumerate(vertices)}
+    opt = Optimize(ctx=ctx)
+    opt.set('timeout', timeout)
+    for c in pairs:
+        if pairs[c]:
+            opt.add(Or([And(chosen[a], chosen[b]) for a, b in pairs[c]]))
+    size = Sum([If(chosen[x], IntVal(1, ctx), IntVal(0, ctx)) for x in vertices])
+    opt.add(size < limit)
+    opt.minimize(size)
+    res = opt.check()
+    if res == unsat:
+        return None
+    if res != sat:
+        return False
+    model = opt.model()
+    return [x for x in vertices if is_true(model.eval(chosen[x], model_completion=True))]
+
+"""
+Returns the selected vectors, their lower bound and whether the selection
+is known to be minimal
+"""
+def minimalCover(pairs, timeout=COVER_TIMEOUT):
+    selected = greedyCover(pairs)
+    bound = lowerBound(pairs)
+    if len(selected) <= bound:
+        return selected, bound, True
+    vertices = set(x for c in pairs for pair in pairs[c] for x in pair)
+    if len(vertices) > MAX_EXACT_VECTORS:
+        return selected, bound, False
+    res = exactCover(pairs, len(selected), timeout)
+    if res is None:
+        return selected, bound, True
+    if res is False:
+        return selected, bound, False
+    order = dict((x, i) for i, x in enumerate(sorted(vertices)))
+    return sorted(res, key=order.get), bound, True
+
+"""
+Collects candidate pairs of a decision with the generator's solver and
+covers them. Starting from one vector of each outcome, it asks for the
+partner of every explored vector and condition: a vector which differs
+only in that condition and has the other outcome. Partners are explored in
+turn, so pairs of different conditions share vectors. A condition which
+no explored vector has a partner for, for example because another
+condition masks it in all of them, is seeded with a pair of its own.
+"""
+class CoverEngine:
+    def __init__(self, generator, solver):
+        self.generator = generator
+        self.solver = solver
+
+    def conditions(self, expr):
+        g = self.generator
+        _, names = g.constraints.dependentConstraints(expr)
+        return sorted(n for n in names if n in g.variables and n not in g.skipVar)
+
+    # Checks constraints in a new scope, returns the values of the conditions or None
+    def check(self, constraints):
+        s = self.solver
+        s.push()
+        s.add(constraints)
+        res = None
+        if s.check()==sat:
+            self.generator.stats.count('models')
+            model = s.model()
+            res = {k:model.eval(self.generator.variables[k], model_completion=True) for k in self.names}
+        s.pop()
+        return res
+
+    # Returns the values of vector except name, which its partners for name share
+    def signature(self, vector, name):
+        return name, frozenset((k, vector[k].get_id()) for k in self.names if k != name)
+
+    # Returns the existing vector for vector, adding it when it is new
+    def add(self, vector, outcome):
+        key = solutionKey(vector)
+        if key not in self.vectors:
+            self.vectors[key] = (vector, outcome)
+            self.order.append(key)
+            self.queue.append(key)
+            for name in self.names:
+                self.signatures.setdefault(self.signature(vector, name), []).append(key)
+        return key
+
+    # Returns a vector forming a pair for name with key, an explored one if possible
+    def partner(self, key, name):
+        vector, outcome = self.vectors[key]
+        for other in self.signatures[self.signature(vector, name)]:
+            if self.vectors[other][1] != outcome:
+                return other
+        v = self.generator.variables
+        constraints = [v[k] == vector[k] for k in self.names if k != name]
+        constraints.append(v[name] != vector[name])
+        constraints.append(Not(self.expr) if outcome else self.expr)
+        res = self.check(constraints)
+        return None if res is None else self.add(res, not outcome)
+
+    """
+    Asks for any pair of name. The second vector is the decision over
+    copies of name and of the funcCall and assignment variables, so that
+    only name and what depends on it may differ.
+    """
+    def seedPair(self, name):
+        g = self.generator
+        v = g.variables
+        copied = [name] + sorted(k for k in g.skipVar if k in v and is_const(v[k])
+                                 and v[k].decl().kind() == Z3_OP_UNINTERPRETED)
+        copies = [(v[k], FreshConst(v[k].sort(), k)) for k in copied]
+        constraints = [self.expr, Not(substitute(self.expr, *copies))]
+        constraints += [substitute(c, *copies) for c in self.dependencies]
+
+        s = self.solver
+        s.push()
+        s.add(constraints)
+        res = None
+        if s.check()==sat:
+            g.stats.count('models')
+            model = s.model()
+            first = {k:model.eval(v[k], model_completion=True) for k in self.names}
+            second = dict(first)
+            second[name] = model.eval(copies[0][1], model_completion=True)
+            res = (self.add(first, True), self.add(second, False))
+        s.pop()
+        return res
+
+    def explore(self, pairs, failed):
+        while self.queue and len(self.vectors) < MAX_COVER_VECTORS:
+            key = self.queue.popleft()
+            for name in self.names:
+                if (key, name) in failed:
+                    continue
+                self.generator.stats.condition = name
+                other = self.partner(key, name)
+                if other is None:
+                    failed.add((key, name))
+                    continue
+                # The partner is not asked for the condition it was found for
+                failed.add((other, name))
+                pair = (key, other) if self.vectors[key][1] else (other, key)
+                if pair not in pairs[name]:
+                    pairs[name].append(pair)
+        self.generator.stats.condition = None
+
+    """
+    Returns the vectors of a minimal cover of expr, the conditions which
+    could not be shown and a report of the cover size. The conditions each
+    vector shows are kept in proofs.
+    """
+    def solve(self, expr):
+        self.expr = expr
+        self.names = self.conditions(expr)
+        self.dependencies = self.generator.dependencies(expr)
+        self.solver.push()
+        self.solver.add(self.dependencies)
+        self.vectors = {}
+        self.order = []
+        self.queue = deque()
+        self.signatures = {}
+        pairs = {name:[] for name in self.names}
+        failed = set()
+        for outcome in [True, False]:
+            res = self.check([expr if outcome else Not(expr)])
+            if res is not None:
+                self.add(res, outcome)
+
+        self.explore(pairs, failed)
+        for name in self.names:
+            if pairs[name]:
+                continue
+            self.generator.stats.condition = name
+            pair = self.seedPair(name)
+            if pair is not None:
+                pairs[name].append(pair)
+                self.explore(pairs, failed)
+        self.generator.stats.condition = None
+        self.solver.pop()
+
+        # The exact search stays within the budget of the checks
+        timeout = self.solver.nextTimeout()
+        timeout = COVER_TIMEOUT if timeout is None else max(1, min(COVER_TIMEOUT, timeout))
+        position = {k:i for i, k in enumerate(self.order)}
+        pairs = {name:[(position[a], position[b]) for a, b in pairs[name]] for name in self.names}
+        selected, bound, optimal = minimalCover(pairs, timeout)
+        self.proofs = pairProofs(pairs, selected)
+        vectors = [self.vectors[self.order[i]][0] for i in selected]
+        unproven = [name for name in self.names if not pairs[name]]
+        report = {'size':len(vectors), 'lowerBound':bound, 'optimal':optimal, 'candidates':len(self.vectors)}
+        return vectors, unproven, report
@@ -0,0 +1,119 @@
+from z3 import *
+from utils import pairProofs
+
+"""
+Searches the pairs of a decision condition by condition instead of
+enumerating models. A single check asks for both vectors of a pair of one
+condition, as MCDCgenerator.pairConstraints states it: the decision over
+the variables and its negation over copies of the condition and of the
+funcCall and assignment variables. The first check of a condition asks
+for a pair which reuses a vector the decision has already, an accepted one
+or one of an earlier pair, so pairs share vectors. Only when there is none
+a second check asks for any pair, and when there is none either the
+condition is masked, ruled out by the unsat core of that check. So a
+decision of N conditions takes at most 2N checks.
+"""
+
+class PairEngine:
+    def __init__(self, generator, solver):
+        self.generator = generator
+        self.solver = solver
+
+    def conditions(self, expr):
+        g = self.generator
+        _, names = g.constraints.dependentConstraints(expr)
+        return sorted(n for n in names if n in g.variables and n not in g.skipVar)
+
+    # Returns the index of vector, adding it when it is new
+    def add(self, vector, outcome):
+        key = frozenset((k, vector[k].get_id()) for k in self.names if k in vector)
+        if key not in self.index:
+            self.index[key] = len(self.vectors)
+            self.vectors.append((vector, outcome))
+        return self.index[key]
+
+    # Returns the constraint that one vector of the pair is a known vector:
+    # the first if its outcome is true, else the second over the copies
+    def anchored(self, copies):
+        v = self.generator.variables
+        res = []
+        for vector, outcome in self.vectors:
+            if outcome:
+                res.append(And([v[k] == vector[k] for k in self.names if k in vector]))
+            else:
+                res.append(And([substitute(v[k], *copies) == vector[k] for k in self.names if k in vector]))
+        return Or(res)
+
+    """
+    Checks for a pair of name, one which reuses a known vector first.
+    Returns the pair as indices into self.vectors, the unsat core when
+    there is no pair or None when a check gave up.
+    """
+    def findPair(self, name):
+        g = self.generator
+        v = g.variables
+        tracked, copies = g.pairConstraints(self.expr, self.dependencies, name)
+        literals = [FreshBool('track', c.ctx) for c in tracked]
+        s = self.solver
+        s.push()
+        for lit, c in zip(literals, tracked):
+            s.add(Implies(lit, c))
+        res = None
+        if self.vectors:
+            anchor = FreshBool('anchor', self.expr.ctx)
+            s.add(Implies(anchor, self.anchored(copies)))
+            res = s.check(anchor, *literals)
+            if res == unsat and any(anchor.eq(x) for x in s.unsat_core()):
+                res = None
+        if res is None:
+            res = s.check(*literals)
+        if res == sat:
+            g.stats.count('models')
+            model = s.model()
+            first = {k:model.eval(v[k], model_completion=True) for k in self.names}
+            second = dict(first)
+            second[name] = model.eval(copies[0][1], model_completion=True)
+            res = (self.add(first, True), self.add(second, False))
+        elif res == unsat:
+            core = s.unsat_core()
+            res = [str(c) for lit, c in zip(literals, tracked) if any(lit.eq(x) for x in core)]
+        else:
+            res = None
+        s.pop()
+        return res
+
+    """
+    Returns the new vectors showing the conditions of expr, the conditions
+    a check gave up on and the masked conditions with their unsat core.
+    anchors are vectors the decision has already with their outcome, the
+    conditions in covered are not searched. The conditions each new vector
+    shows are kept in proofs.
+    """
+    def solve(self, expr, anchors=(), covered=()):
+        self.expr = expr
+        self.names = self.conditions(expr)
+        self.dependencies = self.generator.dependencies(expr)
+        self.vectors = []
+        self.index = {}
+        for vector, outcome in anchors:
+            self.add(vector, outcome)
+        known = len(self.vectors)
+        pairs = {}
+        unproven = []
+        masked = {}
+        for name in self.names:
+            if name in covered:
+                continue
+            self.generator.stats.condition = name
+            res = self.findPair(name)
+            if isinstance(res, tuple):
+                pairs[name] = [res]
+            elif res is None:
+                unproven.append(name)
+            else:
+                self.generator.logger.info("No independence pair for {}, ruled out by {}".format(name, res))
+                masked[name] = res
+        self.generator.stats.condition = None
+
+        self.proofs = pairProofs(pairs, range(len(self.vectors)))[known:]
+        return [vector for vector, _ in self.vectors[known:]], unproven, masked
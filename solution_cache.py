@@ -0,0 +1,100 @@
+import os, json, hashlib, sqlite3
+from z3 import *
+
+"""
+Persistent store of the vectors found for each decision, kept in a SQLite
+file. Entries are keyed by a fingerprint of the decision and evicted least
+recently used first when the file grows above maxBytes.
+"""
+
+CACHE_FILE = 'mcdc_cache.sqlite'
+DEFAULT_CACHE_SIZE = 64*1024*1024
+
+COMMUTATIVE_OPS = [Z3_OP_AND, Z3_OP_OR, Z3_OP_ADD, Z3_OP_MUL, Z3_OP_EQ, Z3_OP_DISTINCT,
+                   Z3_OP_IFF, Z3_OP_XOR]
+
+"""
+Returns an s-expression of e with the arguments of commutative operators
+sorted. simplify orders them by ast id, which depends on the history of
+the Z3 context, so its output alone is not stable between runs.
+"""
+def canonicalForm(e, memo=None):
+    memo = {} if memo is None else memo
+    key = e.get_id()
+    if key not in memo:
+        if not is_app(e) or e.num_args() == 0:
+            memo[key] = e.sexpr()
+        else:
+            args = [canonicalForm(c, memo) for c in e.children()]
+            if e.decl().kind() in COMMUTATIVE_OPS:
+                args.sort()
+            memo[key] = "({} {})".format(e.decl().name(), " ".join(args))
+    return memo[key]
+
+"""
+Fingerprints a decision by its cone of influence: its simplified
+expression, in which constants are values already, the sorts of the
+variables it uses, the constraints it depends on according to index, a
+ConstraintIndex, and which of its variables are in skipVar. The options
+which change the vectors found are part of it too. Variables outside the
+cone do not change the fingerprint.
+"""
+def fingerprint(expr, variables, index, options, skipVar=()):
+    dependent, names = index.dependentConstraints(expr)
+    form = {
+        'expr': canonicalForm(simplify(expr)),
+        'sorts': sorted((n, variables[n].sort().sexpr()) for n in names if n in variables),
+        'skipped': sorted(n for n in names if n in skipVar),
+        'constraints': sorted(canonicalForm(c) for c in dependent),
+        'options': options,
+    }
+    return hashlib.sha256(json.dumps(form, sort_keys=True).encode('utf-8')).hexdigest()
+
+class SolutionCache:
+    def __init__(self, cacheDir, maxBytes=DEFAULT_CACHE_SIZE):
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+        self.maxBytes = maxBytes
+        self.db = sqlite3.connect(os.path.join(cacheDir, CACHE_FILE))
+        self.db.execute('CREATE TABLE IF NOT EXISTS vectors '
+                        '(key TEXT PRIMARY KEY, value TEXT, size INTEGER, used INTEGER)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS vectors_used ON vectors (used)')
+        self.db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def lastUsed(self):
+        row = self.db.execute('SELECT MAX(used) FROM vectors').fetchone()
+        return (row[0] or 0) + 1
+
+    """Returns the serialized vectors stored for key or None"""
+    def get(self, key):
+        row = self.db.execute('SELECT value FROM vectors WHERE key=?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute('UPDATE vectors SET used=? WHERE key=?', (self.lastUsed(), key))
+        self.db.commit()
+        return json.loads(row[0])
+
+    def put(self, key, vectors):
+        value = json.dumps(vectors, sort_keys=True)
+        self.db.execute('INSERT OR REPLACE INTO vectors VALUES (?, ?, ?, ?)',
+                        (key, value, len(value), self.lastUsed()))
+        self.evict()
+        self.db.commit()
+
+    def evict(self):
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM vectors').fetchone()[0]
+        if total <= self.maxBytes:
+            return
+        rows = self.db.execute('SELECT key, size FROM vectors ORDER BY used').fetchall()
+        for key, size in rows:
+            if total <= self.maxBytes:
+                break
+            self.db.execute('DELETE FROM vectors WHERE key=?', (key,))
+            total -= size
+
+    def close(self):
+        self.db.close()
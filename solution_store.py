@@ -0,0 +1,118 @@
+from fractions import Fraction
+from z3 import *
+from int_types import bitVecToPython
+from data_types import nestValues
+
+"""
+Keeps the vectors accepted by MCDCgenerator. Variables are interned to
+columns and every vector is stored as a tuple of plain Python values, with
+None for the variables its model does not assign, so duplicates are found
+with a hash lookup. Vectors are only turned back into Z3 values or output
+values when they are handed out. toOutput nests the fields of struct and
+array variables, which have the shapes data_types gives them.
+"""
+
+"""
+Takes a z3 value and returns a hashable Python value for it. Rationals
+stay exact as Fractions, irrational algebraic numbers are kept as they are.
+"""
+def nativeValue(val):
+    # Every vector of a run goes through here, so the sort is looked up once
+    kind = val.sort_kind()
+    if kind == Z3_BOOL_SORT:
+        if is_true(val):
+            return True
+        if is_false(val):
+            return False
+    elif kind in [Z3_INT_SORT, Z3_BV_SORT]:
+        if is_int_value(val) or is_bv_value(val):
+            return val.as_long()
+    elif kind == Z3_REAL_SORT:
+        if is_rational_value(val):
+            return val.as_fraction()
+    elif is_string_value(val):
+        return val.as_string()
+    return val
+
+"""Takes a z3 variable and a value from nativeValue and recreates the z3 value"""
+def z3Value(var, val):
+    if is_expr(val):
+        return val
+    if is_bv(var):
+        return BitVecVal(val, var.size(), var.ctx)
+    elif is_bool(var):
+        return BoolVal(val, var.ctx)
+    elif is_int(var):
+        return IntVal(val, var.ctx)
+    elif is_real(var):
+        return RealVal(val, var.ctx)
+    elif is_string(var):
+        return StringVal(val, var.ctx)
+    else:
+        raise NotImplementedError(var)
+
+"""Converts a value of var from nativeValue the way z3TypeToPython converts z3 values"""
+def outputValue(var, val, unsigned=False):
+    if is_bv(var):
+        return bitVecToPython(BitVecVal(val, var.size(), var.ctx), unsigned)
+    if isinstance(val, Fraction):
+        return RealVal(val, var.ctx).as_decimal(10)
+    if is_expr(val):
+        return val.as_decimal(10)
+    return val
+
+class SolutionStore:
+    def __init__(self, variables, names, shapes={}, unsigned=()):
+        self.variables = variables
+        self.names = list(names)
+        self.shapes = shapes
+        self.unsigned = [name in unsigned for name in self.names]
+        self.columns = {name:i for i, name in enumerate(self.names)}
+        self.rows = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __contains__(self, sol):
+        return self.row(sol) in self.positions
+
+    """Returns whether the vector with the values of nativeValue is stored"""
+    def containsValues(self, values):
+        return self.valuesRow(values) in self.positions
+
+    """Takes a vector with the values of nativeValue and returns its row"""
+    def valuesRow(self, values):
+        row = [None] * len(self.names)
+        for k, v in values.iteritems():
+            row[self.columns[k]] = v
+        return tuple(row)
+
+    """Takes a solution dict of z3 values and returns its row"""
+    def row(self, sol):
+        res = [None] * len(self.names)
+        for k, v in sol.iteritems():
+            res[self.columns[k]] = nativeValue(v)
+        return tuple(res)
+
+    """Adds sol unless it is stored already, returns whether it was added"""
+    def add(self, sol):
+        row = self.row(sol)
+        if row in self.positions:
+            return False
+        self.positions[row] = len(self.rows)
+        self.rows.append(row)
+        return True
+
+    def toZ3(self, row):
+        return {self.names[i]:z3Value(self.variables[self.names[i]], v) for i, v in enumerate(row) if v is not None}
+
+    def toPython(self, row):
+        return {self.names[i]:outputValue(self.variables[self.names[i]], v, self.unsigned[i])
+                for i, v in enumerate(row) if v is not None}
+
+    def toOutput(self, row):
+        return nestValues(self.toPython(row), self.shapes)
@@ -0,0 +1,40 @@
+from z3 import *
+from tactics import createSolver
+
+"""
+Hands out the solver of every decision searched in this process. 'reset'
+keeps one solver per configuration and resets it before the next
+decision uses it, 'fresh' creates a new solver for every decision and
+'shared' keeps every assertion across decisions, so later decisions are
+solved under the negated expressions of the earlier ones and the solver
+grows with the run. Dropping the pool frees the solvers it holds. The
+solvers are created in the Z3 context ctx.
+"""
+
+LIFECYCLES = ['reset', 'fresh', 'shared']
+
+"""Returns the memory Z3 has allocated in megabytes"""
+def z3Memory():
+    return Z3_get_estimated_alloc_size() / float(2**20)
+
+class SolverPool:
+    def __init__(self, lifecycle, ctx=None):
+        assert lifecycle in LIFECYCLES
+        self.lifecycle = lifecycle
+        self.ctx = ctx
+        self.solvers = {}
+        self.created = 0
+        self.resets = 0
+
+    """Returns the solver of configuration for the next decision"""
+    def get(self, configuration):
+        if self.lifecycle == 'fresh' or configuration not in self.solvers:
+            self.solvers[configuration] = createSolver(configuration, self.ctx)
+            self.created += 1
+        elif self.lifecycle == 'reset':
+            self.solvers[configuration].reset()
+            self.resets += 1
+        return self.solvers[configuration]
+
+    def clear(self):
+        self.solvers = {}
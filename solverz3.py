@@ -1,9 +1,22 @@
-import sys, logging, argparse, timeit
+import sys, logging, argparse
+
+# The client of the solver daemon does not need Z3, so it starts before Z3 is imported
+if __name__== "__main__" and '--connect' in sys.argv[1:]:
+  import daemon
+  sys.exit(daemon.client(sys.argv[1:]))
+
 from itertools import islice
-import json
+import json, csv
 from utils import printTruthTable, showLog, z3TypeToPython
 from classes import FuncCall, Variable, Constant, Assignment, DataType, DataMember
 from mcdc_gen import MCDCgenerator
+from engines import ENGINES
+from solution_cache import DEFAULT_CACHE_SIZE
+from tactics import TACTICS, CONFIGURATIONS
+from solver_pool import LIFECYCLES
+from int_types import INT_ENCODINGS
+from z3math import MATH_MODES, DEFAULT_SEGMENTS
+from data_types import nestValues
 
 logging.basicConfig(stream=sys.stderr, level=logging.WARNING)
 logger = logging.getLogger()
@@ -12,45 +25,171 @@ def chunk(it, size):
     it = iter(it)
     return iter(lambda: tuple(islice(it, size)), ())
 
-def calculate(variables, expressions, funcCalls, dataTypes, parallel=False):
-  generator = MCDCgenerator(variables, expressions, funcCalls, dataTypes, parallel)
+# When stats is a dict it is filled with the counters collected by the generator
+def calculate(variables, expressions, funcCalls, dataTypes, parallel=False, stats=None, **options):
+  generator = MCDCgenerator(variables, expressions, funcCalls, dataTypes, parallel, **options)
   generator.setLogLevel(logger.getEffectiveLevel())
 
   logger.debug(generator)
 
-  if showLog():
-    start = timeit.timeit()
+  store = generator.findVectors()
 
-  solutions = generator.findSolutions()
-    
-  if showLog():
-    end = timeit.timeit()
-    logger.info("Time elapsed: {}ms".format(end - start))
+  if stats is not None:
+    stats.update(generator.stats.toDict())
 
   if showLog():
-    printTruthTable(solutions, generator.variables)
+    totals = generator.stats.totals()
+    logger.info("Time elapsed: {:.1f}ms, {} checks taking {:.1f}ms".format(
+      totals['time']*1000, totals['checks'], totals['checkTime']*1000))
+    if totals['evaluated']:
+      logger.info("{} pair queries answered by evaluation instead of the solver".format(totals['evaluated']))
+    reuse = generator.stats.reuse()
+    if reuse['previous']:
+      logger.info("Reused {} previous test cases covering {} conditions, {} expressions without the solver".format(
+        reuse['reused'], reuse['conditions'], reuse['decisions']))
+    for logic, configurations in sorted(generator.stats.logics().items()):
+      for name, c in sorted(configurations.items()):
+        logger.info("{}: {} solved {} expressions in {:.1f}ms, raced {} times".format(
+          logic, name, c['decisions'], c['time']*1000, c['raced']))
+    printTruthTable([store.toPython(row) for row in store], generator.variables)
 
-  return solutions
+  return store
 
 def chunks(l, n):
   n = max(1, n)
   return (l[i:i+n] for i in xrange(0, len(l), n))
 
-def main(variables, expressions, funcCalls, dataTypes, parallel=False):
-  results = calculate(variables, expressions, funcCalls, dataTypes, parallel)
-  logger.info("found {} test cases".format(len(results)))
-  for r in results:
-    for k,v in r.iteritems():
-      r[k] = z3TypeToPython(v)
-  return results
+# Yields every test case of generator as soon as it is found, with the
+# index of its expression and the variables it shows
+def results(generator):
+  for sol, index, conditions in generator.iterSolutions():
+    vector = nestValues({k:z3TypeToPython(v, k in generator.unsigned) for k, v in sol.items()}, generator.shapes)
+    yield {'decision':index, 'conditions':conditions, 'vector':vector}
+
+# Writes every test case to out as a line of JSON as soon as it is found
+def stream(out, variables, expressions, funcCalls, dataTypes, parallel=False, stats=None, **options):
+  generator = MCDCgenerator(variables, expressions, funcCalls, dataTypes, parallel, **options)
+  generator.setLogLevel(logger.getEffectiveLevel())
+  count = 0
+  for res in results(generator):
+    out.write(json.dumps(res, separators=(',', ':')) + '\n')
+    out.flush()
+    count += 1
+  logger.info("found {} test cases".format(count))
+  if stats is not None:
+    stats.update(generator.stats.toDict())
+
+def main(variables, expressions, funcCalls, dataTypes, parallel=False, stats=None, **options):
+  store = calculate(variables, expressions, funcCalls, dataTypes, parallel, stats, **options)
+  logger.info("found {} test cases".format(len(store)))
+  return [store.toOutput(row) for row in store]
+
+# Converts a cell of a CSV test suite, a JSON value or True or False
+def csvValue(cell):
+  if cell in ['True', 'False']:
+    return cell == 'True'
+  try:
+    return json.loads(cell)
+  except ValueError:
+    return cell
+
+# Reads the test cases of an earlier run, written with or without --ndjson,
+# as a list of test cases for every expression. A JSON array does not say
+# which expression its test cases belong to, they are tried for all of them,
+# and so are the rows of a CSV file with the variable names as header.
+# Empty cells leave their variable out.
+def loadPrevious(path):
+  res = [[]]
+  if path.endswith('.csv'):
+    with open(path) as f:
+      res[0] = [{k:csvValue(v) for k, v in row.items() if v != ''} for row in csv.DictReader(f)]
+    return res
+  with open(path) as f:
+    for line in f:
+      if not line.strip():
+        continue
+      data = json.loads(line)
+      if isinstance(data, list):
+        res[0].extend(data)
+      elif 'vector' in data:
+        while len(res) <= data['decision']:
+          res.append([])
+        res[data['decision']].append(data['vector'])
+  return res
+
+# Creates the inputs of MCDCgenerator from the values of the command line arguments
+def parseInputs(var, const=[], assign=[], funcCallDef=[], funcCallExpr=[], typeDecl=[]):
+  tmp = [x.split(',', 1) for x in list(set(var))]
+  variables = [Variable(y[0],y[1]) for y in tmp]
+  variables += [Constant(y[0], y[1], y[2]) for y in [x.split(',', 2) for x in const]]
+  variables += [Assignment(y[0], y[1], y[2]) for y in [x.split(',', 2) for x in assign]]
+
+  funcCallDef = {y[1]:[y[0]] for y in [x.split(',', 1) for x in funcCallDef]}
+  for x in [x.split(',', 1) for x in funcCallExpr]:
+    funcCallDef[x[0]].append(x[1])
+
+  funcCalls = [FuncCall(v[0], k, v[1:]) for k,v in funcCallDef.items()]
+
+  dataTypes = {}
+  for x in [x.split(",") for x in typeDecl]:
+    members = [DataMember(y[0], y[1]) for y in chunk(x[1:],2)]
+    dataTypes[x[0]] = DataType(x[0], members)
+  return variables, funcCalls, dataTypes
     
-if __name__== "__main__":
+def createParser():
   parser = argparse.ArgumentParser(description='Find test cases satisfying given expressions.')
   parser.add_argument('-v', '--verbose', dest='verbosity', action='count',
                   help='enable INFO or DEBUG logger messages depending on verbosity level')
   parser.add_argument('-p', '--parallel', dest='parallel', action='store_const',
                   const=True, default=False,
                   help='run subgoals in parallel (default: no parallel subgoals)')
+  parser.add_argument('-j', '--jobs', dest='workers', type=int, default=1,
+                  help='solve each expression in its own worker process, using up to JOBS processes (default: 1)')
+  parser.add_argument('-pj', '--pairJobs', dest='pairWorkers', type=int, default=1,
+                  help='solve the independence pair queries of an expression in up to PAIRJOBS worker processes, at most one per CPU (default: 1)')
+  parser.add_argument('--engine', choices=ENGINES, default='pushpop',
+                  help='solving engine: push/pop scopes per query, assumptions over tracked literals, structural derivation from the expression tree or one pair query per condition (default: pushpop)')
+  parser.add_argument('--cache-dir', dest='cacheDir', default=None,
+                  help='keep the test cases of every expression in a cache in CACHEDIR and reuse them while the expression is unchanged')
+  parser.add_argument('--cache-size', dest='cacheSize', type=int, default=DEFAULT_CACHE_SIZE//(1024*1024),
+                  help='maximum size of the cache in MB, least recently used entries are evicted first (default: %(default)s)')
+  parser.add_argument('--minimize', action='store_true',
+                  help='collect candidate independence pairs first and return the smallest set of test cases covering them')
+  parser.add_argument('--timeout', dest='checkTimeout', type=int, default=None,
+                  help='give up on a single solver check after TIMEOUT milliseconds')
+  parser.add_argument('--decision-budget', dest='decisionBudget', type=float, default=None,
+                  help='stop searching an expression after DECISIONBUDGET seconds and keep the test cases found so far')
+  parser.add_argument('--deadline', type=float, default=None,
+                  help='stop searching after DEADLINE seconds for the whole run and keep the test cases found so far')
+  parser.add_argument('--tactic', choices=TACTICS + sorted(CONFIGURATIONS), default='default',
+                  help='solver per expression: one shared default solver, one chosen by the logic of each expression (auto), a race of the configurations for the logic in separate processes (portfolio) or the given configuration (default: %(default)s)')
+  parser.add_argument('--int-encoding', dest='intEncoding', choices=INT_ENCODINGS, default='int',
+                  help='encode int variables as unbounded integers (int) or as bit-vectors of the given C type; variables can also be declared with these types directly, for example: int32,x (default: %(default)s)')
+  parser.add_argument('--solver-lifecycle', dest='solverLifecycle', choices=LIFECYCLES, default='reset',
+                  help='start every expression on its solver after a reset (reset) or on a new solver (fresh), or keep the constraints of the earlier expressions (shared) (default: %(default)s)')
+  parser.add_argument('--memory-limit', dest='memoryLimit', type=float, default=None,
+                  help='drop the solvers after an expression once Z3 uses more than MEMORYLIMIT megabytes')
+  parser.add_argument('--math', dest='mathMode', choices=MATH_MODES, default='exact',
+                  help='model pow, exp and sqrt as exact nonlinear terms (exact), or model them and sin, cos and tan as variables with range and monotonicity axioms (uf) and in addition piecewise linear bounds (pwl); test cases found with a model other than exact terms are checked with floating point math (default: %(default)s)')
+  parser.add_argument('--math-segments', dest='mathSegments', type=int, default=DEFAULT_SEGMENTS,
+                  help='number of pieces of the piecewise linear bounds and points of the monotonicity axioms per function (default: %(default)s)')
+  parser.add_argument('--no-flip', dest='flip', action='store_false',
+                  help='ask the solver every independence pair query instead of first flipping the variable in the test case and evaluating the expression')
+  parser.add_argument('--no-prune', dest='prune', action='store_false',
+                  help='keep searching for variables which no independence pair can show instead of dropping them once an unsat core proves it')
+  previous = parser.add_mutually_exclusive_group()
+  previous.add_argument('--previous', default=None,
+                  help='output of an earlier run, with or without --ndjson; its test cases are checked against the expressions again and only the variables they do not show any more are solved for')
+  previous.add_argument('--suite', default=None,
+                  help='existing test cases as a JSON array, NDJSON or CSV rows keyed by variable name; only the variables they do not show are solved for and only the missing test cases are written, except with the tree engine or --minimize, which solve every expression again')
+  parser.add_argument('--coverage', nargs='?', const='-', default=None,
+                  help='write which variables of every expression the previous test cases show, which the new ones show and which are missing as JSON to COVERAGE, or as a line after the results when no file is given')
+  parser.add_argument('--ndjson', action='store_true',
+                  help='write every test case as a line of JSON as soon as it is found, with the index of its expression and the variables it shows')
+  parser.add_argument('--stats', nargs='?', const='-', default=None,
+                  help='write solver statistics as JSON to STATS, or as a second line after the results when no file is given')
+  parser.add_argument('--connect', default=None, metavar='SOCKET',
+                  help='send the job to the solver daemon listening on SOCKET instead of solving it in this process, see daemon.py')
   parser.add_argument('--var', nargs='+',
                   help='one or more variables and their id, for example: int,x bool,y real,z')
   parser.add_argument('-a', '--assign', nargs='+', default=[],
@@ -64,37 +203,48 @@ if __name__== "__main__":
   parser.add_argument('-fce', '--funcCallExpr', nargs='+', default=[],
                       help="one or more function call expressions to pass to solver, for example: \"Foo(int)\",\"5>v['t']\". Format is (funcCall, expr)")
   parser.add_argument('-td', '--typeDecl', nargs='+', default=[],
-                      help="one or more types to have the solver declare, for example: Foo,var,Bar. Format is (typeName, memberName, memberType)")
- 
-  args = parser.parse_args()
-  parallel = args.parallel
-  verbosity = args.verbosity
-  tmp = [x.split(',', 1) for x in list(set(args.var))]
-  variables = [Variable(y[0],y[1]) for y in tmp]
-  variables += [Constant(y[0], y[1], y[2]) for y in [x.split(',', 2) for x in args.const]]
-  variables += [Assignment(y[0], y[1], y[2]) for y in [x.split(',', 2) for x in args.assign]]
-  
-  expr = args.expr
+                      help="one or more struct types, for example: Point,x,int,y,real. Format is (typeName, memberName, memberType, ...). Variables of these types and arrays such as int[4] are solved over their fields")
+  return parser
 
-  funcCallDef = {y[1]:[y[0]] for y in [x.split(',', 1) for x in args.funcCallDef]} 
-  for x in [x.split(',', 1) for x in args.funcCallExpr]:
-    funcCallDef[x[0]].append(x[1])
+# Returns the keyword arguments of MCDCgenerator given on the command line
+def createOptions(args):
+  return {'_workers':args.workers, '_pairWorkers':args.pairWorkers, '_engine':args.engine,
+          '_cacheDir':args.cacheDir, '_cacheSize':args.cacheSize*1024*1024, '_minimize':args.minimize,
+          '_checkTimeout':args.checkTimeout, '_decisionBudget':args.decisionBudget, '_deadline':args.deadline,
+          '_tactic':args.tactic, '_intEncoding':args.intEncoding, '_solverLifecycle':args.solverLifecycle,
+          '_memoryLimit':args.memoryLimit, '_previous':loadPrevious(args.previous or args.suite)
+          if args.previous or args.suite else None, '_flip':args.flip, '_prune':args.prune,
+          '_gaps':args.suite is not None, '_mathMode':args.mathMode, '_mathSegments':args.mathSegments}
 
-  funcCalls = [FuncCall(v[0], k, v[1:]) for k,v in funcCallDef.items()]
-
-  dataTypes = {}
-  for x in [x.split(",") for x in args.typeDecl]:
-    members = [DataMember(y[0], y[1]) for y in chunk(x[1:],2)]
-    dataTypes[x[0]] = DataType(x[0], members)
+if __name__== "__main__":
+  args = createParser().parse_args()
+  parallel = args.parallel
+  verbosity = args.verbosity
   
   if verbosity == 2:
     logger.setLevel(logging.DEBUG)
   elif verbosity == 1:
     logger.setLevel(logging.INFO)
 
-  result = main(variables, args.expr, funcCalls, dataTypes, parallel)
-  
-  print json.dumps(result, separators=(',', ':'))
+  variables, funcCalls, dataTypes = parseInputs(args.var, args.const, args.assign, args.funcCallDef,
+                                                args.funcCallExpr, args.typeDecl)
+  options = createOptions(args)
+  stats = {} if args.stats is not None or args.coverage is not None else None
+  if args.ndjson:
+    stream(sys.stdout, variables, args.expr, funcCalls, dataTypes, parallel, stats, **options)
+  else:
+    result = main(variables, args.expr, funcCalls, dataTypes, parallel, stats, **options)
+    print json.dumps(result, separators=(',', ':'))
+  if args.stats == '-':
+    print json.dumps(stats, separators=(',', ':'), sort_keys=True)
+  elif args.stats is not None:
+    with open(args.stats, 'w') as f:
+      json.dump(stats, f, indent=2, sort_keys=True)
+  if args.coverage == '-':
+    print json.dumps(stats['coverage'], separators=(',', ':'), sort_keys=True)
+  elif args.coverage is not None:
+    with open(args.coverage, 'w') as f:
+      json.dump(stats['coverage'], f, indent=2, sort_keys=True)
 
 
 ####
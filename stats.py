@@ -0,0 +1,203 @@
+import time
+from z3 import unknown
+
+"""
+Counters collected by MCDCgenerator while it searches for vectors. Every
+decision gets a record with its counters and the counters of each of its
+conditions. Solver calls are counted by InstrumentedSolver, which adds
+them to the current decision and condition.
+"""
+
+# evaluated counts the pair queries answered without the solver
+COUNTERS = ['checks', 'sat', 'unsat', 'unknown', 'checkTime', 'pushes', 'pops', 'maxDepth',
+            'models', 'accepted', 'duplicates', 'evaluated']
+
+def newCounters():
+    return {k:0 for k in COUNTERS}
+
+"""Returns the statistics Z3 keeps for solver as a dict"""
+def z3Statistics(solver):
+    st = solver.statistics()
+    return {k:st.get_key_value(k) for k in st.keys()}
+
+class SolverStats:
+    def __init__(self):
+        self.decisions = []
+        self.decision = None
+        self.condition = None
+        self.depth = 0
+        self.time = 0.0
+        self.z3 = {}
+
+    def beginDecision(self, index, method):
+        self.decision = dict(newCounters(), index=index, method=method, time=0.0, conditions={})
+        self.decisions.append(self.decision)
+        self.start = time.time()
+
+    def endDecision(self, solver=None):
+        self.decision['time'] = time.time() - self.start
+        if solver is not None:
+            self.decision['z3'] = z3Statistics(solver)
+        self.decision = None
+        self.condition = None
+
+    """
+    Adds the record of a decision which was solved elsewhere, in a worker
+    process or an earlier run. Vectors which an earlier decision already
+    found count as duplicates instead of accepted.
+    """
+    def addDecision(self, record, index, added):
+        record = dict(record, index=index)
+        record['duplicates'] += record['accepted'] - added
+        record['accepted'] = added
+        self.decisions.append(record)
+
+    # Returns the counters the current solver call is added to
+    def current(self):
+        if self.decision is None:
+            return []
+        if self.condition is None:
+            return [self.decision]
+        conditions = self.decision['conditions']
+        if self.condition not in conditions:
+            conditions[self.condition] = newCounters()
+        return [self.decision, conditions[self.condition]]
+
+    def count(self, key, n=1):
+        for c in self.current():
+            c[key] += n
+
+    def check(self, result, elapsed):
+        for c in self.current():
+            c['checks'] += 1
+            c[str(result)] += 1
+            c['checkTime'] += elapsed
+
+    def push(self):
+        self.depth += 1
+        for c in self.current():
+            c['pushes'] += 1
+            c['maxDepth'] = max(c['maxDepth'], self.depth)
+
+    def pop(self, num):
+        self.depth -= num
+        self.count('pops', num)
+
+    def totals(self):
+        res = newCounters()
+        for d in self.decisions:
+            for k in COUNTERS:
+                res[k] = max(res[k], d[k]) if k == 'maxDepth' else res[k] + d[k]
+        res['time'] = self.time
+        return res
+
+    """
+    Returns for every logic and solver configuration the number of
+    decisions it solved, their time and the number of portfolio races it
+    took part in
+    """
+    def logics(self):
+        res = {}
+        for d in self.decisions:
+            if 'logic' not in d:
+                continue
+            configurations = res.setdefault(d['logic'], {})
+            for c in d.get('portfolio', []) + [d['configuration']]:
+                configurations.setdefault(c, {'decisions':0, 'time':0.0, 'raced':0})
+            for c in d.get('portfolio', []):
+                configurations[c]['raced'] += 1
+            configurations[d['configuration']]['decisions'] += 1
+            configurations[d['configuration']]['time'] += d['time']
+        return res
+
+    """
+    Returns how much of a previous run was reused: the previous vectors
+    tried and reused, the conditions they still covered and the decisions
+    solved without the solver
+    """
+    def reuse(self):
+        res = {'previous':0, 'reused':0, 'conditions':0, 'decisions':0}
+        for d in self.decisions:
+            if 'reuse' not in d:
+                continue
+            res['previous'] += d['reuse']['previous']
+            res['reused'] += d['reuse']['reused']
+            res['conditions'] += len(d['reuse']['conditions'])
+            if d['reuse']['reused'] and d['checks'] == 0:
+                res['decisions'] += 1
+        return res
+
+    """
+    Returns the coverage of every decision: the conditions the previous
+    vectors show, those shown by new vectors, those no pair can show and
+    those still missing, with the number of conditions in each group over
+    all decisions
+    """
+    def coverage(self):
+        decisions = []
+        totals = {'covered':0, 'added':0, 'masked':0, 'missing':0}
+        for d in self.decisions:
+            covered = set(d.get('reuse', {}).get('conditions', []))
+            status = d.get('status', {})
+            res = {'decision':d['index'], 'covered':sorted(covered),
+                   'added':sorted(c for c in status if status[c] == 'proven' and c not in covered),
+                   'masked':sorted(c for c in status if status[c] == 'masked'),
+                   'missing':sorted(c for c in status if status[c] in ['unproven', 'unknown'])}
+            for k in totals:
+                totals[k] += len(res[k])
+            decisions.append(res)
+        return {'decisions':decisions, 'totals':totals}
+
+    def toDict(self):
+        return {'decisions':self.decisions, 'totals':self.totals(), 'z3':self.z3, 'logics':self.logics(),
+                'reuse':self.reuse(), 'coverage':self.coverage()}
+
+"""
+Wraps a z3 Solver and counts its checks, their outcome and time and the
+push/pop depth in stats. Everything else is passed on to the solver.
+Checks give up after timeout milliseconds and once deadline, a time.time()
+value, has passed they return unknown without calling the solver.
+"""
+class InstrumentedSolver:
+    def __init__(self, solver, stats):
+        self.solver = solver
+        self.stats = stats
+        self.timeout = None
+        self.deadline = None
+
+    def __getattr__(self, name):
+        return getattr(self.solver, name)
+
+    def __repr__(self):
+        return repr(self.solver)
+
+    # Returns the timeout of the next check in milliseconds or None without limits
+    def nextTimeout(self):
+        res = self.timeout
+        if self.deadline is not None:
+            remaining = int((self.deadline - time.time()) * 1000)
+            res = remaining if res is None else min(res, remaining)
+        return res
+
+    def expired(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def check(self, *assumptions):
+        timeout = self.nextTimeout()
+        if timeout is not None:
+            if timeout <= 0:
+                self.stats.check(unknown, 0.0)
+                return unknown
+            self.solver.set('timeout', timeout)
+        start = time.time()
+        res = self.solver.check(*assumptions)
+        self.stats.check(res, time.time() - start)
+        return res
+
+    def push(self):
+        self.stats.push()
+        self.solver.push()
+
+    def pop(self, num=1):
+        self.stats.pop(num)
+        self.solver.pop(num)
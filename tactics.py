@@ -0,0 +1,136 @@
+from z3 import *
+
+"""
+Picks the solver configuration for a decision from the logic of its
+constraints. 'default' keeps one shared Solver() for every decision,
+'auto' creates the configuration of the decision's logic for each
+decision and 'portfolio' races the configurations of the decision's logic
+in separate processes. Any configuration name uses that configuration for
+every decision.
+"""
+
+TACTICS = ['default', 'auto', 'portfolio']
+
+LOGICS = ['BOOL', 'QF_LIA', 'QF_LRA', 'QF_LIRA', 'QF_NIA', 'QF_NRA', 'QF_NIRA', 'QF_S', 'QF_BV', 'QF_BVLIRA']
+
+# Each creates its solver in the Z3 context it is given
+CONFIGURATIONS = {
+    'default': lambda ctx: Solver(ctx=ctx),
+    'sat': lambda ctx: Then('simplify', 'propagate-values', 'tseitin-cnf', 'sat', ctx=ctx).solver(),
+    'lia': lambda ctx: SolverFor('QF_LIA', ctx=ctx),
+    'lra': lambda ctx: SolverFor('QF_LRA', ctx=ctx),
+    'nia': lambda ctx: SolverFor('QF_NIA', ctx=ctx),
+    'nlsat': lambda ctx: Tactic('qfnra-nlsat', ctx).solver(),
+    'nra': lambda ctx: SolverFor('QF_NRA', ctx=ctx),
+    'strings': lambda ctx: SolverFor('QF_S', ctx=ctx),
+    'bv': lambda ctx: SolverFor('QF_BV', ctx=ctx),
+    'bit-blast': lambda ctx: Then('simplify', 'propagate-values', 'bit-blast', 'tseitin-cnf', 'sat', ctx=ctx).solver(),
+    'lira': lambda ctx: SolverFor('QF_LIRA', ctx=ctx),
+    'nira': lambda ctx: SolverFor('QF_NIRA', ctx=ctx),
+    'smt': lambda ctx: Then('simplify', 'propagate-values', 'smt', ctx=ctx).solver(),
+}
+
+# The logics each configuration decides, default decides every logic
+CONFIGURATION_LOGICS = {
+    'sat': ['BOOL'],
+    'lia': ['BOOL', 'QF_LIA'],
+    'lra': ['BOOL', 'QF_LRA'],
+    'nia': ['BOOL', 'QF_LIA', 'QF_NIA'],
+    'nlsat': ['BOOL', 'QF_LRA', 'QF_NRA'],
+    'nra': ['BOOL', 'QF_LRA', 'QF_NRA'],
+    'strings': ['BOOL', 'QF_S'],
+    'bv': ['BOOL', 'QF_BV'],
+    'bit-blast': ['BOOL', 'QF_BV'],
+    'lira': ['BOOL', 'QF_LIA', 'QF_LRA', 'QF_LIRA'],
+    'nira': ['BOOL', 'QF_LIA', 'QF_LRA', 'QF_LIRA', 'QF_NIA', 'QF_NRA', 'QF_NIRA'],
+}
+
+# The configuration auto picks for each logic
+AUTO_CONFIGURATIONS = {
+    'BOOL': 'sat',
+    'QF_LIA': 'lia',
+    'QF_LRA': 'lra',
+    'QF_LIRA': 'default',
+    'QF_NIA': 'nia',
+    'QF_NRA': 'nlsat',
+    'QF_NIRA': 'default',
+    'QF_S': 'strings',
+    'QF_BV': 'bv',
+    'QF_BVLIRA': 'default',
+}
+
+# The configurations portfolio races for each logic, all of which fit it
+PORTFOLIOS = {
+    'BOOL': ['sat', 'default'],
+    'QF_LIA': ['lia', 'default'],
+    'QF_LRA': ['lra', 'default'],
+    'QF_LIRA': ['default', 'lira'],
+    'QF_NIA': ['nia', 'default'],
+    'QF_NRA': ['nlsat', 'nra', 'default'],
+    'QF_NIRA': ['default', 'nira'],
+    'QF_S': ['strings', 'default'],
+    'QF_BV': ['bv', 'bit-blast', 'default'],
+    'QF_BVLIRA': ['default', 'smt'],
+}
+
+NONLINEAR_OPS = [Z3_OP_MUL, Z3_OP_DIV, Z3_OP_IDIV, Z3_OP_MOD, Z3_OP_REM, Z3_OP_POWER]
+
+def isNumeral(e):
+    return is_int_value(e) or is_rational_value(e)
+
+# Returns whether e is nonlinear on its own, not counting its arguments
+def isNonlinear(e):
+    kind = e.decl().kind()
+    if kind not in NONLINEAR_OPS:
+        return False
+    if kind == Z3_OP_POWER:
+        return not isNumeral(e.arg(0)) or not isNumeral(e.arg(1))
+    if kind == Z3_OP_MUL:
+        return len([a for a in e.children() if not isNumeral(a)]) > 1
+    # Division by a numeral stays linear
+    return not isNumeral(e.arg(1))
+
+"""Returns the logic of the conjunction of constraints, one of LOGICS"""
+def classifyLogic(constraints):
+    ints = reals = strings = bitvecs = nonlinear = False
+    seen = set()
+    todo = list(constraints)
+    while todo:
+        e = todo.pop()
+        if e.get_id() in seen:
+            continue
+        seen.add(e.get_id())
+        if is_int(e):
+            ints = True
+        elif is_real(e):
+            reals = True
+        elif is_string(e):
+            strings = True
+        elif is_bv(e):
+            bitvecs = True
+        if is_app(e):
+            nonlinear = nonlinear or isNonlinear(e)
+            todo.extend(e.children())
+    if strings:
+        return 'QF_S'
+    if bitvecs:
+        return 'QF_BVLIRA' if ints or reals else 'QF_BV'
+    if not ints and not reals:
+        return 'BOOL'
+    return 'QF_{}{}{}A'.format('N' if nonlinear else 'L', 'I' if ints else '', 'R' if reals else '')
+
+# Creates the solver of configuration in the Z3 context ctx, the main
+# context by default
+def createSolver(configuration, ctx=None):
+    return CONFIGURATIONS[configuration](ctx)
+
+def fits(configuration, logic):
+    return configuration not in CONFIGURATION_LOGICS or logic in CONFIGURATION_LOGICS[configuration]
+
+"""Returns the configuration tactic uses for a decision of logic"""
+def chooseConfiguration(tactic, logic):
+    if tactic in CONFIGURATIONS:
+        return tactic
+    if tactic == 'auto':
+        return AUTO_CONFIGURATIONS[logic]
+    return 'default'
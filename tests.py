@@ -1,116 +1,1114 @@
-import unittest
-from utils import createExpression, createVar
-from mcdc_gen import MCDCgenerator
+import sys, unittest, tempfile, shutil, time, json, threading, math
+from StringIO import StringIO
+from fractions import Fraction
+from z3 import *
+from utils import createExpression, createVar, createFunctionCall
+from mcdc_gen import MCDCgenerator, _checkPairs
+from classes import Variable, Constant, Assignment, FuncCall
+from truth_table import isTruthTableDecision, truthTableSolutions
+from tree_mcdc import TreeEngine, SiblingMerge, mergeWitnesses
+from solution_cache import SolutionCache
+from constraint_index import ConstraintIndex
+from expr_parser import SyntaxTable, ExpressionBuilder, ParseError
+from benchmark import CASE_DEFAULTS, generateDecision, compare
+from stats import COUNTERS
+from min_cover import greedyCover, exactCover, minimalCover
+from solverz3 import stream, main, results, loadPrevious
+from solution_store import SolutionStore
+from tactics import classifyLogic, fits, PORTFOLIOS, LOGICS
+from int_types import createBitVec
+from utils import z3TypeToPython
+from daemon import SolverServer, request, client
+from z3math import MathModel
+from data_types import scalarize, nestValues, flattenValues
+from classes import DataType, DataMember
+from solver_pool import SolverPool
+from flip_eval import UNDECIDED, Evaluator, flipPair
+
+# The vectors showing both conditions of And(A,B)
+AND_VECTORS = [{'A':True, 'B':True}, {'A':False, 'B':True}, {'A':True, 'B':False}]
+
+# Runs the jobs of a pool in this process
+class InlinePool:
+    def map(self, func, iterable, chunksize=None):
+        return map(func, iterable)
+
+# Returns a generator for the expressions over the Boolean variables names
+def boolGenerator(names, expressions, **options):
+    return MCDCgenerator([Variable('bool', n) for n in names], expressions, [], {}, **options)
 
 class TestMCDC(unittest.TestCase):
 
-    def setUp(self):
-        self.generator = MCDCgenerator()
-        
-    def tearDown(self):
-        self.generator.solver.reset()
+    # Solves expr over the Boolean variables names with the search instead
+    # of the truth table
+    def findSolutions(self, names, expr):
+        return boolGenerator(names, [expr], _truthTable=False).findSolutions()
 
     def testLogicalNot(self):
-        gen = self.generator
-        varsToAdd = [('bool', 'A')]
-        gen.addVariables(varsToAdd)
-        exprToAdd = "Not(v['A'])"
-        expression = createExpression(gen.variables, exprToAdd)
-        res = gen.findSolutions(expression)
-        expected = [{'A':True}, {'A':False}]
-        self.assertEquals(len(res), 2)
-        for exp in expected:
-            self.assertTrue(exp in res)
+        res = self.findSolutions('A', "Not(v['A'])")
+        self.assertItemsEqual(res, [{'A':True}, {'A':False}])
 
     def testLogicalAnd(self):
-        gen = self.generator
-        varsToAdd = [('bool', 'A'), ('bool', 'B')]
-        gen.addVariables(varsToAdd)
-        exprToAdd = "And(v['A'],v['B'])"
-        expression = createExpression(gen.variables, exprToAdd)
-        res = gen.findSolutions(expression)
-        expected = [
-            {'A' : True, 'B' : True},
-            {'A' : False, 'B' : True},
-            {'A' : True, 'B' : False}]
-        self.assertEquals(len(res), 3)
-        for exp in expected:
-            self.assertTrue(exp in res)
+        res = self.findSolutions('AB', "And(v['A'],v['B'])")
+        self.assertItemsEqual(res, AND_VECTORS)
 
     def testLogicalOr(self):
-        gen = self.generator
-        varsToAdd = [('bool', 'A'), ('bool', 'B')]
-        gen.addVariables(varsToAdd)
-        exprToAdd = "Or(v['A'],v['B'])"
-        expression = createExpression(gen.variables, exprToAdd)
-        res = gen.findSolutions(expression)
+        res = self.findSolutions('AB', "Or(v['A'],v['B'])")
         expected = [
             {'A':True},
             {'A':False,'B':False},
             {'A':False,'B':True}]
-        for exp in expected:
-            self.assertTrue(exp in res)
+        self.assertItemsEqual(res, expected)
 
     def testNestedLogicalOr(self):
-        gen = self.generator
-        varsToAdd = [('bool', 'A'), ('bool', 'B'), ('bool', 'C')]
-        gen.addVariables(varsToAdd)
-        exprToAdd = "Or(v['A'], And(v['B'],v['C']))"
-        expression = createExpression(gen.variables, exprToAdd)
-        res = gen.findSolutions(expression)
+        res = self.findSolutions('ABC', "Or(v['A'], And(v['B'],v['C']))")
         expected = [
-            {'B' : True, 'C' : True},
-            {'A' : False, 'B' : True, 'C' : False},
-            {'A' : False, 'B' : False, 'C' : True},
-            {'A' : True, 'B' : False, 'C' : False},
-            {'A' : False, 'B' : False, 'C' : False},
-            {'A' : True, 'B' : False, 'C' : True}]
-        self.assertEquals(len(res), 6)
-        for exp in expected:
-            
-            self.assertTrue(exp in res)
+            {'A' : True},
+            {'A' : False, 'C' : False},
+            {'A' : False, 'B' : True, 'C' : True},
+            {'A' : False, 'B' : False, 'C' : True}]
+        self.assertItemsEqual(res, expected)
 
     def testNestedLogicalAnd(self):
-        gen = self.generator
-        varsToAdd = [('bool', 'A'), ('bool', 'B'), ('bool', 'C')]
-        gen.addVariables(varsToAdd)
-        exprToAdd = "And(Or(v['A'],v['B']),v['C'])"
-        expression = createExpression(gen.variables, exprToAdd)
-        res = gen.findSolutions(expression)
+        res = self.findSolutions('ABC', "And(Or(v['A'],v['B']),v['C'])")
         expected = [
             {'A' : True, 'C' : True},
             {'A' : False, 'B' : False, 'C' : True},
             {'A' : True, 'C' : False},
             {'A' : False, 'C' : False},
             {'A' : False, 'B' : True, 'C' : True}]
-        self.assertEquals(len(res), 5)
-        for exp in expected:
-            self.assertTrue(exp in res)
+        self.assertItemsEqual(res, expected)
 
     def testComparators(self):
-        gen = self.generator
-        varsToAdd = [('int', 'u'), ('int', 'x'), ('int', 'y'), ('int', 'z')]
-        gen.addVariables(varsToAdd)
-        exprToAdd = "And(Or(v['u']==0, v['x']>5),Or(v['y']<6,v['z']==0))"
-        expression = createExpression(gen.variables, exprToAdd)
-        res = gen.findSolutions(expression)
-        expected = [
-            {'x' : 6, 'y' : 0},
-            {'x' : 6, 'y' : 6, 'z' : 1},
-            {'u' : 1, 'x' : 0, 'y' : 0},
-            {'u' : 3, 'x' : 7, 'y' : 2},
-            {'u' : 3, 'x' : 8, 'y' : 2, 'z' : 4},
-            {'u' : 3, 'x' : 0, 'y' : 2},
-            {'u' : 3, 'x' : 8, 'y' : 2, 'z' : 1},
-            {'u' : 1, 'x' : 0, 'y' : 2}]
-        self.assertEquals(len(res), 8)
-        for exp in expected:
-            self.assertTrue(exp in res)
+        gen = MCDCgenerator([Variable('int', n) for n in 'uxyz'],
+                            ["And(Or(v['u']==0, v['x']>5),Or(v['y']<6,v['z']==0))"], [], {}, _engine='tree')
+        self.assertTrue(len(gen.findSolutions()) >= 5)
+        self.assertEqual(gen.stats.decisions[0]['status'], {k:'proven' for k in 'uxyz'})
+
     @unittest.skip('not implemented')
     def testMixedExpr(self):
         pass
     
 
+class TestParallelDecisions(unittest.TestCase):
+
+    def setUp(self):
+        self.variables = [Variable('int', 'u'), Variable('int', 'x'), Variable('int', 'y'), Variable('int', 'z')]
+        self.expressions = ["And(v['u']==0, v['x']>5)", "Or(v['y']<6, v['y']>9)", "v['z']!=3"]
+
+    def testDecisionOrder(self):
+        for workers in [2, 3]:
+            gen = MCDCgenerator(self.variables, self.expressions, [], {}, _workers=workers)
+            res = gen.findSolutions()
+            groups = []
+            for sol in res:
+                group = [i for i, g in enumerate(['ux', 'y', 'z']) if set(sol.keys()) <= set(g)][0]
+                if not groups or groups[-1] != group:
+                    groups.append(group)
+            self.assertEqual(groups, [0, 1, 2])
+
+    def testDeterministicOrder(self):
+        results = []
+        for workers in [2, 3, 3]:
+            gen = MCDCgenerator(self.variables, self.expressions, [], {}, _workers=workers)
+            results.append(gen.findSolutions())
+        self.assertTrue(len(results[0]) >= 3)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[1], results[2])
+
+    def testSerialDecisions(self):
+        # The workers find the vectors and proofs of solving each decision in turn
+        results = []
+        for workers in [1, 3]:
+            gen = MCDCgenerator(self.variables, self.expressions, [], {}, _workers=workers)
+            results.append([(vectors, proofs) for vectors, proofs, _ in gen.solveDecisions(range(3))])
+        self.assertEqual(len(results[0]), 3)
+        self.assertEqual(results[0], results[1])
+
+class TestParallelPairs(unittest.TestCase):
+
+    def testLogicalAnd(self):
+        gen = boolGenerator('AB', ["And(v['A'],v['B'])"], _pairWorkers=2, _truthTable=False)
+        self.assertItemsEqual(gen.findSolutions(), AND_VECTORS)
+        self.assertTrue(gen.pairPool is None)
+
+    # Checks the pairs of every variable of a > 0 or ... or e > 0 at the model
+    # where all of them are 0 in the pair pool, run in this process
+    def checkPairs(self, known):
+        names = 'abcde'
+        gen = MCDCgenerator([Variable('int', n) for n in names],
+                            ["Or(%s)" % ", ".join("v['%s'] > 0" % n for n in names)], [], {}, _truthTable=False)
+        gen.pairPool = InlinePool()
+        gen.beginDecision(0, 'pushpop')
+        expr = gen.expressions[0]
+        assigns = {n:IntVal(0) for n in names}
+        res = gen.checkPairsParallel(gen.solver, 1, gen.declarationsToString([expr]), '', [], list(names),
+                                     assigns, expr, known)
+        return res, gen.stats.totals()
+
+    def testUndecidedSidesOnly(self):
+        res, totals = self.checkPairs({'a':[None, UNDECIDED]})
+        self.assertEqual(sorted(res.keys()), list('abcde'))
+        for name, (sol1, sol2) in res.items():
+            self.assertTrue(sol1 is None)
+            self.assertTrue(sol2[name].as_long() < 0)
+        self.assertEqual(totals['checks'], 9)
+        self.assertEqual(totals['evaluated'], 1)
+
+    def testSerialBelowThreshold(self):
+        known = {n:[None, UNDECIDED] for n in 'abcd'}
+        res, totals = self.checkPairs(known)
+        self.assertTrue(res is None)
+        self.assertEqual(totals['checks'], 0)
+
+    # A worker parses a decision once and only the blocking clauses added since
+    def testWorkerReusesDecision(self):
+        declarations = "(declare-fun x () Int)\n"
+        query = ["(assert (> x 0))"]
+        self.assertEqual(_checkPairs((1, declarations, "", [], query, None))[0][1], 'sat')
+        blocked = ["(assert (< x 0))"]
+        self.assertEqual(_checkPairs((1, declarations, "", blocked, query, None))[0][1], 'unsat')
+        self.assertEqual(_checkPairs((1, declarations, "", blocked, query, None))[0][1], 'unsat')
+        self.assertEqual(_checkPairs((2, declarations, "", [], query, None))[0][1], 'sat')
+
+class TestAssumptionEngine(unittest.TestCase):
+
+    def testLogicalAnd(self):
+        gen = boolGenerator('AB', ["And(v['A'],v['B'])"], _engine='assume', _truthTable=False)
+        self.assertItemsEqual(gen.findSolutions(), AND_VECTORS)
+
+    def testNoTrackingLiteralsInSolutions(self):
+        gen = boolGenerator('ABC', ["Or(v['A'], And(v['B'],v['C']))"], _engine='assume', _truthTable=False)
+        res = gen.findSolutions()
+        self.assertTrue(len(res) >= 4)
+        for sol in res:
+            self.assertTrue(set(sol.keys()) <= set('ABC'))
+
+class TestTruthTable(unittest.TestCase):
+
+    def findSolutions(self, names, expr):
+        gen = boolGenerator(names, [expr])
+        self.assertTrue(isTruthTableDecision(gen.expressions[0], gen.skipVar))
+        return gen.findSolutions()
+
+    def testLogicalAnd(self):
+        self.assertItemsEqual(self.findSolutions('AB', "And(v['A'],v['B'])"), AND_VECTORS)
+
+    def testNestedLogicalAnd(self):
+        res = self.findSolutions('ABC', "And(Or(v['A'],v['B']),v['C'])")
+        expected = [
+            {'A' : False, 'B' : False, 'C' : True},
+            {'A' : True, 'B' : False, 'C' : True},
+            {'A' : False, 'B' : True, 'C' : True},
+            {'A' : True, 'B' : False, 'C' : False}]
+        self.assertEqual(res, expected)
+
+    def testWideDecision(self):
+        names = ['x%d' % i for i in range(20)]
+        res = self.findSolutions(names, "Or([And(v['x%d' % i], v['x%d' % (i+1)]) for i in range(0, 20, 2)])")
+        self.assertTrue(len(res) <= 2*len(names))
+        self.assertTrue(all(len(sol) == len(names) for sol in res))
+
+    def testMaskedCondition(self):
+        gen = boolGenerator('AB', ["And(v['A'], Not(v['A']), v['B'])"])
+        vectors, masked = truthTableSolutions(gen.expressions[0], gen.skipVar)
+        self.assertEqual(vectors, [])
+        self.assertEqual(masked, ['A', 'B'])
+
+    def testSkipsNonBoolean(self):
+        variables = [Variable('bool', 'A'), Variable('int', 'x')]
+        gen = MCDCgenerator(variables, ["And(v['A'], v['x']>2)"], [], {})
+        self.assertFalse(isTruthTableDecision(gen.expressions[0], gen.skipVar))
+
+    def testDistinct(self):
+        # Three Booleans are never distinct, so no condition has a pair
+        gen = boolGenerator('ABC', ["Or(Distinct(v['A'], v['B'], v['C']), v['A'])"])
+        self.assertEqual(len(gen.findSolutions()), 2)
+        self.assertEqual(gen.stats.decisions[0]['status'], {'A':'proven', 'B':'unproven', 'C':'unproven'})
+        res = self.findSolutions('AB', "Distinct(v['A'], v['B'])")
+        self.assertEqual(len(res), 3)
+
+    def testDecisionRecord(self):
+        gen = boolGenerator('AB', ["And(v['A'],v['B'])"], _memoryLimit=0)
+        gen.findVectors()
+        record = gen.stats.decisions[0]
+        self.assertEqual(record['method'], 'truthTable')
+        self.assertTrue(record['memoryReset'])
+        self.assertFalse('z3' in record)
+
+class TestTreeEngine(unittest.TestCase):
+
+    def setUp(self):
+        variables = [Variable('int', 'u'), Variable('int', 'x'), Variable('int', 'y'), Variable('int', 'z')]
+        self.generator = MCDCgenerator(variables, [], [], {}, _engine='tree')
+        self.engine = TreeEngine(self.generator, self.generator.solver)
+
+    def evaluate(self, expr, sol):
+        subs = [(self.generator.variables[k], v) for k, v in sol.items()]
+        return simplify(substitute(expr, subs), model_completion=True)
+
+    def testComparators(self):
+        v = self.generator.variables
+        atoms = [v['u']==0, v['x']>5, v['y']<6, v['z']==0]
+        expr = And(Or(atoms[0], atoms[1]), Or(atoms[2], atoms[3]))
+        res, unproven = self.engine.solve(expr)
+        self.assertEqual(unproven, [])
+        self.assertTrue(len(res) <= 8)
+        for atom in atoms:
+            shown = False
+            for a in res:
+                for b in res:
+                    same = all(is_true(self.evaluate(c, a)) == is_true(self.evaluate(c, b))
+                               for c in atoms if not c.eq(atom))
+                    if same and is_true(self.evaluate(atom, a)) and is_false(self.evaluate(atom, b)):
+                        shown = shown or is_true(self.evaluate(expr, a)) != is_true(self.evaluate(expr, b))
+            self.assertTrue(shown, atom)
+
+    def testMaskedCondition(self):
+        v = self.generator.variables
+        res, unproven = self.engine.solve(Or(v['x']>3, v['x']>5))
+        # x > 5 has no pair, but x is shown through x > 3
+        self.assertEqual(self.engine.names, ['x'])
+        self.assertEqual(unproven, [])
+        self.assertEqual(len(res), 2)
+
+    def testNaryOperators(self):
+        for expr, status in [("Or(Distinct(v['A'], v['B'], v['C']), v['A'])", {'A':'proven', 'B':'unproven', 'C':'unproven'}),
+                             ("Xor(Xor(v['A'], v['B']), v['C'])", {'A':'proven', 'B':'proven', 'C':'proven'})]:
+            gen = boolGenerator('ABC', [expr], _engine='tree', _truthTable=False)
+            gen.findVectors()
+            self.assertEqual(gen.stats.decisions[0]['status'], status)
+
+    def testSiblingMerge(self):
+        a, b, c = Bools('a b c')
+        w = lambda *pairs: dict((x.get_id(), (x, value)) for x, value in pairs)
+        witnesses = [w((a, True)), w((a, False), (b, True)), None, w((b, True), (c, False)), {}]
+        for others in [witnesses, witnesses[:2] + witnesses[3:], [w((a, True)), w((a, False)), w((a, True))]]:
+            merge = SiblingMerge(others)
+            for i in range(len(others)):
+                self.assertEqual(merge.without(i), mergeWitnesses(others[:i] + others[i + 1:]))
+
+    def testWideOperators(self):
+        # The siblings of every operand of a wide And, Or and Xor are merged once
+        names = ['b{}'.format(i) for i in range(12)]
+        args = ["v['{}']".format(n) for n in names]
+        for expr in ["And({})".format(", ".join(args)), "Or({})".format(", ".join(args)),
+                     reduce(lambda x, y: "Xor({}, {})".format(x, y), args)]:
+            gen = boolGenerator(names, [expr], _engine='tree', _truthTable=False)
+            gen.findVectors()
+            self.assertEqual(set(gen.stats.decisions[0]['status'].values()), set(['proven']))
+
+    def testConditionNames(self):
+        # Every engine reports the same conditions, by variable
+        variables = [Variable('int', 'x'), Variable('int', 'y'), Variable('int', 'z')]
+        for engine in ['pushpop', 'assume', 'tree', 'pair']:
+            gen = MCDCgenerator(variables, ["Or(v['x'] > 3, v['x'] + v['y'] < 0)"], [], {}, _engine=engine)
+            gen.findVectors()
+            status = gen.stats.decisions[0]['status']
+            self.assertEqual(sorted(status), ['x', 'y', 'z'], engine)
+            self.assertEqual((status['x'], status['z']), ('proven', 'masked'), engine)
+
+class TestSolutionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cacheDir = tempfile.mkdtemp()
+        self.variables = [Variable('int', 'x'), Variable('int', 'y')]
+
+    def tearDown(self):
+        shutil.rmtree(self.cacheDir)
+
+    def testReuseUnchangedDecisions(self):
+        expressions = ["Or(v['x']>3, v['y']<2)"]
+        gen = MCDCgenerator(self.variables, expressions, [], {}, _cacheDir=self.cacheDir)
+        first = gen.findSolutions()
+        self.assertEqual((gen.cache.hits, gen.cache.misses), (0, 1))
+
+        expressions.append("And(v['x']==2, v['y']!=4)")
+        gen = MCDCgenerator(self.variables, expressions, [], {}, _cacheDir=self.cacheDir)
+        second = gen.findSolutions()
+        self.assertEqual((gen.cache.hits, gen.cache.misses), (1, 1))
+        self.assertEqual(str(second[:len(first)]), str(first))
+
+    def testEvictLeastRecentlyUsed(self):
+        cache = SolutionCache(self.cacheDir, 120)
+        cache.put('a', [{'x':'1'*40}])
+        cache.put('b', [{'x':'2'*40}])
+        cache.get('a')
+        cache.put('c', [{'x':'3'*40}])
+        self.assertTrue(cache.get('a') is not None)
+        self.assertTrue(cache.get('b') is None)
+        self.assertTrue(cache.get('c') is not None)
+
+    def testUnrelatedVariables(self):
+        expressions = ["Or(v['x']>3, v['y']<2)"]
+        gen = MCDCgenerator(self.variables, expressions, [], {}, _cacheDir=self.cacheDir)
+        first = gen.findSolutions()
+        # A new variable, constant and funcCall outside the cone keep the key
+        variables = self.variables + [Variable('int', 'z'), Constant('int', 'C', '4')]
+        funcCalls = [FuncCall('int', 'f', ["v['z'] + 1"])]
+        gen = MCDCgenerator(variables, expressions, funcCalls, {}, _cacheDir=self.cacheDir)
+        second = gen.findSolutions()
+        self.assertEqual((gen.cache.hits, gen.cache.misses), (1, 0))
+        self.assertEqual(str(second), str(first))
+        self.assertEqual(gen.stats.decisions[0]['status'], {'x':'proven', 'y':'proven', 'z':'masked'})
+
+class TestExpressionParser(unittest.TestCase):
+
+    def setUp(self):
+        self.v = {'x': Int('x'), 'y': Int('y'), 'A': Bool('A'), 'r': Real('r')}
+
+    def testSameTermsAsEval(self):
+        v = self.v
+        for expr in ["And(Or(v['x']==0, v['y']>5), Not(v['A']))",
+                     "Implies(v['A'], If(v['x']<2, v['y']!=v['x'], v['x']*2+1 >= -3))",
+                     "v['r'] > 1.5", "v['x'] % 3 == 1", "Or([v['A'], v['x']<1])"]:
+            self.assertTrue(createExpression(v, expr).eq(eval(expr)), expr)
+
+    def testCStyleExpressions(self):
+        v = self.v
+        res = createExpression(v, "x > 3 && (y < 2 || !A)")
+        self.assertTrue(res.eq(And(v['x'] > 3, Or(v['y'] < 2, Not(v['A'])))))
+        res = createExpression(v, "A ? x > 1 : 1 < y < 5")
+        self.assertTrue(res.eq(If(v['A'], v['x'] > 1, And(1 < v['y'], v['y'] < 5))))
+
+    def testNegationPrecedence(self):
+        v = dict(self.v, B=Bool('B'))
+        self.assertTrue(createExpression(v, "!A == B").eq(Not(v['A']) == v['B']))
+        self.assertTrue(createExpression(v, "!!A != B").eq(Not(Not(v['A'])) != v['B']))
+        self.assertTrue(createExpression(v, "!(x == y)").eq(Not(v['x'] == v['y'])))
+        self.assertTrue(createExpression(v, "not x == y").eq(Not(v['x'] == v['y'])))
+        table = SyntaxTable()
+        self.assertEqual(table.parse("!A == B"), table.parse("(!A) == B"))
+
+    def testSharedSubterms(self):
+        table = SyntaxTable()
+        a = table.parse("And(v['x']>3, v['y']<2)")
+        b = table.parse("Or(v['y']<2, v['x']>3)")
+        self.assertEqual(table.parse("v['x']>3 && v['y']<2"), a)
+        self.assertNotEqual(a, b)
+        # The nodes belong to the builder which parsed them
+        builder = ExpressionBuilder(self.v)
+        createExpression(self.v, "v['x']>3 && v['y']<2", builder=builder)
+        self.assertEqual(len(builder.syntax.nodes), 7)
+        self.assertEqual(len(ExpressionBuilder(self.v).syntax.nodes), 0)
+
+class TestBenchmark(unittest.TestCase):
+
+    def testGeneratedDecision(self):
+        case = dict(CASE_DEFAULTS, name='test', conditions=6, numericRatio=0.5, funcCalls=1, assignments=1)
+        variables, expression, funcCalls = generateDecision(case)
+        self.assertEqual(generateDecision(case)[1], expression)
+        self.assertEqual(len([x for x in variables if not x.isAssignment()]), 6)
+        self.assertEqual(len([x for x in variables if x.isAssignment()]), 1)
+        self.assertEqual(len(funcCalls), 1)
+        gen = MCDCgenerator(variables, [expression], funcCalls, {})
+        self.assertTrue(len(gen.findSolutions()) >= 2)
+
+    def testCompare(self):
+        old = {'a':{'case':{}, 'time':1.0, 'checks':10}, 'b':{'case':{}, 'time':1.0, 'checks':10}}
+        new = {'a':{'case':{}, 'time':1.1, 'checks':10}, 'b':{'case':{}, 'time':2.0, 'checks':20}}
+        self.assertEqual(len(compare(new, old, 0.25)), 2)
+        self.assertEqual(compare(new, old, 1.5), [])
+
+class TestSolverStats(unittest.TestCase):
+
+    def setUp(self):
+        self.variables = [Variable('int', 'u'), Variable('int', 'x'), Variable('bool', 'A')]
+        self.expressions = ["And(Or(v['u']==0, v['x']>5), v['A'])", "Or(v['u']<2, v['x']==3)"]
+
+    def testCounters(self):
+        gen = MCDCgenerator(self.variables, self.expressions, [], {})
+        solutions = gen.findSolutions()
+        stats = gen.stats.toDict()
+        self.assertEqual([d['index'] for d in stats['decisions']], [0, 1])
+        totals = stats['totals']
+        self.assertEqual(totals['accepted'], len(solutions))
+        self.assertEqual(totals['checks'], totals['sat'] + totals['unsat'] + totals['unknown'])
+        self.assertEqual(totals['pushes'], totals['pops'])
+        # A does not occur in the second decision and is not searched for
+        for d, conditions in zip(stats['decisions'], [['A', 'u', 'x'], ['u', 'x']]):
+            self.assertEqual(sorted(d['conditions'].keys()), conditions)
+            self.assertTrue(0 < sum(c['checks'] for c in d['conditions'].values()) < d['checks'])
+        self.assertTrue(len(stats['z3']) > 0)
+
+    def testParallelRecords(self):
+        gen = MCDCgenerator(self.variables, self.expressions, [], {}, _workers=2)
+        solutions = gen.findSolutions()
+        stats = gen.stats.toDict()
+        self.assertEqual([d['index'] for d in stats['decisions']], [0, 1])
+        self.assertEqual(stats['totals']['accepted'], len(solutions))
+        for k in COUNTERS:
+            self.assertTrue(k in stats['totals'])
+
+class TestMinimalCover(unittest.TestCase):
+
+    def testCover(self):
+        pairs = {'a':[(0, 1), (2, 3)], 'b':[(0, 2), (4, 5)], 'c':[(1, 6), (3, 7)], 'd':[]}
+        selected, bound, optimal = minimalCover(pairs)
+        self.assertEqual(bound, 4)
+        self.assertEqual(len(selected), 4)
+        self.assertTrue(optimal)
+        self.assertEqual(len(greedyCover(pairs)), 4)
+        self.assertEqual(exactCover(pairs, 4), None)
+
+    def testTruthTable(self):
+        gen = boolGenerator('ABCD', ["Or(And(v['A'], v['B']), And(v['C'], v['D']))"], _minimize=True)
+        res = gen.findSolutions()
+        self.assertEqual(len(res), 5)
+        self.assertEqual(gen.stats.decisions[0]['cover']['lowerBound'], 5)
+        self.assertTrue(gen.stats.decisions[0]['cover']['optimal'])
+
+    def testComparators(self):
+        variables = [Variable('int', x) for x in 'uxyz']
+        expr = "And(Or(v['u']==0, v['x']>5),Or(v['y']<6,v['z']==0))"
+        gen = MCDCgenerator(variables, [expr], [], {}, _minimize=True)
+        res = gen.findSolutions()
+        v = gen.variables
+        outcome = [is_true(simplify(substitute(gen.expressions[0], *[(v[k], x) for k, x in sol.items()])))
+                   for sol in res]
+        for name in 'uxyz':
+            self.assertTrue(any(outcome[i] != outcome[j] and
+                                all(a[k].eq(b[k]) for k in 'uxyz' if k != name)
+                                for i, a in enumerate(res) for j, b in enumerate(res)), name)
+        report = gen.stats.decisions[0]['cover']
+        self.assertEqual(report['lowerBound'], 5)
+        self.assertEqual(report['size'], len(res))
+        self.assertTrue(len(res) < 8)
+
+class TestBudgets(unittest.TestCase):
+
+    def setUp(self):
+        self.variables = [Variable('int', 'x'), Variable('int', 'y'), Variable('int', 'z'), Variable('bool', 'w')]
+        self.expressions = ["And(v['x']>0, v['y']>0, v['x']*v['x']*v['x'] + v['y']*v['y']*v['y'] == v['z']*v['z']*v['z'])",
+                            "Or(v['w'], v['x'] > 3)"]
+
+    def testCheckTimeout(self):
+        gen = MCDCgenerator(self.variables, self.expressions, [], {}, _checkTimeout=100)
+        res = gen.findSolutions()
+        self.assertTrue(len(res) > 0)
+        status = [d['status'] for d in gen.stats.decisions]
+        self.assertEqual(set(status[0][k] for k in 'xyz'), set(['unknown']))
+        self.assertEqual(status[0]['w'], 'masked')
+        self.assertEqual(status[1]['x'], 'proven')
+        self.assertFalse('unknown' in status[1].values())
+
+    def testDeadline(self):
+        gen = MCDCgenerator(self.variables, self.expressions, [], {}, _engine='tree', _deadline=0.5)
+        start = time.time()
+        gen.findSolutions()
+        self.assertTrue(time.time() - start < 5)
+        for d in gen.stats.decisions:
+            self.assertTrue(d['timedOut'])
+            self.assertEqual(set(v for c, v in d['status'].items() if c not in d['masked']), set(['unknown']))
+
+    def testStoredVectors(self):
+        # The pairs of Xor(A,B) reuse the vectors And(A,B) stored already
+        for engine in ['pushpop', 'assume']:
+            gen = boolGenerator('AB', ["And(v['A'],v['B'])", "Xor(v['A'],v['B'])"], _truthTable=False, _engine=engine)
+            gen.findVectors()
+            for d in gen.stats.decisions:
+                self.assertEqual(d['status'], {'A':'proven', 'B':'proven'})
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.variables = [Variable('int', 'u'), Variable('int', 'x'), Variable('bool', 'A'), Variable('bool', 'B')]
+        self.expressions = ["Or(v['u']==0, v['x']>5)", "And(v['A'], v['B'])"]
+
+    def testIterSolutions(self):
+        want = set(['u', 'x'])
+        for options in [{}, {'_engine':'tree'}, {'_minimize':True}, {'_workers':2}]:
+            gen = MCDCgenerator(self.variables, self.expressions, [], {}, **options)
+            res = list(gen.iterSolutions())
+            self.assertEqual([index for _, index, _ in res], sorted(index for _, index, _ in res))
+            shown = set(c for _, index, conditions in res if index == 0 for c in conditions)
+            # The greedy search does not always show every condition
+            if 'pushpop' == gen.engine and not gen.minimize:
+                self.assertTrue(shown and shown <= want)
+            else:
+                self.assertEqual(shown, want)
+            table = [(sol, conditions) for sol, index, conditions in res if index == 1]
+            self.assertEqual(len(table), 3)
+            for sol, conditions in table:
+                if is_true(sol['A']) and is_true(sol['B']):
+                    self.assertEqual(conditions, ['A', 'B'])
+
+    def testNDJSON(self):
+        out = StringIO()
+        stream(out, self.variables, self.expressions, [], {})
+        lines = [json.loads(l) for l in out.getvalue().splitlines()]
+        self.assertTrue(len(lines) >= 6)
+        self.assertEqual(lines[-1]['decision'], 1)
+        self.assertTrue(all(isinstance(l['vector'], dict) for l in lines))
+
+class TestSolutionStore(unittest.TestCase):
+
+    def setUp(self):
+        self.variables = {'b':Bool('b'), 'x':Int('x'), 'y':Real('y'), 's':String('s')}
+        self.store = SolutionStore(self.variables, sorted(self.variables))
+
+    def testDeduplication(self):
+        sol = {'b':BoolVal(True), 'x':IntVal(3), 'y':RealVal('1/3')}
+        self.assertTrue(self.store.add(sol))
+        self.assertFalse(self.store.add({'b':BoolVal(True), 'x':IntVal(3), 'y':RealVal('2/6')}))
+        self.assertTrue({'y':RealVal('1/3'), 'x':IntVal(3), 'b':BoolVal(True)} in self.store)
+        # A missing variable is not the same as any value
+        self.assertTrue(self.store.add({'b':BoolVal(True), 'x':IntVal(3)}))
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual(list(self.store)[1], (True, None, 3, None))
+
+    def testConversion(self):
+        sol = {'b':BoolVal(False), 'x':IntVal(-7), 'y':RealVal('1/3'), 's':StringVal('ab')}
+        self.store.add(sol)
+        row = list(self.store)[0]
+        self.assertEqual(self.store.toPython(row), {k:z3TypeToPython(v) for k, v in sol.items()})
+        self.assertTrue(all(self.store.toZ3(row)[k].eq(v) for k, v in sol.items()))
+
+    def testMain(self):
+        variables = [Variable('int', 'x'), Variable('real', 'y'), Variable('bool', 'b')]
+        res = main(variables, ["And(Or(v['x']>3, v['b']), v['y']*3 > 1)"], [], {})
+        self.assertTrue(len(res) >= 4)
+        self.assertEqual(len(set(json.dumps(r, sort_keys=True) for r in res)), len(res))
+        self.assertTrue(all(isinstance(r['y'], str) for r in res))
+
+class TestSlicing(unittest.TestCase):
+
+    def setUp(self):
+        self.variables = [Variable('int', 'x'), Variable('int', 'y'), Variable('int', 'z'),
+                          Assignment('int', 'a', "v['x'] + 1"), Assignment('int', 'b', "v['a'] * 2"),
+                          Assignment('int', 'c', "v['z'] - 1")]
+        self.funcCalls = [FuncCall('int', 'f', ["v['y']", "v['y'] + 1", "v['y'] + 2"])]
+
+    def testDependentConstraints(self):
+        x, y, z, a, b, c = Ints('x y z a b c')
+        index = ConstraintIndex([('a', a == x + 1), ('b', b == a * 2), ('c', c == z - 1)])
+        dependent, names = index.dependentConstraints(b > 3)
+        self.assertEqual(len(dependent), 2)
+        self.assertEqual(names, set(['a', 'b', 'x']))
+        self.assertEqual(index.dependentConstraints(y > 0), ([], set(['y'])))
+        # c is defined from z but not used
+        self.assertEqual(index.dependentConstraints(z > 0), ([], set(['z'])))
+
+    def testDependencies(self):
+        gen = MCDCgenerator(self.variables, ["v['b'] > 3", "v['f'] < v['z']"], self.funcCalls, {})
+        self.assertEqual(len(gen.dependencies(gen.expressions[0])), 2)
+        self.assertEqual(len(gen.dependencies(gen.expressions[1])), 1)
+        for engine in ['pushpop', 'assume', 'tree']:
+            gen = MCDCgenerator(self.variables, ["v['b'] > 3", "v['f'] < v['z']"], self.funcCalls, {},
+                                _engine=engine)
+            for sol in gen.findSolutions():
+                self.assertTrue(set(sol) <= set(['x', 'y', 'z']))
+            # Nothing stays asserted but the negated decisions
+            self.assertTrue(len(gen.solver.assertions()) <= 2 or engine == 'assume')
+
+    def testFunctionCall(self):
+        v = {'f':Int('f'), 'y':Int('y')}
+        call = createFunctionCall(v, self.funcCalls[0])
+        self.assertEqual(call.num_args(), 3)
+        s = Solver()
+        s.add(call, v['y'] == 1)
+        for value, res in [(1, sat), (3, sat), (4, unsat)]:
+            self.assertEqual(s.check(v['f'] == value), res)
+
+class TestTactics(unittest.TestCase):
+
+    def testClassifyLogic(self):
+        a, b = Bools('a b')
+        x, y = Ints('x y')
+        r = Real('r')
+        self.assertEqual(classifyLogic([Or(a, b)]), 'BOOL')
+        self.assertEqual(classifyLogic([And(a, x + 2*y > 3)]), 'QF_LIA')
+        self.assertEqual(classifyLogic([r / 2 > 1]), 'QF_LRA')
+        self.assertEqual(classifyLogic([x > 1, r < 2]), 'QF_LIRA')
+        self.assertEqual(classifyLogic([x * y > 1]), 'QF_NIA')
+        self.assertEqual(classifyLogic([r * r == 2]), 'QF_NRA')
+        self.assertEqual(classifyLogic([Length(String('s')) > 2]), 'QF_S')
+
+    def solve(self, tactic):
+        variables = [Variable('real', 'x'), Variable('real', 'y'), Variable('int', 'z')]
+        gen = MCDCgenerator(variables, ["Or(v['x'] > 1, v['y'] < v['x'] / 2)", "And(v['z'] > 0, v['z'] < 5)"],
+                            [], {}, _tactic=tactic)
+        return gen.findSolutions(), gen.stats
+
+    def testAuto(self):
+        res, stats = self.solve('auto')
+        self.assertTrue(len(res) >= 4)
+        self.assertEqual([(d['logic'], d['configuration']) for d in stats.decisions],
+                         [('QF_LRA', 'lra'), ('QF_LIA', 'lia')])
+        self.assertEqual(stats.logics()['QF_LIA']['lia']['decisions'], 1)
+
+    def testUnfitConfiguration(self):
+        # sat only decides Booleans, the decisions over numbers fall back
+        res, stats = self.solve('sat')
+        self.assertTrue(len(res) >= 4)
+        self.assertEqual([d['configuration'] for d in stats.decisions], ['default', 'default'])
+        for d in stats.decisions:
+            self.assertNotIn('unknown', d['status'].values())
+
+    def testPortfolioFits(self):
+        self.assertEqual(sorted(PORTFOLIOS), sorted(LOGICS))
+        for logic, configurations in PORTFOLIOS.items():
+            for configuration in configurations:
+                self.assertTrue(fits(configuration, logic), (configuration, logic))
+
+    def testPortfolio(self):
+        res, stats = self.solve('portfolio')
+        self.assertTrue(len(res) >= 4)
+        logics = stats.logics()
+        self.assertEqual(sorted(logics), ['QF_LIA', 'QF_LRA'])
+        for configurations in logics.values():
+            self.assertEqual(sum(c['decisions'] for c in configurations.values()), 1)
+            self.assertTrue(all(c['raced'] == 1 for c in configurations.values()))
+
+class TestIntTypes(unittest.TestCase):
+
+    def setUp(self):
+        self.v = {'x':createBitVec('int8', 'x'), 'u':createBitVec('uint8', 'u'), 'w':createBitVec('int32', 'w')}
+
+    def prove(self, text):
+        return self.valid(createExpression(self.v, text, None, ['u']))
+
+    def valid(self, f):
+        s = Solver()
+        s.add(Not(f))
+        return s.check() == unsat
+
+    def testSemantics(self):
+        # Addition wraps around in int, narrower operands are promoted first
+        self.assertTrue(self.prove("Implies(v['w'] == 2147483647, v['w'] + 1 == -2147483648)"))
+        self.assertTrue(self.prove("Implies(v['x'] == 127, v['x'] + 1 == 128)"))
+        self.assertTrue(self.prove("Implies(v['u'] == 255, v['u'] > 200)"))
+        self.assertTrue(self.prove("Implies(v['u'] == 255, v['u'] / 2 == 127)"))
+        self.assertTrue(self.prove("Implies(v['x'] == -7, And(v['x'] / 2 == -3, v['x'] % 2 == -1))"))
+        # The narrower operand is extended
+        self.assertTrue(self.prove("Implies(v['x'] == -1, v['w'] + v['x'] == v['w'] - 1)"))
+        self.assertTrue(self.prove("Implies(v['u'] == 255, max(v['u'], 3) == 255)"))
+
+    def testPromotions(self):
+        self.v.update(U=createBitVec('uint32', 'U'), L=createBitVec('int64', 'L'))
+        unsigned = ['u', 'U']
+        prove = lambda text: self.valid(createExpression(self.v, text, None, unsigned))
+        # int8 and uint8 both become int
+        self.assertTrue(prove("Implies(And(v['x'] == -1, v['u'] == 1), v['x'] < v['u'])"))
+        self.assertTrue(prove("v['u'] > -1"))
+        self.assertTrue(prove("Implies(v['u'] == 1, -v['u'] < 0)"))
+        self.assertTrue(prove("Implies(v['u'] == 255, min(v['u'], -1) == -1)"))
+        # uint8 + int32 is int, uint32 + int32 unsigned and uint32 + int64 long long
+        self.assertTrue(prove("Implies(And(v['u'] == 1, v['w'] == -2), v['u'] + v['w'] < 0)"))
+        self.assertTrue(prove("Implies(And(v['U'] == 1, v['w'] == -2), v['U'] + v['w'] > 0)"))
+        self.assertTrue(prove("Implies(And(v['U'] == 1, v['L'] == -2), v['U'] + v['L'] < 0)"))
+        self.assertTrue(prove("Implies(v['U'] == 0, max(v['U'], -1) != 0)"))
+        # Literals are long long when int cannot hold them
+        self.assertTrue(prove("Implies(v['w'] == 2147483647, v['w'] < 4294967296)"))
+        self.assertTrue(prove("Implies(v['U'] == 4294967295, v['U'] < 4294967296)"))
+        self.assertRaises(ValueError, createExpression, self.v, "v['w'] < 18446744073709551616")
+        # Assigned values take the type of the variable
+        value = createExpression(self.v, "v['x'] + 129", target=createBitVec('int8', 'z'))
+        self.assertTrue(self.valid(Implies(self.v['x'] == 127, value == 0)))
+
+    def testEncoding(self):
+        variables = [Variable('int', 'x'), Variable('uint8', 'u')]
+        gen = MCDCgenerator(variables, ["And(v['x'] * 2 < 0, v['u'] > 128)"], [], {}, _intEncoding='int16')
+        self.assertEqual(gen.variables['x'].sort(), BitVecSort(16))
+        rows = gen.findVectors()
+        res = [rows.toPython(row) for row in rows]
+        self.assertTrue(len(res) >= 3)
+        self.assertTrue(all(0 <= r['u'] < 256 for r in res if 'u' in r))
+        self.assertTrue(all(-2**15 <= r['x'] < 2**15 for r in res if 'x' in r))
+        self.assertEqual(classifyLogic(gen.expressions), 'QF_BV')
+
+    def testSharedTerms(self):
+        # The values of U and S are the same term, only U is unsigned
+        x = BitVec('x', 32)
+        variables = [Variable('int32', 'x'), Constant('uint32', 'U', '5'), Constant('int32', 'S', '5')]
+        gen = MCDCgenerator(variables, ["v['x'] < v['S']", "v['x'] < v['U']"], [], {})
+        signed, unsigned = gen.expressions
+        self.assertTrue(self.valid(Implies(x == -1, signed)))
+        self.assertTrue(self.valid(Implies(x == -1, Not(unsigned))))
+        # x of an earlier run was unsigned
+        MCDCgenerator([Variable('uint32', 'x')], ["v['x'] < 3"], [], {}).findVectors()
+        gen = MCDCgenerator([Variable('int32', 'x')], ["v['x'] < 3"], [], {})
+        self.assertTrue(self.valid(Implies(x == -1, gen.expressions[0])))
+        rows = gen.findVectors()
+        self.assertTrue(all(-2**31 <= r['x'] < 2**31 for r in map(rows.toPython, rows)))
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = self.dir + '/solverz3.sock'
+        self.server = SolverServer(self.path, 1, queue=0, maxJobs=2)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def testJobs(self):
+        args = ['--var', 'int,x', 'bool,b', '-e', "And(v['x'] > 3, v['b'])"]
+        # The worker is replaced after its second job
+        for i in range(3):
+            res = list(request(self.path, {'args':args, 'stats':True}))
+            self.assertEqual(res[-1]['count'], 3)
+            self.assertEqual(len(res[-1]['stats']['decisions']), 1)
+            self.assertEqual(sorted(r['vector'].get('b') for r in res[:-1]), [False, True, True])
+        res = list(request(self.path, {'args':['--var', 'int,x', '--bogus']}))
+        self.assertTrue('error' in res[-1])
+        # The worker survives a failed job
+        self.assertEqual(list(request(self.path, {'args':args}))[-1]['count'], 3)
+
+    def testCoverage(self):
+        previous = self.dir + '/previous.json'
+        with open(previous, 'w') as f:
+            json.dump([{'x':4, 'b':True}, {'x':3, 'b':True}], f)
+        coverage = self.dir + '/coverage.json'
+        args = ['--connect', self.path, '--var', 'int,x', 'bool,b', '-e', "And(v['x'] > 3, v['b'])",
+                '--previous', previous, '--coverage', coverage]
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            self.assertEqual(client(args), 0)
+        finally:
+            sys.stdout = stdout
+        with open(coverage) as f:
+            res = json.load(f)
+        self.assertEqual(res['decisions'][0]['covered'], ['x'])
+        self.assertEqual(res['decisions'][0]['added'], ['b'])
+
+class TestSolverLifecycle(unittest.TestCase):
+
+    def setUp(self):
+        self.variables = [Variable('int', 'x'), Variable('int', 'y')]
+        # The pair of x in the second decision needs x > 3
+        self.expressions = ["v['x'] > 3", "Or(v['x'] > 3, v['y'] > 3)"]
+
+    def testPool(self):
+        pool = SolverPool('reset')
+        s = pool.get('default')
+        s.add(Int('x') > 1)
+        self.assertTrue(pool.get('default') is s)
+        self.assertEqual(len(s.assertions()), 0)
+        self.assertFalse(SolverPool('fresh').get('default') is SolverPool('fresh').get('default'))
+        pool = SolverPool('shared')
+        pool.get('lia').add(Int('x') > 1)
+        self.assertEqual(len(pool.get('lia').assertions()), 1)
+        self.assertEqual(pool.created, 1)
+
+    def testDecisionsIndependent(self):
+        # Only the negated expression of the last decision is left
+        for lifecycle in ['reset', 'fresh']:
+            gen = MCDCgenerator(self.variables, self.expressions, [], {}, _solverLifecycle=lifecycle)
+            gen.findVectors()
+            self.assertEqual(len(gen.solver.assertions()), 1)
+        # Shared keeps Not(v['x'] > 3) from the first decision
+        gen = MCDCgenerator(self.variables, self.expressions, [], {}, _solverLifecycle='shared')
+        res = [sol for sol, index, _ in gen.iterSolutions() if index == 1]
+        self.assertTrue(all(sol['x'].as_long() <= 3 for sol in res if 'x' in sol))
+        self.assertEqual(len(gen.solver.assertions()), 2)
+
+    def testMemoryLimit(self):
+        gen = MCDCgenerator(self.variables, self.expressions, [], {}, _memoryLimit=0)
+        gen.findVectors()
+        self.assertTrue(all(d['memoryReset'] and d['memory'] > 0 for d in gen.stats.decisions))
+        self.assertEqual(gen.solvers.created, 2)
+
+class TestIncremental(unittest.TestCase):
+
+    def setUp(self):
+        self.variables = [Variable('int', 'x'), Variable('int', 'y'), Variable('bool', 'b')]
+        self.expressions = ["And(Or(v['x'] > 3, v['b']), v['y'] < 5)", "Or(v['x'] > 10, v['y'] == 2)"]
+        self.dir = tempfile.mkdtemp()
+        self.path = self.dir + '/previous.ndjson'
+        gen = MCDCgenerator(self.variables, self.expressions, [], {}, _flip=False)
+        with open(self.path, 'w') as f:
+            for res in results(gen):
+                f.write(json.dumps(res) + '\n')
+        self.checks = gen.stats.totals()['checks']
+        self.status = [d['status'] for d in gen.stats.decisions]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testLoad(self):
+        previous = loadPrevious(self.path)
+        self.assertEqual(len(previous), 2)
+        with open(self.dir + '/previous.json', 'w') as f:
+            f.write(json.dumps([{'x':1}, {'x':2, 'b':True}]) + '\n' + json.dumps({'totals':{}}) + '\n')
+        self.assertEqual(loadPrevious(self.dir + '/previous.json'), [[{'x':1}, {'x':2, 'b':True}]])
+
+    def testUnchanged(self):
+        gen = MCDCgenerator(self.variables, self.expressions, [], {}, _previous=loadPrevious(self.path))
+        gen.findVectors()
+        self.assertEqual([d['status'] for d in gen.stats.decisions], self.status)
+        # Every condition of the first decision was shown before
+        self.assertEqual(gen.stats.decisions[0]['checks'], 0)
+        self.assertTrue(gen.stats.reuse()['decisions'] >= 1)
+
+    def testChangedConstant(self):
+        expressions = [self.expressions[0].replace('5', '6'), self.expressions[1].replace('10', '12')]
+        gen = MCDCgenerator(self.variables, expressions, [], {}, _previous=loadPrevious(self.path),
+                            _flip=False)
+        gen.findVectors()
+        self.assertTrue(0 < gen.stats.totals()['checks'] < self.checks)
+        self.assertTrue(gen.stats.reuse()['reused'] > 0)
+        self.assertEqual(set(gen.stats.decisions[0]['status'].values()), set(['proven']))
+
+class TestCoverageGaps(unittest.TestCase):
+
+    def setUp(self):
+        self.variables = [Variable('int', 'x'), Variable('int', 'y'), Variable('bool', 'b')]
+        self.expressions = ["And(Or(v['x'] > 3, v['b']), v['y'] < 5)"]
+        self.dir = tempfile.mkdtemp()
+        self.path = self.dir + '/suite.csv'
+        with open(self.path, 'w') as f:
+            f.write('x,y,b,unused\n4,0,False,a\n4,5,False,b\n0,0,False,\n3,2,True,1.5\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testLoadCsv(self):
+        suite = loadPrevious(self.path)
+        self.assertEqual(suite[0][0], {'x':4, 'y':0, 'b':False, 'unused':'a'})
+        self.assertEqual(suite[0][2], {'x':0, 'y':0, 'b':False})
+
+    def testGaps(self):
+        suite = loadPrevious(self.path)
+        gen = MCDCgenerator(self.variables, self.expressions, [], {}, _engine='pair', _previous=suite, _gaps=True)
+        res = [sol for sol, _, _ in gen.iterSolutions()]
+        # Only the vector pairing with a suite row for b is new
+        self.assertEqual(len(res), 1)
+        self.assertEqual(gen.stats.decisions[0]['checks'], 1)
+        coverage = gen.stats.coverage()
+        self.assertEqual(coverage['decisions'][0]['covered'], ['x', 'y'])
+        self.assertEqual(coverage['decisions'][0]['added'], ['b'])
+        self.assertEqual(coverage['totals']['missing'], 0)
+
+    def testCovered(self):
+        suite = [loadPrevious(self.path)[0] + [{'x':0, 'y':0, 'b':True}]]
+        gen = MCDCgenerator(self.variables, self.expressions, [], {}, _previous=suite, _gaps=True)
+        self.assertEqual(len(gen.findVectors()), 0)
+        self.assertEqual(gen.stats.totals()['checks'], 0)
+        self.assertEqual(gen.stats.coverage()['totals'], {'covered':3, 'added':0, 'masked':0, 'missing':0})
+
+class TestMaskedConditions(unittest.TestCase):
+
+    def setUp(self):
+        self.variables = [Variable('int', 'x'), Variable('int', 'y'), Variable('int', 'z')]
+        # y only matters when x > 5, where x > 3 decides the outcome anyway
+        self.expressions = ["Or(v['x'] > 3, And(v['y'] > 0, v['x'] > 5))"]
+
+    def testPruned(self):
+        for engine in ['pushpop', 'assume']:
+            gen = MCDCgenerator(self.variables, self.expressions, [], {}, _engine=engine)
+            gen.findVectors()
+            record = gen.stats.decisions[0]
+            self.assertEqual(record['status'], {'x':'proven', 'y':'masked', 'z':'masked'})
+            # z does not occur in the decision, y is ruled out by the decision
+            # and its copy with another value for y
+            self.assertEqual(record['masked']['z'], [])
+            self.assertEqual(len(record['masked']['y']), 2)
+            self.assertTrue(all('y' in c for c in record['masked']['y']))
+
+    def testNoPrune(self):
+        gen = MCDCgenerator(self.variables, self.expressions, [], {}, _prune=False)
+        gen.findVectors()
+        record = gen.stats.decisions[0]
+        self.assertEqual(record['masked'], {})
+        self.assertEqual(record['status']['y'], 'unproven')
+
+class TestFlipEvaluation(unittest.TestCase):
+
+    def setUp(self):
+        self.v = {'x':Int('x'), 'r':Real('r'), 'b':Bool('b')}
+        self.expr = And(Or(self.v['x'] > 3, self.v['b']), self.v['r'] * 2 > 1)
+
+    def testFlipPair(self):
+        evaluate = Evaluator(self.v, self.expr)
+        values = {'x':5, 'r':Fraction(1), 'b':False}
+        sol1, sol2 = flipPair(evaluate, 'x', values, lambda sol: False)
+        self.assertEqual(sol1, values)
+        self.assertEqual(sol2, dict(values, x=3))
+        sol1, sol2 = flipPair(evaluate, 'b', dict(values, x=0), lambda sol: False)
+        self.assertEqual((sol1, sol2), (None, UNDECIDED))
+        # The outcome is open without x
+        self.assertEqual(flipPair(evaluate, 'r', {'r':Fraction(1)}, lambda sol: False), [UNDECIDED, UNDECIDED])
+        self.assertEqual(flipPair(evaluate, 'x', values, lambda sol: True)[1], UNDECIDED)
+
+    def testRejectedVector(self):
+        evaluate = Evaluator(self.v, self.expr)
+        values = {'x':5, 'r':Fraction(1), 'b':False}
+        # The vector itself was found already, its flip was not
+        sol1, sol2 = flipPair(evaluate, 'x', values, lambda sol: sol == values)
+        self.assertEqual(sol1, UNDECIDED)
+        self.assertEqual(sol2, dict(values, x=3))
+        # A vector with the other outcome cannot show the first side
+        sol1, sol2 = flipPair(evaluate, 'b', dict(values, x=0), lambda sol: True)
+        self.assertEqual((sol1, sol2), (None, UNDECIDED))
+
+    def testSavedChecks(self):
+        # The models Z3 returns depend on what earlier tests left in its
+        # context, so the checks are compared over several decisions
+        checks = {True:0, False:0}
+        for seed in range(1, 6):
+            case = dict(CASE_DEFAULTS, name='flip', seed=seed, numericRatio=1.0, conditions=8)
+            variables, expression, funcCalls = generateDecision(case)
+            flip = MCDCgenerator(variables, [expression], funcCalls, {}, _truthTable=False)
+            flip.findVectors()
+            plain = MCDCgenerator(variables, [expression], funcCalls, {}, _truthTable=False, _flip=False)
+            plain.findVectors()
+            self.assertTrue(flip.stats.totals()['evaluated'] > 0)
+            self.assertEqual(plain.stats.totals()['evaluated'], 0)
+            checks[True] += flip.stats.totals()['checks']
+            checks[False] += plain.stats.totals()['checks']
+        self.assertTrue(checks[True] < checks[False])
+        assume = MCDCgenerator(variables, [expression], funcCalls, {}, _engine='assume')
+        assume.findVectors()
+        self.assertEqual(assume.stats.totals()['evaluated'], 0)
+
+    def testDependencies(self):
+        variables = [Variable('int', 'x')]
+        funcCalls = [FuncCall('int', 'f', ["v['x'] + 1"])]
+        gen = MCDCgenerator(variables, ["v['f'] > 3"], funcCalls, {})
+        gen.findVectors()
+        self.assertEqual(gen.stats.totals()['evaluated'], 0)
+
+class TestPairEngine(unittest.TestCase):
+
+    def testChecksPerCondition(self):
+        case = dict(CASE_DEFAULTS, name='pair', seed=5, numericRatio=1.0, conditions=8)
+        variables, expression, funcCalls = generateDecision(case)
+        gen = MCDCgenerator(variables, [expression], funcCalls, {}, _engine='pair', _truthTable=False)
+        rows = gen.findVectors()
+        record = gen.stats.decisions[0]
+        self.assertTrue(record['checks'] <= 2 * len(record['status']))
+        self.assertTrue(set(record['status'].values()) <= set(['proven', 'masked']))
+        self.assertTrue(len(rows) >= 2)
+
+    def testMasked(self):
+        variables = [Variable('int', 'x'), Variable('int', 'y'), Variable('int', 'z')]
+        gen = MCDCgenerator(variables, ["Or(v['x'] > 3, And(v['y'] > 0, v['x'] > 5))"], [], {}, _engine='pair')
+        self.assertEqual(len(gen.findVectors()), 2)
+        record = gen.stats.decisions[0]
+        self.assertEqual(record['status'], {'x':'proven', 'y':'masked', 'z':'masked'})
+        self.assertEqual(len(record['masked']['y']), 2)
+        # The pair of x is found first, so y is ruled out by a single check
+        self.assertEqual(record['checks'], 2)
+
+    def testFuncCall(self):
+        # x only reaches the decision through f, which changes with it
+        variables = [Variable('int', 'x')]
+        funcCalls = [FuncCall('int', 'f', ["v['x'] + 1"])]
+        for engine in ['pushpop', 'pair']:
+            gen = MCDCgenerator(variables, ["v['f'] > 3"], funcCalls, {}, _engine=engine)
+            gen.findVectors()
+            self.assertEqual(gen.stats.decisions[0]['status'], {'x':'proven'})
+
+class TestMathModel(unittest.TestCase):
+
+    def testSqrt(self):
+        x = Real('x')
+        v = {'x':x}
+        self.assertEqual(createExpression(v, "sqrt(4.0)"), 2.0)
+        # A power of a half, not the half of a power
+        term = createExpression(v, "sqrt(v['x'])")
+        self.assertEqual(term.decl().kind(), Z3_OP_POWER)
+        self.assertEqual(simplify(term.arg(1)), RealVal('1/2'))
+
+    def testLinear(self):
+        variables = [Variable('real', 'x'), Variable('real', 'y')]
+        exprs = ["And(sqrt(v['x']) > 2, v['y'] < 3)", "Or(sin(v['x']) > 0.5, exp(v['y']) < 2)"]
+        for mode in ['uf', 'pwl']:
+            gen = MCDCgenerator(variables, exprs, [], {}, _mathMode=mode, _truthTable=False)
+            gen.findVectors()
+            self.assertEqual([d['logic'] for d in gen.stats.decisions], ['QF_LRA', 'QF_LRA'])
+
+    def testEvaluate(self):
+        x = Real('x')
+        model = MathModel('pwl', 4)
+        expr = createExpression({'x':x}, "sqrt(v['x']) > 2", model)
+        self.assertEqual(len(model.applications), 1)
+        names = set(['sqrt(x)'])
+        self.assertTrue(model.evaluate(expr, [(x, RealVal(5))], names))
+        self.assertFalse(model.evaluate(expr, [(x, RealVal(3))], names))
+
+    # Checks that every vector of the decision has its floating point
+    # outcome and every condition it shows a partner with the other one
+    def assertVerified(self, variables, expr, decide, **options):
+        gen = MCDCgenerator(variables, [expr], [], {}, _truthTable=False, **options)
+        res = list(gen.iterSolutions())
+        vectors = [dict((k, float(v.as_fraction())) for k, v in sol.items()) for sol, _, _ in res]
+        # Variables a vector leaves out are 0 in model completion
+        outcomes = [decide(**vector) for vector in vectors]
+        for vector, outcome, (_, _, proof) in zip(vectors, outcomes, res):
+            for c in proof:
+                partners = [o for other, o in zip(vectors, outcomes)
+                            if [k for k in vector if vector[k] != other.get(k)] == [c]]
+                self.assertIn(not outcome, partners)
+        return gen.stats.decisions[0]
+
+    def testVerified(self):
+        # Relaxations too coarse to tell x > 1 from x > 4 admit vectors the
+        # floating point outcome contradicts until they are refined
+        variables = [Variable('real', 'x')]
+        decide = lambda x=0.0: math.sqrt(x) > 2
+        for mode, segments in [('uf', 1), ('pwl', 1), ('pwl', 4), ('pwl', 16)]:
+            record = self.assertVerified(variables, "sqrt(v['x']) > 2", decide, _mathMode=mode,
+                                         _mathSegments=segments)
+            self.assertEqual(record['status'], {'x':'proven'})
+        variables = [Variable('real', 'x'), Variable('real', 'y')]
+        decide = lambda x=0.0, y=0.0: math.sin(x) > 0.5 or math.exp(y) < 2
+        for engine in ['pushpop', 'pair']:
+            self.assertVerified(variables, "Or(sin(v['x']) > 0.5, exp(v['y']) < 2)", decide, _mathMode='uf',
+                                _engine=engine)
+
+class TestDataTypes(unittest.TestCase):
+
+    def setUp(self):
+        self.dataTypes = {'Point':DataType('Point', [DataMember('x', 'int'), DataMember('y', 'real')]),
+                          'Seg':DataType('Seg', [DataMember('ends', 'Point[2]'), DataMember('len', 'int')])}
+
+    def testScalarize(self):
+        variables, shapes = scalarize([Variable('Seg', 's'), Variable('int[2][3]', 'm'), Variable('int', 'n')],
+                                      self.dataTypes)
+        names = dict((var.name, var.varType) for var in variables)
+        self.assertEqual(names['s.ends[1].y'], 'real')
+        self.assertEqual(names['m[1][2]'], 'int')
+        self.assertEqual(len(names), 5 + 6 + 1)
+        self.assertEqual(shapes['m'], [[None] * 3] * 2)
+        self.assertRaises(TypeError, scalarize, [Variable('Node', 'n')],
+                          {'Node':DataType('Node', [DataMember('next', 'Node')])})
+
+    def testFields(self):
+        v = {'p.x':Int('p.x'), 'a[2]':Int('a[2]'), 's.ends[0].x':Int('s.ends[0].x')}
+        self.assertTrue(createExpression(v, "p.x > a[2]").eq(v['p.x'] > v['a[2]']))
+        self.assertTrue(createExpression(v, "v['p']['x'] > v['a'][2]").eq(v['p.x'] > v['a[2]']))
+        self.assertTrue(createExpression(v, "s.ends[0].x == 1").eq(v['s.ends[0].x'] == 1))
+        self.assertRaises(ParseError, SyntaxTable().parse, "a[v['i']] > 0")
+
+    def testNesting(self):
+        _, shapes = scalarize([Variable('Seg', 's'), Variable('int[3]', 'a')], self.dataTypes)
+        flat = {'s.ends[1].x':1, 's.len':2, 'a[0]':3, 'n':4}
+        nested = nestValues(flat, shapes)
+        self.assertEqual(nested, {'s':{'ends':[None, {'x':1}], 'len':2}, 'a':[3, None, None], 'n':4})
+        self.assertEqual(flattenValues(nested), flat)
+
+    def testVectors(self):
+        variables = [Variable('Point', 'p'), Variable('int[2]', 'a')]
+        gen = MCDCgenerator(variables, ["Or(p.x > a[0], p.y < 2.5)"], [], self.dataTypes, _engine='pair')
+        rows = gen.findVectors()
+        self.assertEqual(gen.stats.decisions[0]['status'],
+                         {'p.x':'proven', 'p.y':'proven', 'a[0]':'proven', 'a[1]':'masked'})
+        outputs = [rows.toOutput(row) for row in rows]
+        self.assertTrue(all(set(o) <= set(['p', 'a']) for o in outputs))
+        # Nested vectors of an earlier run cover the decision again
+        again = MCDCgenerator(variables, ["Or(p.x > a[0], p.y < 2.5)"], [], self.dataTypes, _engine='pair',
+                              _previous=[outputs])
+        again.findVectors()
+        self.assertEqual(again.stats.totals()['checks'], 0)
+
 if __name__ == '__main__':
     unittest.main()
 
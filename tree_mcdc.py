@@ -0,0 +1,301 @@
+from z3 import *
+from expr_parse_tree import constructTree
+from utils import solutionKey, pairProofs
+
+"""
+Derives MC/DC independence pairs from the structure of a decision instead
+of enumerating models. Every subtree gets a witness for each outcome: a
+partial assignment of truth values to its operands which forces the
+subtree to that outcome. A condition is shown by setting the siblings on
+its path to the root to non-masking values and toggling it. Z3 is only
+used to find variable values satisfying the operand truth values, which
+is at most three checks per condition.
+
+A witness maps the ast id of an operand to (operand, value). None means
+no witness exists, for example because an operand would need two values.
+
+Conditions are reported by variable like the other engines do: the pair
+of an operand shows the variables of its cone of influence the two
+vectors differ in.
+"""
+
+# The largest witness is copied rather than merged entry by entry
+def mergeWitnesses(witnesses):
+    if not witnesses:
+        return {}
+    if any(w is None for w in witnesses):
+        return None
+    largest = max(range(len(witnesses)), key=lambda j: len(witnesses[j]))
+    res = dict(witnesses[largest])
+    for j, w in enumerate(witnesses):
+        if j == largest:
+            continue
+        for k, (atom, value) in w.items():
+            if k in res and res[k][1] != value:
+                return None
+            res[k] = (atom, value)
+    return res
+
+"""
+The merges of all but one of witnesses, the operand witnesses of a wide
+And or Or. Each operand's truth values are counted once, so leaving one
+witness out only undoes its own entries instead of merging the others
+again.
+"""
+class SiblingMerge:
+    def __init__(self, witnesses):
+        self.witnesses = witnesses
+        self.missing = sum(1 for w in witnesses if w is None)
+        # Per ast id the operand and how many witnesses want it False, True
+        self.counts = {}
+        for w in witnesses:
+            for k, (atom, value) in (w or {}).items():
+                self.counts.setdefault(k, [atom, 0, 0])[1 + value] += 1
+        self.conflicts = [k for k, (_, f, t) in self.counts.items() if f and t]
+        self.merged = {k:(atom, t > 0) for k, (atom, f, t) in self.counts.items() if not (f and t)}
+
+    # Returns the merge of all witnesses but the one at i
+    def without(self, i):
+        w = self.witnesses[i]
+        if self.missing > (w is None):
+            return None
+        w = w or {}
+        # Only a witness alone in one value of every conflict resolves them
+        if any(k not in w or self.counts[k][1 + w[k][1]] != 1 for k in self.conflicts):
+            return None
+        res = dict(self.merged)
+        for k, (atom, value) in w.items():
+            if self.counts[k][1 + value] == 1:
+                if self.counts[k][2 - value]:
+                    res[k] = (atom, not value)
+                else:
+                    del res[k]
+        return res
+
+def firstWitness(witnesses):
+    for w in witnesses:
+        if w is not None:
+            return w
+    return None
+
+# Returns the (same, different) witnesses of two (true, false) witnesses
+def parity(a, b):
+    return firstWitness([mergeWitnesses([a[0], b[0]]), mergeWitnesses([a[1], b[1]])]), \
+        firstWitness([mergeWitnesses([a[0], b[1]]), mergeWitnesses([a[1], b[0]])])
+
+# Returns the (true, false) witnesses of the xor of all args
+def xorWitness(args):
+    res = args[0]
+    for b in args[1:]:
+        same, different = parity(res, b)
+        res = (different, same)
+    return res
+
+class TreeEngine:
+    def __init__(self, generator, solver):
+        self.generator = generator
+        self.solver = solver
+        self.witnesses = {}
+        self.siblings = {}
+
+    # Returns the (true, false) witnesses of node, memoized in self.witnesses
+    def witness(self, node):
+        key = id(node)
+        if key not in self.witnesses:
+            self.witnesses[key] = self.computeWitness(node)
+        return self.witnesses[key]
+
+    def computeWitness(self, node):
+        e = node.value
+        if node.isOperand():
+            return {e.get_id():(e, True)}, {e.get_id():(e, False)}
+
+        kind = e.decl().kind()
+        if kind == Z3_OP_TRUE:
+            return {}, None
+        if kind == Z3_OP_FALSE:
+            return None, {}
+
+        args = [self.witness(c) for c in node.children]
+        if kind == Z3_OP_NOT:
+            return args[0][1], args[0][0]
+        if kind == Z3_OP_AND:
+            return mergeWitnesses([a[0] for a in args]), firstWitness([a[1] for a in args])
+        if kind == Z3_OP_OR:
+            return firstWitness([a[0] for a in args]), mergeWitnesses([a[1] for a in args])
+        if kind == Z3_OP_IMPLIES:
+            a, b = args
+            return firstWitness([a[1], b[0]]), mergeWitnesses([a[0], b[1]])
+        # More than two Booleans are never distinct
+        if kind == Z3_OP_DISTINCT and len(args) > 2:
+            return None, {}
+        if kind in [Z3_OP_XOR, Z3_OP_DISTINCT]:
+            return xorWitness(args)
+        if kind in [Z3_OP_IFF, Z3_OP_EQ]:
+            return parity(args[0], args[1])
+        if kind == Z3_OP_ITE:
+            c, t, f = args
+            return firstWitness([mergeWitnesses([c[0], t[0]]), mergeWitnesses([c[1], f[0]])]), \
+                firstWitness([mergeWitnesses([c[0], t[1]]), mergeWitnesses([c[1], f[1]])])
+        raise NotImplementedError(e)
+
+    """
+    Returns what sensitize needs of the siblings of every child of node,
+    computed once per node: a SiblingMerge of the true witnesses of an And
+    and the false ones of an Or, and the (true, false) witnesses of the xor
+    of the children before and after each child of a parity node.
+    """
+    def siblingWitnesses(self, node, kind):
+        key = id(node)
+        if key in self.siblings:
+            return self.siblings[key]
+        args = [self.witness(c) for c in node.children]
+        if kind in [Z3_OP_AND, Z3_OP_OR]:
+            res = SiblingMerge([a[0 if kind == Z3_OP_AND else 1] for a in args])
+        else:
+            # The xor of no children is false
+            prefix, suffix = [(None, {})], [(None, {})]
+            for a, b in zip(args, reversed(args)):
+                prefix.append(parity(prefix[-1], a)[::-1])
+                suffix.append(parity(b, suffix[-1])[::-1])
+            res = prefix, suffix[::-1]
+        self.siblings[key] = res
+        return res
+
+    """
+    Returns the sibling witnesses which let the outcome of child i decide
+    the outcome of node, and whether the outcome is negated. Returns None
+    for the witness if the child is always masked.
+    """
+    def sensitize(self, node, i):
+        kind = node.value.decl().kind()
+        if kind == Z3_OP_NOT:
+            return {}, True
+        if kind in [Z3_OP_AND, Z3_OP_OR]:
+            return self.siblingWitnesses(node, kind).without(i), False
+        if kind == Z3_OP_IMPLIES:
+            other = self.witness(node.children[1 - i])
+            if i == 0:
+                return other[1], True
+            return other[0], False
+        if kind == Z3_OP_DISTINCT and len(node.children) > 2:
+            return None, False
+        if kind in [Z3_OP_IFF, Z3_OP_EQ, Z3_OP_XOR, Z3_OP_DISTINCT]:
+            # The child decides the outcome through the xor of its siblings
+            prefix, suffix = self.siblingWitnesses(node, kind)
+            false, true = parity(prefix[i], suffix[i + 1])
+            negated = kind in [Z3_OP_XOR, Z3_OP_DISTINCT]
+            if true is not None:
+                return true, negated
+            return false, not negated
+        if kind == Z3_OP_ITE:
+            c, t, f = [self.witness(x) for x in node.children]
+            if i == 1:
+                return c[0], False
+            if i == 2:
+                return c[1], False
+            same = mergeWitnesses([t[0], f[1]])
+            if same is not None:
+                return same, False
+            return mergeWitnesses([t[1], f[0]]), True
+        raise NotImplementedError(node.value)
+
+    # Returns (operand node, sibling witness, negated) for every operand reachable
+    # from node with non-masking siblings. Shared operands are only shown once.
+    def conditions(self, node, required, negated, seen, res):
+        if node.isOperand():
+            if node.value.get_id() not in seen:
+                seen.add(node.value.get_id())
+                res.append((node, required, negated))
+            return res
+        for i, child in enumerate(node.children):
+            siblings, flip = self.sensitize(node, i)
+            merged = mergeWitnesses([required, siblings])
+            if merged is None:
+                self.masked.append(child)
+                continue
+            self.conditions(child, merged, negated != flip, seen, res)
+        return res
+
+    # Checks that the operands can take the values of witness with the given
+    # decision outcome and the extra constraints. Returns the solution and the
+    # values of atoms in the model, None when no atoms are given.
+    def check(self, witness, expr, outcome, atoms=None, extra=()):
+        s = self.solver
+        s.push()
+        s.add([a if v else Not(a) for a, v in witness.values()])
+        s.add(list(extra))
+        s.add(expr if outcome else Not(expr))
+        res = None
+        if s.check()==sat:
+            values = None
+            if atoms is not None:
+                model = s.model()
+                values = {k:(a, is_true(model.eval(a, model_completion=True))) for k, a in atoms.items()}
+            res = (self.generator.modelToDict(s), values)
+        s.pop()
+        return res
+
+    # Returns the condition variables in the cone of influence of e
+    def variables(self, e):
+        g = self.generator
+        _, names = g.constraints.dependentConstraints(e)
+        return sorted(n for n in names if n in g.variables and n not in g.skipVar)
+
+    """
+    Returns the vectors showing every condition of expr and the
+    conditions which could not be shown. The conditions of expr are kept
+    in names and the conditions each vector shows in proofs.
+    """
+    def solve(self, expr):
+        self.witnesses = {}
+        self.siblings = {}
+        self.masked = []
+        self.names = self.variables(expr)
+        root = constructTree(self.generator.variables, expr)
+        conditions = self.conditions(root, {}, False, set(), [])
+        atoms = {node.value.get_id():node.value for node, _, _ in conditions}
+
+        vectors = []
+        keys = set()
+        pairs = {}
+        self.solver.push()
+        self.solver.add(self.generator.dependencies(expr))
+        g = self.generator
+        for node, required, negated in conditions:
+            atom = node.value
+            key = atom.get_id()
+            names = self.variables(atom)
+            # The checks of an operand over several variables count for the decision
+            self.generator.stats.condition = names[0] if len(names) == 1 else None
+            first = mergeWitnesses([required, {key:(atom, True)}])
+            res = None if first is None else self.check(first, expr, not negated, atoms)
+            if res is None:
+                continue
+            solution1, values = res
+
+            # Keep every other operand at the same value when possible and
+            # flip the operand through each of its variables in turn
+            values[key] = (atom, False)
+            for name in names:
+                if name in pairs:
+                    continue
+                self.generator.stats.condition = name
+                differ = [g.variables[name] != solution1[name]] if name in solution1 else []
+                res = self.check(values, expr, negated, extra=differ)
+                if res is None:
+                    res = self.check(mergeWitnesses([required, {key:(atom, False)}]), expr, negated, extra=differ)
+                if res is None:
+                    continue
+                solution2 = res[0]
+                for sol in [solution1, solution2]:
+                    if solutionKey(sol) not in keys:
+                        keys.add(solutionKey(sol))
+                        vectors.append(sol)
+                for n in names:
+                    if n in solution1 and n in solution2 and not solution1[n].eq(solution2[n]):
+                        pairs.setdefault(n, [(solutionKey(solution1), solutionKey(solution2))])
+        self.generator.stats.condition = None
+        self.solver.pop()
+        self.proofs = pairProofs(pairs, [solutionKey(sol) for sol in vectors])
+        return vectors, [name for name in self.names if name not in pairs]
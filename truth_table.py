@@ -0,0 +1,193 @@
+from z3 import *
+import operator
+from functools import reduce
+from utils import pairProofs
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""
+Finds MC/DC independence pairs of pure Boolean decisions without a solver.
+The decision is compiled to bitwise NumPy operations over the whole truth
+table, packed 64 rows per word. Row r assigns condition j the value of
+bit j of r, conditions are numbered in sorted name order.
+"""
+
+MAX_CONDITIONS = 24
+MAX_CANDIDATES = 256
+
+WORD_BITS = 64
+ALL_ONES = 0xFFFFFFFFFFFFFFFF
+# Bit patterns of the first six conditions within one word
+LOW_PATTERNS = [sum(1 << b for b in range(WORD_BITS) if (b >> j) & 1) for j in range(6)]
+
+BOOL_OPS = [Z3_OP_TRUE, Z3_OP_FALSE, Z3_OP_NOT, Z3_OP_AND, Z3_OP_OR, Z3_OP_IMPLIES,
+            Z3_OP_IFF, Z3_OP_XOR, Z3_OP_ITE, Z3_OP_EQ, Z3_OP_DISTINCT]
+
+"""Returns the conditions of expr or None if it is not a pure Boolean decision"""
+def findConditions(expr, skipVar):
+    conditions = {}
+    seen = set()
+    todo = [expr]
+    while todo:
+        e = todo.pop()
+        if e.get_id() in seen:
+            continue
+        seen.add(e.get_id())
+        if not is_bool(e) or not is_app(e):
+            return None
+        if is_const(e) and e.decl().kind() == Z3_OP_UNINTERPRETED:
+            if e.decl().name() in skipVar:
+                return None
+            conditions[e.decl().name()] = e
+        elif e.decl().kind() in BOOL_OPS:
+            todo.extend(e.children())
+        else:
+            return None
+    return conditions
+
+def isTruthTableDecision(expr, skipVar):
+    if np is None:
+        return False
+    conditions = findConditions(expr, skipVar)
+    return conditions is not None and 0 < len(conditions) <= MAX_CONDITIONS
+
+class TruthTable:
+    def __init__(self, expr, names):
+        self.names = names
+        self.ctx = expr.ctx
+        self.n = len(names)
+        self.words = max(1, (1 << self.n) // WORD_BITS)
+        rows = 1 << self.n
+        self.valid = np.uint64(ALL_ONES if rows >= WORD_BITS else (1 << rows) - 1)
+        self.wordIndex = np.arange(self.words, dtype=np.uint64)
+        self.columns = {name:self.column(j) for j, name in enumerate(names)}
+        self.cache = {}
+        self.outcome = self.evaluate(expr) & self.valid
+
+    def column(self, j):
+        if j < 6:
+            return np.full(self.words, LOW_PATTERNS[j], dtype=np.uint64)
+        bit = (self.wordIndex >> np.uint64(j-6)) & np.uint64(1)
+        return bit * np.uint64(ALL_ONES)
+
+    def constant(self, value):
+        return np.full(self.words, ALL_ONES if value else 0, dtype=np.uint64)
+
+    def evaluate(self, e):
+        key = e.get_id()
+        if key not in self.cache:
+            self.cache[key] = self.apply(e)
+        return self.cache[key]
+
+    def apply(self, e):
+        kind = e.decl().kind()
+        if kind == Z3_OP_UNINTERPRETED:
+            return self.columns[e.decl().name()]
+        if kind == Z3_OP_TRUE:
+            return self.constant(True)
+        if kind == Z3_OP_FALSE:
+            return self.constant(False)
+
+        args = [self.evaluate(c) for c in e.children()]
+        if kind == Z3_OP_NOT:
+            return ~args[0]
+        if kind == Z3_OP_AND:
+            return reduce(operator.and_, args)
+        if kind == Z3_OP_OR:
+            return reduce(operator.or_, args)
+        if kind == Z3_OP_IMPLIES:
+            return ~args[0] | args[1]
+        if kind in [Z3_OP_IFF, Z3_OP_EQ]:
+            return ~(args[0] ^ args[1])
+        if kind == Z3_OP_XOR:
+            return reduce(operator.xor, args)
+        if kind == Z3_OP_DISTINCT:
+            # Every two arguments differ, which more than two Booleans never do
+            return reduce(operator.and_, [a ^ b for i, a in enumerate(args) for b in args[i+1:]])
+        if kind == Z3_OP_ITE:
+            return (args[0] & args[1]) | (~args[0] & args[2])
+        raise NotImplementedError(e)
+
+    # Returns the words where condition j is false, with a bit set for every
+    # row where flipping j changes the outcome, and the index of each word
+    def changes(self, j):
+        if j < 6:
+            shift = np.uint64(1 << j)
+            low = np.uint64(ALL_ONES ^ LOW_PATTERNS[j])
+            return (self.outcome ^ (self.outcome >> shift)) & low & self.valid, self.wordIndex
+        stride = 1 << (j-6)
+        pairs = self.outcome.reshape(-1, 2, stride)
+        index = self.wordIndex.reshape(-1, 2, stride)[:, 0, :]
+        return (pairs[:, 0, :] ^ pairs[:, 1, :]).ravel(), index.ravel()
+
+    # Returns rows where condition j is false and flipping it changes the outcome
+    def candidates(self, j):
+        mask, index = self.changes(j)
+        res = []
+        for w in np.flatnonzero(mask):
+            word = int(mask[w])
+            while word:
+                low = word & -word
+                res.append(int(index[w])*WORD_BITS + low.bit_length() - 1)
+                word ^= low
+            if len(res) >= MAX_CANDIDATES:
+                break
+        return res
+
+    """
+    Picks one independence pair per condition. Pairs sharing rows with
+    already picked pairs are preferred so fewer vectors are needed.
+    Returns the rows in order of selection and the conditions without pairs.
+    The picked pair of every condition is kept in chosen.
+    """
+    def selectPairs(self):
+        rows = []
+        selected = set()
+        masked = []
+        self.chosen = {}
+        for j in range(self.n):
+            candidates = self.candidates(j)
+            if not candidates:
+                masked.append(self.names[j])
+                continue
+            bit = 1 << j
+            best = max(candidates, key=lambda r: ((r in selected) + ((r | bit) in selected), -r))
+            self.chosen[self.names[j]] = [(best, best | bit)]
+            for r in [best, best | bit]:
+                if r not in selected:
+                    selected.add(r)
+                    rows.append(r)
+        return rows, masked
+
+    def rowToDict(self, row):
+        return {name:BoolVal(bool((row >> j) & 1), self.ctx) for j, name in enumerate(self.names)}
+
+"""
+Returns the table of a pure Boolean decision and the candidate
+independence pairs of every condition as pairs of rows
+"""
+def truthTablePairs(expr, skipVar):
+    conditions = findConditions(expr, skipVar)
+    table = TruthTable(expr, sorted(conditions.keys()))
+    pairs = {}
+    for j, name in enumerate(table.names):
+        pairs[name] = [(r, r | (1 << j)) for r in table.candidates(j)]
+    return table, pairs
+
+"""
+Returns the MC/DC vectors of a pure Boolean decision, the masked
+conditions and the conditions shown by each vector
+"""
+def truthTableProofs(expr, skipVar):
+    conditions = findConditions(expr, skipVar)
+    table = TruthTable(expr, sorted(conditions.keys()))
+    rows, masked = table.selectPairs()
+    return [table.rowToDict(r) for r in rows], masked, pairProofs(table.chosen, rows)
+
+"""Returns the MC/DC vectors of a pure Boolean decision and the masked conditions"""
+def truthTableSolutions(expr, skipVar):
+    vectors, masked, _ = truthTableProofs(expr, skipVar)
+    return vectors, masked
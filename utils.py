@@ -3,44 +3,56 @@ import logging
 from z3 import *
 from z3math import *
 from classes import Variable, FuncCall, Assignment
+from expr_parser import ExpressionBuilder, ParseError
+from int_types import isIntType, isUnsignedType, createBitVecSort, createBitVecVal, createBitVec, bitVecToPython
 
 """
 Takes a Variable or FuncCall and creates a z3 variable from it. 
 Constants become TypeVals instead.
 Assignments become varibales but have different logic later on than the normal variables.
+Variables of type int get the type intEncoding, 'int' or one of int_types.INT_TYPES.
+Struct and array variables are flattened into scalars by data_types first.
+The variable is created in the Z3 context ctx, the main context by default.
 """
-def createVar(var):
+def createVar(var, intEncoding='int', ctx=None):
     if (isinstance(var, Variable)):
+        varType = intEncoding if var.varType == "int" else var.varType
         if var.isConst():
-            return createZ3Val(var.varType, var.constValue)
+            return createZ3Val(varType, var.constValue, ctx)
         elif var.isAssignment():
-            return createZ3Var(var.varType, var.name)
+            return createZ3Var(varType, var.name, ctx)
         else:
-            if len(var.varType) > 4 and var.varType[:5] == "Array":
-                arrayType = t[5:]
-                return Array(n, createZ3Sort(arrayType), createZ3Sort(arrayType))
-            return createZ3Var(var.varType, var.name)
+            return createZ3Var(varType, var.name, ctx)
     elif (isinstance(var, FuncCall)):
-        return createZ3Var(var.returnType, var.callName)
+        return createZ3Var(intEncoding if var.returnType == "int" else var.returnType, var.callName, ctx)
     else:
         raise TypeError(var)
 
-"""Takes a FuncCall and creates a z3 expression from it"""
-def createFunctionCall(v, funcCall):
+"""
+Takes a FuncCall and creates a z3 expression from it: the call returns
+the value of one of its expressions
+"""
+def createFunctionCall(v, funcCall, math=None, unsigned=(), builder=None):
     callName = funcCall.callName
     callExpressions = funcCall.expressions
 
     if len(callExpressions)==1:
-        return v[callName]==createExpression(v, callExpressions[0])
+        return v[callName]==createExpression(v, callExpressions[0], math, unsigned, builder, v[callName])
+    return Or([v[callName]==createExpression(v, e, math, unsigned, builder, v[callName]) for e in callExpressions])
 
-    res = [v[callName]==createExpression(v, callExpressions[0])]
-    for i in range(1,len(callExpressions)):
-        res.append(And(Not(res[i-1]),v[callName]==createExpression(v, callExpressions[i])))
-    return Or(res)
+"""Returns whether the Variable or FuncCall var is an unsigned bit-vector"""
+def isUnsignedVar(var, intEncoding='int'):
+    varType = var.returnType if isinstance(var, FuncCall) else var.varType
+    return isUnsignedType(intEncoding if varType == "int" else varType)
 
-"""Takes a z3 ast variable and converts it's value to python type"""
-def z3TypeToPython(var):
-    if is_bool(var):
+"""
+Takes a z3 ast variable and converts it's value to python type.
+Bit-vectors are signed unless the variable they belong to is unsigned.
+"""
+def z3TypeToPython(var, unsigned=False):
+    if is_bv(var):
+        return bitVecToPython(var, unsigned)
+    elif is_bool(var):
         return bool(var)
     elif is_int(var):
         return var.as_long()
@@ -50,54 +62,172 @@ def z3TypeToPython(var):
         return var.as_string()
     else:
         raise NotImplementedError(var)
+
+"""
+Takes a z3 variable and a value from z3TypeToPython and recreates the z3
+value. Reals which as_decimal had to round cannot be recreated.
+"""
+def pythonToZ3(var, val):
+    if is_bv(var):
+        return BitVecVal(val, var.size(), var.ctx)
+    elif is_bool(var):
+        return BoolVal(val, var.ctx)
+    elif is_int(var):
+        return IntVal(val, var.ctx)
+    elif is_real(var):
+        if str(val).endswith('?'):
+            raise ValueError("inexact value {}".format(val))
+        return RealVal(val, var.ctx)
+    elif is_string(var):
+        return StringVal(val, var.ctx)
+    else:
+        raise NotImplementedError(var)
+
+"""Returns the names of the uninterpreted constants used in a z3 expression"""
+def collectConstants(expr):
+    res = set()
+    seen = set()
+    todo = [expr]
+    while todo:
+        e = todo.pop()
+        if e.get_id() in seen:
+            continue
+        seen.add(e.get_id())
+        if is_const(e) and e.decl().kind() == Z3_OP_UNINTERPRETED:
+            res.add(e.decl().name())
+        elif is_app(e):
+            todo.extend(e.children())
+    return res
+
+# Returns the uninterpreted declarations of exprs by name, so text which
+# refers to them can be parsed without declaring them again
+def collectDeclarations(exprs):
+    res = {}
+    seen = set()
+    todo = list(exprs)
+    while todo:
+        e = todo.pop()
+        if e.get_id() in seen:
+            continue
+        seen.add(e.get_id())
+        if is_app(e):
+            if e.decl().kind() == Z3_OP_UNINTERPRETED:
+                res[e.decl().name()] = e.decl()
+            todo.extend(e.children())
+    return res
+
+"""
+Returns a hashable key for a solution dict. Z3 values are hash-consed so
+equal values share an ast id while the solution is alive.
+"""
+def solutionKey(sol):
+    return frozenset((k, v.get_id()) for k, v in sol.items())
+
+"""
+Returns the conditions shown by each selected vector, given the candidate
+independence pairs of every condition. A condition is shown by the first
+of its pairs with both vectors selected.
+"""
+def pairProofs(pairs, selected):
+    chosen = set(selected)
+    res = {x:[] for x in selected}
+    for c in sorted(pairs):
+        for a, b in pairs[c]:
+            if a in chosen and b in chosen:
+                res[a].append(c)
+                res[b].append(c)
+                break
+    return [res[x] for x in selected]
+
+"""Takes a z3 value and converts it to a string which can be pickled"""
+def serializeZ3Val(val):
+    if is_string(val):
+        return val.as_string()
+    if is_algebraic_value(val):
+        val = val.approx(20)
+    return str(val)
+
+"""Takes a z3 variable and a string from serializeZ3Val and recreates the value"""
+def deserializeZ3Val(var, val):
+    if is_bv(var):
+        return BitVecVal(long(val), var.size(), var.ctx)
+    elif is_bool(var):
+        return BoolVal(val == 'True', var.ctx)
+    elif is_int(var):
+        return IntVal(str(val), var.ctx)
+    elif is_real(var):
+        return RealVal(str(val), var.ctx)
+    elif is_string(var):
+        return StringVal(val, var.ctx)
+    else:
+        raise NotImplementedError(var)
+
 """
 Takes a string expression in z3 format which may use 
 any z3 variable defined in v. v should be a dictionary.
+Expressions are parsed by expr_parser. Calls given the same builder, an
+ExpressionBuilder over v, share parsed and built subterms. Anything
+outside its grammar falls back to eval. math is the z3math.MathModel of
+the run, the z3math functions are used without one. unsigned holds the
+names of the unsigned bit-vector variables, eval treats every bit-vector
+as signed. The value of a bit-vector target is converted to its type.
 """
-def createExpression(v, expr):
-    expr = eval(expr)
-    return expr
+def createExpression(v, expr, math=None, unsigned=(), builder=None, target=None):
+    if builder is None:
+        builder = ExpressionBuilder(v, math, unsigned)
+    try:
+        return builder.createExpression(expr, target)
+    except ParseError:
+        if builder.math is None:
+            return eval(expr)
+        return eval(expr, dict(globals(), **builder.math.functions()), {'v':v})
 
 """
 Takes a Assignment class and creates a z3 constraint
 """
-def createAssignment(v, a):
+def createAssignment(v, a, math=None, unsigned=(), builder=None):
     assert isinstance(a, Assignment)
-    return v[a.name] == createExpression(v, a.assignment)
+    return v[a.name] == createExpression(v, a.assignment, math, unsigned, builder, v[a.name])
 
-def createZ3Sort(sort):
+def createZ3Sort(sort, ctx=None):
+    if isIntType(sort):
+        return createBitVecSort(sort, ctx)
     if sort == "int":
-        return IntSort()
+        return IntSort(ctx)
     if sort == "real":
-        return RealSort()
+        return RealSort(ctx)
     if sort == "bool":
-        return BoolSort()
+        return BoolSort(ctx)
     if sort == "string":
-        return StringSort()
+        return StringSort(ctx)
     
     raise TypeError(sort)
 
-def createZ3Val(sort, val):
+def createZ3Val(sort, val, ctx=None):
+    if isIntType(sort):
+        return createBitVecVal(sort, val, ctx)
     if sort == "int":
-        return IntVal(val)
+        return IntVal(val, ctx)
     if sort == "real":
-        return RealVal(val)
+        return RealVal(val, ctx)
     if sort == "bool":
-        return BoolVal(val)
+        return BoolVal(val, ctx)
     if sort == "string":
-        return StringVal(val)
+        return StringVal(val, ctx)
     
     raise TypeError(sort)
 
-def createZ3Var(t, n):
+def createZ3Var(t, n, ctx=None):
+    if isIntType(t):
+        return createBitVec(t, n, ctx)
     if t == "int":
-        return Int(n)
+        return Int(n, ctx)
     if t == "real":
-        return Real(n)
+        return Real(n, ctx)
     if t == "bool":
-        return Bool(n)
+        return Bool(n, ctx)
     if t == "string":
-        return String(n)
+        return String(n, ctx)
     
     raise TypeError(t)
     
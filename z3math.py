@@ -1,18 +1,122 @@
 from z3 import *
-import math
+import math, operator, __builtin__
+from fractions import Fraction
+from int_types import promote, binary, arithmetic, isIntOperation, isBitVec
+
+"""
+Math functions of the expression language. The module functions build
+exact terms where Z3 has them: pow, exp and sqrt become nonlinear powers,
+sin, cos and tan uninterpreted functions since Z3 has no trigonometry.
+Numeral arguments are folded with Python's math.
+
+A MathModel builds the functions of one run in one of MATH_MODES instead.
+'exact' builds what the module functions build. 'uf' gives every
+transcendental application a real variable of its own, constrained by the
+range of the function, its value at 0 and, for monotone functions, its
+order against the values at segments+1 points of an interval. 'pwl' adds a
+piecewise linear relaxation: on each of segments pieces of the interval
+the result stays within the chord of the function, widened by the largest
+distance of the function from it. Both keep decisions in linear
+arithmetic. In 'exact' mode sin, cos and tan are modelled as in 'uf'.
+
+Result variables are defined by constraints like funcCall results, which
+MCDCgenerator asserts for the decisions using them. The relaxations may
+admit vectors the real functions do not, so evaluate recomputes a decision
+with floating point math. The arguments of such vectors are refinement
+points of the applications: the next model of the decision also orders
+the result against the value at each point, and bounds it by the tangent
+of a convex or concave function there or by the slope bound of sin and
+cos. A sampled MathModel keeps each argument at the segment and refinement
+points instead, where the result is the floating point value, so its
+vectors hold under floating point math.
+"""
 
 M_PI = RealVal('3.14159265358979323846')
 
+MATH_MODES = ['exact', 'uf', 'pwl']
+DEFAULT_SEGMENTS = 16
+
+# Points the distance of a function from its chord is sampled at per segment
+SAMPLES = 16
+# Relative widening of every bound taken from floating point values
+TOLERANCE = 1e-9
+
+def _isNumeral(x):
+    return not is_expr(x) or is_int_value(x) or is_rational_value(x)
+
+def _float(x):
+    if not is_expr(x):
+        return float(x)
+    if is_int_value(x):
+        return float(x.as_long())
+    if is_rational_value(x):
+        return float(x.as_fraction())
+    if is_algebraic_value(x):
+        return float(x.approx(20).as_fraction())
+    raise TypeError(x)
+
+# Applies f to numeral arguments with Python's math, None for Z3 terms or
+# arguments outside the domain of f
+def _fold(f, *args):
+    if not all(_isNumeral(a) for a in args):
+        return None
+    try:
+        res = f(*[_float(a) for a in args])
+    except (ValueError, OverflowError, ZeroDivisionError):
+        return None
+    return None if math.isnan(res) or math.isinf(res) else res
+
+def _fraction(x):
+    if not is_expr(x):
+        return Fraction(x)
+    if is_int_value(x):
+        return Fraction(x.as_long())
+    if is_rational_value(x):
+        return x.as_fraction()
+    if is_algebraic_value(x):
+        return x.approx(20).as_fraction()
+    raise TypeError(x)
+
+def _real(c, ctx=None):
+    c = Fraction(c).limit_denominator(10**9)
+    return RealVal("{}/{}".format(c.numerator, c.denominator), ctx)
+
+# Unlike _real keeps the value of a float or Fraction exactly
+def _exact(c, ctx=None):
+    c = Fraction(c)
+    return RealVal("{}/{}".format(c.numerator, c.denominator), ctx)
+
+def _toReal(x):
+    return ToReal(x) if is_int(x) else x
+
+# Returns the name of the result variable of name applied to args
+def _label(name, args):
+    return "{}({})".format(name, ", ".join(" ".join(str(a).split()) for a in args))
+
+def _uf(name, *args):
+    ctx = [a.ctx for a in args if is_expr(a)][0]
+    return Function(name, *([RealSort(ctx)] * (len(args) + 1)))(*[_toReal(a) for a in args])
+
 def sin(x):
-    return IntVal('0')
+    res = _fold(math.sin, x)
+    return _uf('sin', x) if res is None else res
 
 def cos(x):
-    return IntVal('1')
+    res = _fold(math.cos, x)
+    return _uf('cos', x) if res is None else res
 
 def tan(x):
-    return IntVal('0')
+    res = _fold(math.tan, x)
+    return _uf('tan', x) if res is None else res
 
-def abs(x):
+# abs, min and max of bit-vectors are told which of their arguments are
+# unsigned. Their arguments are promoted and converted like the operands
+# of an operator.
+def abs(x, unsigned=(False,)):
+    if isBitVec(x):
+        x, unsigned = promote(x, unsigned[0])
+        if unsigned:
+            return x
     return If(x >= 0,x,-x)
 
 def fabs(x):
@@ -26,10 +130,313 @@ def pow(x,y):
     return x**y
 
 def sqrt(x):
-    return x**1.0/2
+    return x**(1.0/2)
+
+def min(x,y, unsigned=(False, False)):
+    if isIntOperation(x, y):
+        x, y, common = arithmetic(x, y, unsigned)
+        unsigned = (common, common)
+    return If(binary('<', x, y, operator.lt, unsigned), x, y)
+
+def max(x,y, unsigned=(False, False)):
+    if isIntOperation(x, y):
+        x, y, common = arithmetic(x, y, unsigned)
+        unsigned = (common, common)
+    return If(binary('>=', x, y, operator.ge, unsigned), x, y)
+
+# For each function a MathModel relaxes: the Python function, the interval
+# of its piecewise linear relaxation, its range, whether it increases (1)
+# or decreases (-1), the open interval it does so on and whether it is only
+# defined for arguments of at least 0
+UNARY = {
+    'sin': (math.sin, (-math.pi, math.pi), (-1, 1), 0, (None, None), False),
+    'cos': (math.cos, (-math.pi, math.pi), (-1, 1), 0, (None, None), False),
+    'tan': (math.tan, (-1.4, 1.4), (None, None), 1, (-math.pi/2, math.pi/2), False),
+    'exp': (math.exp, (-8.0, 8.0), (0, None), 1, (None, None), False),
+    'sqrt': (math.sqrt, (0.0, 100.0), (0, None), 1, (None, None), True),
+}
+
+# The derivative of the functions refinement points add a tangent for and
+# whether the function is convex (1) or concave (-1) where it is defined
+TANGENTS = {
+    'exp': (math.exp, 1),
+    'sqrt': (lambda a: 0.5 / math.sqrt(a), -1),
+}
+
+# The largest slope of the functions refinement points bound the result
+# of by the distance from the point
+SLOPES = {'sin': 1, 'cos': 1}
+
+# Relative widening of the slopes taken from floating point values
+SLOPE_TOLERANCE = 1e-6
+
+# Interval of the relaxation of a power with a variable base or exponent
+POWER_INTERVAL = (-10.0, 10.0)
+
+class MathModel:
+    def __init__(self, mode='exact', segments=DEFAULT_SEGMENTS, refinements=None, sampled=False, ctx=None):
+        assert mode in MATH_MODES
+        # The Z3 context of the result variables and constants
+        self.ctx = ctx
+        self.mode = mode
+        self.segments = __builtin__.max(1, segments)
+        # The refinement points of every application by result name, each
+        # a tuple of Fraction argument values
+        self.refinements = refinements or {}
+        self.sampled = sampled
+        # (result variable, Python function, arguments) of every relaxed
+        # application, an application only uses the results before it
+        self.applications = []
+        # (name of a result variable, the constraint defining it)
+        self.definitions = []
+        self.results = {}
+
+    def real(self, c):
+        return _real(c, self.ctx)
+
+    def exact(self, c):
+        return _exact(c, self.ctx)
+
+    def functions(self):
+        return {'sin':self.sin, 'cos':self.cos, 'tan':self.tan, 'exp':self.exp, 'pow':self.pow,
+                'sqrt':self.sqrt}
+
+    def sin(self, x):
+        return self.unary('sin', x)
+
+    def cos(self, x):
+        return self.unary('cos', x)
+
+    def tan(self, x):
+        return self.unary('tan', x)
+
+    def exp(self, x):
+        if self.mode == 'exact':
+            return exp(x)
+        return self.unary('exp', x)
+
+    def sqrt(self, x):
+        if self.mode == 'exact':
+            return sqrt(x)
+        return self.unary('sqrt', x)
+
+    def pow(self, x, y):
+        res = _fold(math.pow, x, y)
+        if res is not None:
+            return res
+        integer = _isNumeral(y) and _float(y) == int(_float(y))
+        # Polynomials are exact unless they are relaxed to linear pieces
+        if self.mode == 'exact' or integer and _float(y) >= 0 and self.mode == 'uf':
+            return x**y
+        if _isNumeral(y):
+            c = _float(y)
+            f = lambda a: math.pow(a, c)
+            if integer:
+                bounds = (0, None) if int(c) % 2 == 0 else (None, None)
+                monotone = 1 if int(c) % 2 == 1 and c > 0 else 0
+                return self.univariate(_label('pow', [x, y]), f, x, POWER_INTERVAL, bounds, monotone, (None, None), False)
+            return self.univariate(_label('pow', [x, y]), f, x, (0.0, 100.0), (0, None), 1 if c > 0 else -1,
+                                   (None, None), True)
+        if _isNumeral(x) and _float(x) > 0:
+            b = _float(x)
+            f = lambda a: math.pow(b, a)
+            monotone = 1 if b > 1 else -1 if b < 1 else 0
+            return self.univariate(_label('pow', [x, y]), f, y, POWER_INTERVAL, (0, None), monotone, (None, None), False)
+        text = _label('pow', [x, y])
+        if self.sampled and self.refinements.get(text):
+            return self.relaxed(text, math.pow, [x, y],
+                                lambda r: self.samples(math.pow, [x, y], r, self.refinements[text]))
+        return self.relaxed(text, math.pow, [x, y],
+                            lambda r: And([r == _uf('pow', x, y)] + self.refinedPoints(text, math.pow, [x, y], r)))
+
+    def unary(self, name, x):
+        f, interval, bounds, monotone, monotoneOn, nonnegative = UNARY[name]
+        res = _fold(f, x)
+        if res is not None:
+            return res
+        return self.univariate(_label(name, [x]), f, x, interval, bounds, monotone, monotoneOn, nonnegative, name)
+
+    # Returns the result variable named text of f applied to args, which
+    # define creates the defining constraint of on the first application
+    def relaxed(self, text, f, args, define):
+        if text not in self.results:
+            res = Real(text, self.ctx)
+            self.results[text] = res
+            self.applications.append((res, f, args))
+            self.definitions.append((text, define(res)))
+        return self.results[text]
+
+    """
+    Returns the result variable named text of the function f of x,
+    constrained by the range bounds of f, its value at 0 and, when
+    monotone, its order against the values of f at the segment points of
+    interval and the refinement points, for arguments in monotoneOn. In
+    'pwl' mode the piecewise relaxation over interval is added. The
+    argument of a nonnegative function is kept at 0 or above, C returns
+    NaN below. name is the function in TANGENTS or SLOPES, if any.
+    """
+    def univariate(self, text, f, x, interval, bounds, monotone, monotoneOn, nonnegative, name=None):
+        def define(r):
+            axioms = [x >= 0] if nonnegative else []
+            refined = [p for p, in self.refinements.get(text, [])]
+            if self.sampled:
+                points = [(p,) for p in sorted(set([0] + self.points(interval) + refined))]
+                return And(axioms + [self.samples(f, [x], r, points)])
+            if bounds[0] is not None:
+                axioms.append(r >= bounds[0])
+            if bounds[1] is not None:
+                axioms.append(r <= bounds[1])
+            zero = _fold(f, 0)
+            if zero is not None:
+                axioms.append(Implies(x == 0, r == self.real(zero)))
+            if monotone:
+                axioms += self.monotonicity(f, x, r, self.points(interval) + refined, monotone, monotoneOn)
+            if self.mode == 'pwl':
+                axioms.append(self.piecewise(f, x, r, interval))
+            axioms += self.refinedPoints(text, f, [x], r)
+            if name in TANGENTS:
+                derivative, convexity = TANGENTS[name]
+                axioms += self.tangents(f, derivative, convexity, x, r, refined)
+            if name in SLOPES:
+                axioms += self.slopeBounds(f, SLOPES[name], x, r, refined)
+            return And(axioms)
+        return self.relaxed(text, f, [x], define)
+
+    def points(self, interval):
+        lo, hi = interval
+        return [lo + (hi - lo) * i / self.segments for i in range(self.segments + 1)]
+
+    # Orders r against f at points: at or past a point the result is at
+    # least the value there for an increasing f, at most for a decreasing one
+    def monotonicity(self, f, x, r, points, monotone, monotoneOn):
+        inDomain = []
+        if monotoneOn[0] is not None:
+            inDomain.append(x > self.real(monotoneOn[0]))
+        if monotoneOn[1] is not None:
+            inDomain.append(x < self.real(monotoneOn[1]))
+        res = []
+        for p in points:
+            value = _fold(f, p)
+            if value is None:
+                continue
+            margin = TOLERANCE * (1 + __builtin__.abs(value))
+            low, high = r >= self.real(value - margin), r <= self.real(value + margin)
+            after, before = (low, high) if monotone > 0 else (high, low)
+            res.append(Implies(And(inDomain + [x >= self.exact(p)]), after))
+            res.append(Implies(And(inDomain + [x <= self.exact(p)]), before))
+        return res
+
+    # Fixes r to the floating point value of f at the refinement points of
+    # the application named text
+    def refinedPoints(self, text, f, args, r):
+        res = []
+        for point in self.refinements.get(text, []):
+            value = _fold(f, *point)
+            if value is not None:
+                res.append(Implies(And([a == self.exact(p) for a, p in zip(args, point)]), r == self.exact(value)))
+        return res
+
+    # Keeps args at one of points, with r the floating point value of f there
+    def samples(self, f, args, r, points):
+        cases = []
+        for point in points:
+            value = _fold(f, *point)
+            if value is not None:
+                cases.append(And([a == self.exact(p) for a, p in zip(args, point)] + [r == self.exact(value)]))
+        return Or(cases)
+
+    # Bounds r by the tangents of f at points, from below for a convex f
+    # and from above for a concave one. The slope is widened on each side
+    # of a point so the bound stays sound for rounded values.
+    def tangents(self, f, derivative, convexity, x, r, points):
+        res = []
+        for p in points:
+            value, slope = _fold(f, p), _fold(derivative, p)
+            if value is None or slope is None:
+                continue
+            margin = TOLERANCE * (1 + __builtin__.abs(value))
+            widened = SLOPE_TOLERANCE * (1 + __builtin__.abs(slope))
+            # Past the point a convex f stays above the flatter line, before
+            # it above the steeper one, and the other way round when concave
+            after, before = (slope - widened, slope + widened) if convexity > 0 else (slope + widened, slope - widened)
+            for side, s in [(x >= self.exact(p), after), (x <= self.exact(p), before)]:
+                if convexity > 0:
+                    res.append(Implies(side, r >= self.real(value - margin) + self.real(s) * (x - self.exact(p))))
+                else:
+                    res.append(Implies(side, r <= self.real(value + margin) + self.real(s) * (x - self.exact(p))))
+        return res
+
+    # Keeps r within slope times the distance of x from each of points of
+    # the value of f there
+    def slopeBounds(self, f, slope, x, r, points):
+        res = []
+        for p in points:
+            value = _fold(f, p)
+            if value is None:
+                continue
+            margin = TOLERANCE * (1 + __builtin__.abs(value))
+            point = self.exact(p)
+            distance = If(x >= point, x - point, point - x) * self.real(slope * (1 + SLOPE_TOLERANCE))
+            res.append(r <= self.real(value + margin) + distance)
+            res.append(r >= self.real(value - margin) - distance)
+        return res
+
+    # Keeps r within the chord of f on the segment of interval x lies in,
+    # widened by the largest distances of f above and below the chord
+    def piecewise(self, f, x, r, interval):
+        cases = [x < self.real(interval[0]), x > self.real(interval[1])]
+        points = self.points(interval)
+        for a, b in zip(points, points[1:]):
+            fa, fb = _fold(f, a), _fold(f, b)
+            samples = [_fold(f, a + (b - a) * k / SAMPLES) for k in range(SAMPLES + 1)]
+            if fa is None or fb is None or None in samples:
+                cases.append(And(x >= self.real(a), x <= self.real(b)))
+                continue
+            slope = (fb - fa) / (b - a)
+            distances = [s - fa - slope * (b - a) * k / SAMPLES for k, s in enumerate(samples)]
+            # Between two samples the distance changes by at most half of
+            # the larger step next to them
+            margin = __builtin__.max(__builtin__.abs(d - e) for d, e in zip(distances, distances[1:]))
+            margin += TOLERANCE * (1 + __builtin__.abs(fa) + __builtin__.abs(fb))
+            line = self.real(slope) * x + self.real(fa - slope * a)
+            cases.append(And(x >= self.real(a), x <= self.real(b),
+                             r >= line - self.real(margin - __builtin__.min(distances)),
+                             r <= line + self.real(margin + __builtin__.max(distances))))
+        return Or(cases)
 
-def min(x,y):
-    return If(x < y, x, y)
+    # Returns the Fraction argument values of the applications among names
+    # under values by result name, and (result variable, value) pairs of
+    # those floating point math computes
+    def arguments(self, values, names):
+        points = {}
+        results = []
+        for res, f, args in self.applications:
+            if res.decl().name() not in names:
+                continue
+            try:
+                concrete = tuple(_fraction(simplify(substitute(a, values + results)) if is_expr(a) else a) for a in args)
+            except TypeError:
+                continue
+            points[res.decl().name()] = concrete
+            try:
+                value = f(*concrete)
+            except (ValueError, OverflowError, ZeroDivisionError):
+                continue
+            if not (math.isnan(value) or math.isinf(value)):
+                results.append((res, self.exact(value)))
+        return points, results
 
-def max(x,y):
-    return If(x >= y, x, y)
+    """
+    Evaluates expr under values, a list of (variable, Z3 value) pairs, with
+    the result variables among names computed from their arguments with
+    floating point math. Returns True, False or None when an application
+    is undefined for its arguments or the outcome stays open.
+    """
+    def evaluate(self, expr, values, names):
+        _, results = self.arguments(values, names)
+        value = simplify(substitute(expr, values + results))
+        if is_true(value):
+            return True
+        if is_false(value):
+            return False
+        return None